@@ -0,0 +1,98 @@
+import random
+from datetime import date, timedelta
+from decimal import Decimal
+
+from django.contrib.auth import get_user_model
+from django.contrib.auth.hashers import make_password
+from django.db import transaction
+
+from books.models import Book, DeletedBook
+from borrowings.models import Borrowing, Notification, Payment
+
+READER_DOMAIN = "load-benchmark.library.com"
+BOOK_TITLE_PREFIX = "Load benchmark book"
+PASSWORD = "benchmark-password"
+DAILY_FEES = (Decimal("0.25"), Decimal("0.50"), Decimal("1.00"), Decimal("1.50"))
+
+
+def generate(
+    books: int, readers: int, history: int, seed: int = 0
+) -> tuple[list[str], list[int]]:
+    """
+    Creates a catalog and readers with returned and paid borrowings
+    in their history. Every reader logs in with PASSWORD.
+    Returns emails of the readers and ids of the books.
+    """
+    rng = random.Random(seed)
+    # Hashing is slow on purpose, all the readers share one hash
+    password = make_password(PASSWORD)
+
+    with transaction.atomic():
+        users = get_user_model().objects.bulk_create(
+            get_user_model()(email=f"reader{number}@{READER_DOMAIN}", password=password)
+            for number in range(readers)
+        )
+        catalog = Book.objects.bulk_create(
+            (
+                Book(
+                    title=f"{BOOK_TITLE_PREFIX} {number}",
+                    author=f"Benchmark author {number % 100}",
+                    cover=rng.choice(Book.Cover.values),
+                    inventory=rng.randint(0, 50),
+                    daily_fee=rng.choice(DAILY_FEES),
+                )
+                for number in range(books)
+            ),
+            batch_size=5000,
+        )
+
+        borrowings = []
+        for user in users:
+            for _ in range(history):
+                borrow_date = date.today() - timedelta(days=rng.randint(30, 365))
+                expected_return_date = borrow_date + timedelta(days=rng.randint(1, 14))
+                borrowings.append(
+                    Borrowing(
+                        borrow_date=borrow_date,
+                        expected_return_date=expected_return_date,
+                        actual_return_date=expected_return_date
+                        + timedelta(days=rng.choice((0, 0, 0, 2))),
+                        book=rng.choice(catalog),
+                        user=user,
+                    )
+                )
+        borrowings = Borrowing.objects.bulk_create(borrowings, batch_size=5000)
+        Payment.objects.bulk_create(
+            (
+                Payment(
+                    status=Payment.Status.PAID,
+                    type=Payment.Type.PAYMENT,
+                    borrowing=borrowing,
+                    to_pay=borrowing.book.daily_fee
+                    * (borrowing.expected_return_date - borrowing.borrow_date).days,
+                )
+                for borrowing in borrowings
+            ),
+            batch_size=5000,
+        )
+
+    return [user.email for user in users], [book.id for book in catalog]
+
+
+def remove() -> None:
+    """
+    Deletes readers and books created by generate() with all their data,
+    including tombstones of the deleted books and admin notifications
+    about the readers.
+    """
+    users = get_user_model().objects.filter(email__endswith=f"@{READER_DOMAIN}")
+    books = Book.objects.filter(title__startswith=BOOK_TITLE_PREFIX)
+    with transaction.atomic():
+        book_ids = list(books.values_list("id", flat=True))
+        borrowings = Borrowing.objects.filter(user__in=users)
+        Payment.objects.filter(borrowing__in=borrowings).delete()
+        borrowings.delete()
+        users.delete()
+        books.delete()
+        DeletedBook.objects.filter(book_id__in=book_ids).delete()
+        Notification.objects.filter(message__contains=f"@{READER_DOMAIN}").delete()
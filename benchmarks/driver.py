@@ -0,0 +1,212 @@
+import math
+import random
+import threading
+import time
+from collections import Counter, defaultdict
+from datetime import date, timedelta
+
+from django.db import connection
+from django.urls import reverse
+from rest_framework import status
+from rest_framework.test import APIClient
+
+from benchmarks.data import PASSWORD
+from benchmarks.fakes import FakeStripe
+
+# Scenario -> weight, roughly what readers do with the library
+SCENARIOS = {
+    "browse": 50,
+    "my_borrowings": 15,
+    "borrow": 15,
+    "return": 10,
+    "pay": 10,
+}
+PERCENTILES = (50, 95, 99)
+
+
+def percentile(values: list[float], rank: int) -> float:
+    """Nearest-rank percentile of sorted values"""
+    return values[max(math.ceil(rank / 100 * len(values)) - 1, 0)]
+
+
+class LoadDriver:
+    """
+    Drives the API in-process with virtual readers, one thread each.
+    Every reader logs in through TokenObtainPairView and then runs
+    a random mix of SCENARIOS, latency of every request is recorded
+    per route.
+    """
+
+    def __init__(
+        self,
+        emails: list[str],
+        book_ids: list[int],
+        stripe: FakeStripe,
+        host: str = "localhost",
+        seed: int = 0,
+    ):
+        self.emails = emails
+        self.book_ids = book_ids
+        self.stripe = stripe
+        self.host = host
+        self.seed = seed
+        self.latencies = defaultdict(list)
+        self.statuses = defaultdict(Counter)
+        self.elapsed = 0.0
+        self._lock = threading.Lock()
+
+    def run(self, readers: int, requests_per_reader: int) -> dict:
+        threads = [
+            threading.Thread(
+                target=self._reader,
+                args=(self.emails[number % len(self.emails)], requests_per_reader),
+                kwargs={"seed": self.seed + number},
+            )
+            for number in range(readers)
+        ]
+        start = time.perf_counter()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.elapsed = time.perf_counter() - start
+        return self.report()
+
+    def report(self) -> dict:
+        """Latency percentiles in ms, requests per second and statuses per route"""
+        report = {}
+        for route, latencies in sorted(self.latencies.items()):
+            latencies = sorted(latencies)
+            report[route] = {
+                "requests": len(latencies),
+                "rps": round(len(latencies) / self.elapsed, 1),
+                **{
+                    f"p{rank}": round(percentile(latencies, rank) * 1000, 1)
+                    for rank in PERCENTILES
+                },
+                "statuses": dict(sorted(self.statuses[route].items())),
+            }
+        return report
+
+    def _reader(self, email: str, requests_per_reader: int, seed: int) -> None:
+        rng = random.Random(seed)
+        client = APIClient(HTTP_HOST=self.host)
+        active_borrowings = []
+        try:
+            self._log_in(client, email)
+            scenarios = rng.choices(
+                list(SCENARIOS), weights=SCENARIOS.values(), k=requests_per_reader
+            )
+            for scenario in scenarios:
+                getattr(self, f"_{scenario}")(client, rng, active_borrowings)
+        finally:
+            connection.close()
+
+    def _request(self, client, method: str, route: str, url: str, **kwargs):
+        start = time.perf_counter()
+        response = getattr(client, method)(url, **kwargs)
+        elapsed = time.perf_counter() - start
+
+        name = f"{method.upper()} {route}"
+        with self._lock:
+            self.latencies[name].append(elapsed)
+            self.statuses[name][response.status_code] += 1
+        return response
+
+    def _log_in(self, client, email: str) -> None:
+        response = self._request(
+            client,
+            "post",
+            "users:token_obtain_pair",
+            reverse("users:token_obtain_pair"),
+            data={"email": email, "password": PASSWORD},
+            format="json",
+        )
+        client.credentials(HTTP_AUTHORIZATION=f"Bearer {response.data['access']}")
+
+    def _browse(self, client, rng, active_borrowings) -> None:
+        filters = rng.choice(({}, {"available": "true"}, {"cover": "HARD"}))
+        self._request(
+            client, "get", "books:book-list", reverse("books:book-list"), data=filters
+        )
+        book_id = rng.choice(self.book_ids)
+        self._request(
+            client,
+            "get",
+            "books:book-detail",
+            reverse("books:book-detail", args=[book_id]),
+        )
+
+    def _my_borrowings(self, client, rng, active_borrowings) -> None:
+        self._request(
+            client,
+            "get",
+            "borrowings:borrowing-list",
+            reverse("borrowings:borrowing-list"),
+            data={"is_active": "true"},
+        )
+        self._request(
+            client,
+            "get",
+            "borrowings:payment-list",
+            reverse("borrowings:payment-list"),
+        )
+
+    def _borrow(self, client, rng, active_borrowings) -> None:
+        response = self._request(
+            client,
+            "post",
+            "borrowings:borrowing-list",
+            reverse("borrowings:borrowing-list"),
+            data={
+                "borrow_date": date.today(),
+                "expected_return_date": date.today()
+                + timedelta(days=rng.randint(1, 14)),
+                "book": rng.choice(self.book_ids),
+            },
+            format="json",
+        )
+        if response.status_code == status.HTTP_201_CREATED:
+            active_borrowings.append(response.data["id"])
+
+    def _return(self, client, rng, active_borrowings) -> None:
+        if not active_borrowings:
+            return
+
+        borrowing_id = active_borrowings.pop(rng.randrange(len(active_borrowings)))
+        self._request(
+            client,
+            "post",
+            "borrowings:borrowing-return-book",
+            reverse("borrowings:borrowing-return-book", args=[borrowing_id]),
+            data={"actual_return_date": date.today()},
+            format="json",
+        )
+
+    def _pay(self, client, rng, active_borrowings) -> None:
+        """Pays the first pending payment with a session, like Stripe would"""
+        response = self._request(
+            client,
+            "get",
+            "borrowings:payment-list",
+            reverse("borrowings:payment-list"),
+            data={"status": "PENDING", "omit": "borrowing"},
+        )
+        session_ids = [
+            payment["session_id"]
+            for payment in response.data["results"]
+            if payment["session_id"]
+        ]
+        if not session_ids:
+            return
+
+        payload, signature = self.stripe.paid_event(session_ids[0])
+        self._request(
+            client,
+            "post",
+            "borrowings:stripe-webhook",
+            reverse("borrowings:stripe-webhook"),
+            data=payload,
+            content_type="application/json",
+            HTTP_STRIPE_SIGNATURE=signature,
+        )
@@ -0,0 +1,136 @@
+import queue
+import threading
+import time
+import uuid
+from contextlib import ExitStack, contextmanager
+from typing import Iterator
+from unittest.mock import patch
+
+import requests
+from django.db import connection
+
+from borrowings.tasks import create_checkout_session, deliver_notifications
+from borrowings.fake_stripe import checkout_session_event, sign
+
+STRIPE_SESSION_LIFETIME = 24 * 60 * 60
+
+
+class FakeStripe:
+    """
+    Stand-in for the Stripe checkout API, answers after the given latency.
+    Also signs the webhook events Stripe sends when a session is paid.
+    """
+
+    webhook_secret = "whsec_load_benchmark"
+
+    def __init__(self, latency: float = 0.0):
+        self.latency = latency
+        self.sessions = 0
+        self._lock = threading.Lock()
+
+    def create_session(self, **kwargs) -> dict:
+        time.sleep(self.latency)
+        with self._lock:
+            self.sessions += 1
+        session_id = f"cs_benchmark_{uuid.uuid4().hex}"
+        return {
+            "id": session_id,
+            "url": f"https://checkout.stripe.com/pay/{session_id}",
+            "expires_at": int(time.time()) + STRIPE_SESSION_LIFETIME,
+        }
+
+    def paid_event(self, session_id: str) -> tuple[bytes, str]:
+        """Returns the payload and Stripe-Signature of a paid session event"""
+        payload = checkout_session_event("checkout.session.completed", session_id)
+        return payload, sign(payload, self.webhook_secret)
+
+
+class FakeTelegram:
+    """Stand-in for the Telegram Bot API, answers after the given latency"""
+
+    def __init__(self, latency: float = 0.0):
+        self.latency = latency
+        self.messages = 0
+        self._lock = threading.Lock()
+
+    def post(self, url: str, data: dict, timeout) -> requests.Response:
+        time.sleep(self.latency)
+        with self._lock:
+            self.messages += 1
+        response = requests.Response()
+        response.status_code = 200
+        return response
+
+
+class FakeWorker:
+    """
+    Runs Celery tasks the API queues in a background thread,
+    the way a single worker would, so they stay off the request path.
+    """
+
+    def __init__(self):
+        self.done = 0
+        self.failed = 0
+        self._queue = queue.Queue()
+        self._thread = threading.Thread(target=self._work, daemon=True)
+
+    def enqueue(self, task):
+        def delay(*args, **kwargs):
+            self._queue.put((task, args, kwargs))
+
+        return delay
+
+    def start(self) -> None:
+        self._thread.start()
+
+    def stop(self) -> None:
+        """Waits for the queued tasks to finish"""
+        self._queue.put(None)
+        self._thread.join()
+
+    def _work(self) -> None:
+        try:
+            while True:
+                item = self._queue.get()
+                if item is None:
+                    return
+                task, args, kwargs = item
+                try:
+                    task(*args, **kwargs)
+                except Exception:
+                    self.failed += 1
+                else:
+                    self.done += 1
+        finally:
+            connection.close()
+
+
+@contextmanager
+def fake_services(
+    stripe: FakeStripe, telegram: FakeTelegram, worker: FakeWorker
+) -> Iterator[None]:
+    """Points Stripe, Telegram and Celery calls of the API to the fakes"""
+    with ExitStack() as stack:
+        for target, value in (
+            ("borrowings.serializers.STRIPE_PUBLIC_KEY", "pk_load_benchmark"),
+            ("borrowings.views.STRIPE_WEBHOOK_SECRET", stripe.webhook_secret),
+            ("borrowings.messenger.CHAT_ID", "load_benchmark"),
+            ("borrowings.messenger.TELEGRAM_SEND_INTERVAL", 0),
+        ):
+            stack.enter_context(patch(target, value))
+        stack.enter_context(
+            patch("stripe.checkout.Session.create", side_effect=stripe.create_session)
+        )
+        stack.enter_context(
+            patch(
+                "borrowings.messenger.telegram_session.post", side_effect=telegram.post
+            )
+        )
+        for task in (create_checkout_session, deliver_notifications):
+            stack.enter_context(patch.object(task, "delay", worker.enqueue(task)))
+
+        worker.start()
+        try:
+            yield
+        finally:
+            worker.stop()
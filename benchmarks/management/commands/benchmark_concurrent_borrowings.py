@@ -0,0 +1,114 @@
+import threading
+import time
+from datetime import date, timedelta
+from decimal import Decimal
+from unittest.mock import patch
+
+from django.contrib.auth import get_user_model
+from django.core.management import BaseCommand
+from django.db import connection, transaction
+from rest_framework import status
+from rest_framework.test import APIRequestFactory, force_authenticate
+
+from books.models import Book, DeletedBook
+from borrowings.models import Borrowing, Payment
+from borrowings.views import BorrowingViewSet
+
+
+class Command(BaseCommand):
+    """
+    Django command to fire parallel borrowings at one hot book and report
+    throughput and oversell. Stripe and Telegram calls are stubbed,
+    so only the database work is measured. Concurrent requests need
+    committed rows, so they are written to the benchmark database and
+    deleted afterwards. Runs with library_service_api.benchmark_settings only.
+    """
+
+    help = "Benchmarks concurrent borrowings of the same book."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--borrowings", type=int, default=50)
+        parser.add_argument("--inventory", type=int, default=10)
+
+    def handle(self, *args, **options):
+        book = Book.objects.create(
+            title=f"Benchmark hot book {time.time_ns()}",
+            author="Benchmark author",
+            cover=Book.Cover.HARD,
+            inventory=options["inventory"],
+            daily_fee=Decimal("0.50"),
+        )
+        users = [
+            get_user_model().objects.create_user(
+                f"benchmark_{book.id}_{number}@library.com", "password"
+            )
+            for number in range(options["borrowings"])
+        ]
+
+        try:
+            statuses, elapsed = self._borrow_concurrently(book, users)
+            book_inventory = Book.objects.get(pk=book.pk).inventory
+            borrowed = Borrowing.objects.filter(book=book).count()
+        finally:
+            self._remove(book, users)
+
+        created = statuses.count(status.HTTP_201_CREATED)
+        self.stdout.write(
+            f"{len(users)} borrowings in {elapsed:.2f} s "
+            f"({len(users) / elapsed:.1f} requests/s): "
+            f"{created} created, {len(users) - created} rejected."
+        )
+        oversell = max(borrowed - options["inventory"], 0)
+        style = self.style.SUCCESS if not oversell else self.style.ERROR
+        self.stdout.write(
+            style(
+                f"Inventory {options['inventory']} -> {book_inventory}, "
+                f"{borrowed} borrowings stored, oversell: {oversell}."
+            )
+        )
+
+    @staticmethod
+    def _remove(book, users):
+        """Deletes the benchmark rows, the book leaves no tombstone behind"""
+        with transaction.atomic():
+            borrowings = Borrowing.objects.filter(book=book)
+            Payment.objects.filter(borrowing__in=borrowings).delete()
+            borrowings.delete()
+            get_user_model().objects.filter(pk__in=[user.pk for user in users]).delete()
+            book_id = book.pk
+            book.delete()
+            DeletedBook.objects.filter(book_id=book_id).delete()
+
+    @staticmethod
+    def _borrow_concurrently(book, users):
+        factory = APIRequestFactory(HTTP_HOST="localhost")
+        view = BorrowingViewSet.as_view({"post": "create"})
+        barrier = threading.Barrier(len(users))
+        statuses = []
+        payload = {
+            "borrow_date": date.today(),
+            "expected_return_date": date.today() + timedelta(days=7),
+            "book": book.id,
+        }
+
+        def borrow(user):
+            request = factory.post("/api/borrowings/borrowings/", payload)
+            force_authenticate(request, user)
+            barrier.wait()
+            try:
+                statuses.append(view(request).status_code)
+            finally:
+                connection.close()
+
+        threads = [threading.Thread(target=borrow, args=(user,)) for user in users]
+        with patch("borrowings.serializers.STRIPE_PUBLIC_KEY", None), patch(
+            "borrowings.serializers.send_borrowing_create_message"
+        ):
+            start = time.perf_counter()
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+            elapsed = time.perf_counter() - start
+
+        return statuses, elapsed
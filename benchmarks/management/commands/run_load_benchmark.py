@@ -0,0 +1,85 @@
+import json
+
+from django.core.management import BaseCommand
+
+from benchmarks import data
+from benchmarks.driver import PERCENTILES, LoadDriver
+from benchmarks.fakes import FakeStripe, FakeTelegram, FakeWorker, fake_services
+
+
+class Command(BaseCommand):
+    """
+    Django command to load the whole API with virtual readers
+    browsing books, borrowing, returning and paying. Stripe, Telegram
+    and Celery are replaced with in-process fakes. Generated data is
+    committed to the benchmark database and deleted when the command
+    finishes. Runs with library_service_api.benchmark_settings only.
+    """
+
+    help = "Benchmarks the API with a realistic mix of requests."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--books", type=int, default=1000)
+        parser.add_argument("--readers", type=int, default=100)
+        parser.add_argument("--history", type=int, default=20)
+        parser.add_argument("--concurrency", type=int, default=10)
+        parser.add_argument("--requests", type=int, default=50)
+        parser.add_argument("--stripe-latency", type=float, default=0.2)
+        parser.add_argument("--telegram-latency", type=float, default=0.1)
+        parser.add_argument("--seed", type=int, default=0)
+        parser.add_argument("--output", help="Also write the report as JSON.")
+        parser.add_argument(
+            "--keep-data", action="store_true", help="Don't delete generated data."
+        )
+
+    def handle(self, *args, **options):
+        self.stdout.write(
+            f"Generating {options['books']} books and {options['readers']} readers "
+            f"with {options['history']} borrowings each..."
+        )
+        data.remove()
+        emails, book_ids = data.generate(
+            options["books"], options["readers"], options["history"], options["seed"]
+        )
+
+        stripe = FakeStripe(options["stripe_latency"])
+        telegram = FakeTelegram(options["telegram_latency"])
+        worker = FakeWorker()
+        driver = LoadDriver(emails, book_ids, stripe, seed=options["seed"])
+        try:
+            with fake_services(stripe, telegram, worker):
+                report = driver.run(options["concurrency"], options["requests"])
+        finally:
+            if not options["keep_data"]:
+                data.remove()
+
+        self._print(report, driver.elapsed)
+        self.stdout.write(
+            f"Background: {worker.done} tasks done, {worker.failed} failed, "
+            f"{stripe.sessions} Stripe sessions, {telegram.messages} Telegram messages"
+        )
+        if options["output"]:
+            with open(options["output"], "w") as file:
+                json.dump(report, file, indent=2)
+
+    def _print(self, report, elapsed):
+        columns = "".join(f"{f'p{rank} ms':>10}" for rank in PERCENTILES)
+        self.stdout.write(
+            f"{'endpoint':<42}{'requests':>9}{'rps':>8}{columns}  statuses"
+        )
+        for route, row in report.items():
+            percentiles = "".join(f"{row[f'p{rank}']:>10.1f}" for rank in PERCENTILES)
+            statuses = ", ".join(
+                f"{code}: {count}" for code, count in row["statuses"].items()
+            )
+            self.stdout.write(
+                f"{route:<42}{row['requests']:>9}{row['rps']:>8.1f}{percentiles}"
+                f"  {statuses}"
+            )
+
+        total = sum(row["requests"] for row in report.values())
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"{total} requests in {elapsed:.2f} s ({total / elapsed:.1f} requests/s)"
+            )
+        )
@@ -0,0 +1,63 @@
+from unittest import skipUnless
+
+from django.contrib.auth import get_user_model
+from django.db import connection
+from django.test import SimpleTestCase, TransactionTestCase, override_settings
+
+from benchmarks import data
+from benchmarks.driver import LoadDriver, percentile
+from benchmarks.fakes import FakeStripe, FakeTelegram, FakeWorker, fake_services
+from books.models import Book, DeletedBook
+from borrowings.models import Borrowing, Notification
+
+
+class PercentileTests(SimpleTestCase):
+    def test_percentile_is_nearest_rank(self):
+        values = list(range(1, 101))
+
+        self.assertEqual(percentile(values, 50), 50)
+        self.assertEqual(percentile(values, 95), 95)
+        self.assertEqual(percentile(values, 99), 99)
+        self.assertEqual(percentile([7], 99), 7)
+
+
+@override_settings(ALLOWED_HOSTS=["localhost"])
+class LoadBenchmarkTests(TransactionTestCase):
+    def test_generate_and_remove_data(self):
+        emails, book_ids = data.generate(books=5, readers=3, history=2)
+
+        self.assertEqual(len(emails), 3)
+        self.assertEqual(len(book_ids), 5)
+        self.assertEqual(Borrowing.objects.filter(user__email__in=emails).count(), 6)
+
+        Notification.objects.create(message=f"User {emails[0]} borrowed a book.")
+        Notification.objects.create(message="User reader@library.com borrowed a book.")
+
+        data.remove()
+
+        self.assertFalse(get_user_model().objects.filter(email__in=emails).exists())
+        self.assertFalse(Book.objects.filter(id__in=book_ids).exists())
+        self.assertFalse(DeletedBook.objects.filter(book_id__in=book_ids).exists())
+        self.assertEqual(
+            list(Notification.objects.values_list("message", flat=True)),
+            ["User reader@library.com borrowed a book."],
+        )
+
+    # Threads writing at once lock the whole in-memory SQLite test database
+    @skipUnless(connection.vendor == "postgresql", "Concurrent writes need PostgreSQL")
+    def test_driver_reports_every_requested_route(self):
+        emails, book_ids = data.generate(books=10, readers=2, history=1)
+        stripe, worker = FakeStripe(), FakeWorker()
+        driver = LoadDriver(emails, book_ids, stripe)
+
+        with fake_services(stripe, FakeTelegram(), worker):
+            report = driver.run(readers=2, requests_per_reader=20)
+
+        self.assertEqual(report["POST users:token_obtain_pair"]["statuses"], {200: 2})
+        self.assertIn("GET books:book-list", report)
+        for route, row in report.items():
+            with self.subTest(route=route):
+                self.assertLessEqual(row["p50"], row["p95"])
+                self.assertLessEqual(row["p95"], row["p99"])
+                self.assertTrue(all(code < 500 for code in row["statuses"]))
+        self.assertEqual(worker.failed, 0)
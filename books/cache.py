@@ -0,0 +1,91 @@
+import hashlib
+import time
+from typing import Any, Callable, Iterable, Optional
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+
+CATALOG_VERSION_KEY = "books:catalog-version"
+HITS_KEY = "books:cache:hits"
+MISSES_KEY = "books:cache:misses"
+
+
+def _incr(key: str) -> int:
+    """Increments a counter that never expires, creating it when needed"""
+    try:
+        return cache.incr(key)
+    except ValueError:
+        if cache.add(key, 1, timeout=None):
+            return 1
+        return cache.incr(key)
+
+
+def get_catalog_version() -> Optional[int]:
+    """
+    Returns the version of the catalog that changes on every book write.
+    A lost version is recreated from the clock, so it never goes back
+    to a value that was already handed out.
+    Returns None when the book cache is disabled, a version kept
+    in one process would miss writes served by the others.
+    """
+    if not settings.BOOK_CACHE_ENABLED:
+        return None
+
+    version = cache.get(CATALOG_VERSION_KEY)
+    if version is None:
+        cache.add(CATALOG_VERSION_KEY, time.time_ns(), timeout=None)
+        version = cache.get(CATALOG_VERSION_KEY)
+    return version
+
+
+def book_list_key(version: Optional[int], url: str) -> str:
+    return f"books:list:{version}:{hashlib.md5(url.encode()).hexdigest()}"
+
+
+def book_detail_key(book_id: int) -> str:
+    return f"books:detail:{book_id}"
+
+
+def cached_payload(key: str, build: Callable[[], Any]) -> Any:
+    """
+    Returns cached serialized payload or builds and caches it.
+    Always builds the payload when the book cache is disabled.
+    """
+    if not settings.BOOK_CACHE_ENABLED:
+        return build()
+
+    payload = cache.get(key)
+    if payload is None:
+        _incr(MISSES_KEY)
+        payload = build()
+        cache.set(key, payload, settings.BOOK_CACHE_TIMEOUT)
+    else:
+        _incr(HITS_KEY)
+    return payload
+
+
+def cache_stats() -> dict:
+    return {
+        "hits": cache.get(HITS_KEY, 0),
+        "misses": cache.get(MISSES_KEY, 0),
+    }
+
+
+def _invalidate(book_ids: Iterable[int]) -> None:
+    cache.delete_many([book_detail_key(book_id) for book_id in book_ids])
+    try:
+        cache.incr(CATALOG_VERSION_KEY)
+    except ValueError:
+        get_catalog_version()
+
+
+def invalidate_books(book_ids: Iterable[int]) -> None:
+    """
+    Drops cached details of the given books and every cached list.
+    Invalidation is repeated after commit, so a read that raced
+    the transaction cannot leave stale data in the cache.
+    """
+    book_ids = list(book_ids)
+    _invalidate(book_ids)
+    transaction.on_commit(lambda: _invalidate(book_ids))
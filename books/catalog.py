@@ -0,0 +1,145 @@
+import csv
+import json
+from typing import Iterable, Iterator, Optional
+
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import transaction
+
+from books.cache import invalidate_books
+from books.models import Book
+from books.serializers import BookImportSerializer
+
+CATALOG_FIELDS = ("title", "author", "cover", "inventory", "daily_fee")
+EXPORT_FIELDS = ("id", *CATALOG_FIELDS)
+CSV = "csv"
+JSON_LINES = "jsonl"
+CONTENT_TYPE_FORMATS = {
+    "text/csv": CSV,
+    "application/jsonl": JSON_LINES,
+    "application/x-ndjson": JSON_LINES,
+    "application/json-lines": JSON_LINES,
+}
+FORMAT_CONTENT_TYPES = {CSV: "text/csv", JSON_LINES: "application/jsonl"}
+
+
+class _LineBuffer:
+    """File-like object that gives back what csv writer writes into it"""
+
+    def write(self, value: str) -> str:
+        return value
+
+
+def read_rows(
+    lines: Iterable[bytes], file_format: str
+) -> Iterator[tuple[int, Optional[dict], Optional[str]]]:
+    """
+    Lazily parses catalog lines in CSV (with a header) or JSON Lines format.
+    Yields row number, parsed row and parsing error for every row.
+    """
+    decoded = (
+        line.decode("utf-8-sig") if isinstance(line, bytes) else line for line in lines
+    )
+
+    if file_format == CSV:
+        for row_number, row in enumerate(csv.DictReader(decoded), start=1):
+            yield row_number, row, None
+        return
+
+    for row_number, line in enumerate(decoded, start=1):
+        if not line.strip():
+            continue
+        try:
+            yield row_number, json.loads(line), None
+        except ValueError:
+            yield row_number, None, "Invalid JSON."
+
+
+def _json_line(row: tuple) -> str:
+    return json.dumps(dict(zip(EXPORT_FIELDS, row)), cls=DjangoJSONEncoder) + "\n"
+
+
+def export_lines(file_format: str, chunk_size: int = 2000) -> Iterator[str]:
+    """
+    Lazily renders the whole catalog in CSV (with a header) or JSON Lines format.
+    Rows are read with a server-side cursor and yielded chunk by chunk,
+    so memory use does not depend on the catalog size.
+    """
+    rows = (
+        Book.objects.order_by("id")
+        .values_list(*EXPORT_FIELDS)
+        .iterator(chunk_size=chunk_size)
+    )
+
+    if file_format == CSV:
+        writer = csv.writer(_LineBuffer())
+        yield writer.writerow(EXPORT_FIELDS)
+        render = writer.writerow
+    else:
+        render = _json_line
+
+    lines = []
+    for row in rows:
+        lines.append(render(row))
+        if len(lines) >= chunk_size:
+            yield "".join(lines)
+            lines = []
+    if lines:
+        yield "".join(lines)
+
+
+class BookImporter:
+    """
+    Validates catalog rows with the book serializer rules and upserts them
+    by title in chunks, so only one chunk is kept in memory at a time.
+    """
+
+    max_reported_errors = 1000
+
+    def __init__(self, chunk_size: int = 1000):
+        self.chunk_size = chunk_size
+        self.imported = 0
+        self.failed = 0
+        self.errors = []
+
+    def run(self, rows: Iterable[tuple[int, Optional[dict], Optional[str]]]) -> dict:
+        chunk = {}
+        for row_number, row, error in rows:
+            if error:
+                self._report(row_number, {"non_field_errors": [error]})
+                continue
+
+            serializer = BookImportSerializer(data=row)
+            if not serializer.is_valid():
+                self._report(row_number, serializer.errors)
+                continue
+
+            # The same title twice in one statement is rejected by
+            # ON CONFLICT DO UPDATE, the latest row wins instead
+            book = Book(**serializer.validated_data)
+            chunk[book.title] = book
+            if len(chunk) >= self.chunk_size:
+                self._write(chunk)
+                chunk = {}
+
+        if chunk:
+            self._write(chunk)
+
+        return {"imported": self.imported, "failed": self.failed, "errors": self.errors}
+
+    def _report(self, row_number: int, errors: dict) -> None:
+        self.failed += 1
+        if len(self.errors) < self.max_reported_errors:
+            self.errors.append({"row": row_number, "errors": errors})
+
+    def _write(self, chunk: dict) -> None:
+        with transaction.atomic():
+            Book.objects.bulk_create(
+                chunk.values(),
+                update_conflicts=True,
+                unique_fields=["title"],
+                update_fields=[*CATALOG_FIELDS[1:], "updated_at"],
+            )
+            invalidate_books(
+                Book.objects.filter(title__in=chunk).values_list("id", flat=True)
+            )
+        self.imported += len(chunk)
@@ -0,0 +1,83 @@
+from django.db import connection
+from django.db.models import F
+from django.utils import timezone
+
+from books.cache import invalidate_books
+from books.models import Book
+
+
+def adjust_inventory(changes: list[dict]) -> dict[int, int]:
+    """
+    Applies inventory changes of many books in one set-based UPDATE.
+    Every change has a book "id" and either a relative "delta"
+    or an absolute "inventory". Returns new inventory by book id,
+    books that don't exist are missing from the result.
+    The database check constraint rejects the whole statement
+    if any inventory would drop below zero.
+    """
+    if not changes:
+        return {}
+
+    rows = ", ".join(["(%s, %s, %s)"] * len(changes))
+    params = []
+    for change in changes:
+        is_delta = "delta" in change
+        params += [
+            change["id"],
+            change["delta"] if is_delta else change["inventory"],
+            is_delta,
+        ]
+
+    table = connection.ops.quote_name(Book._meta.db_table)
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f"""
+            WITH change (id, value, is_delta) AS (VALUES {rows})
+            UPDATE {table}
+            SET
+                inventory = CASE
+                    WHEN change.is_delta THEN {table}.inventory + change.value
+                    ELSE change.value
+                END,
+                updated_at = %s
+            FROM change
+            WHERE {table}.id = change.id
+            RETURNING {table}.id, {table}.inventory
+            """,
+            [*params, timezone.now()],
+        )
+        inventory = dict(cursor.fetchall())
+
+    invalidate_books(inventory)
+    return inventory
+
+
+def take_copy(book_id: int) -> bool:
+    """
+    Takes one copy of the book in a single conditional UPDATE,
+    so concurrent checkouts can neither lose updates nor oversell.
+    Returns False if no copies are left.
+    """
+    return take_copies([book_id])
+
+
+def take_copies(book_ids: list[int]) -> bool:
+    """
+    Takes one copy of every book in a single conditional UPDATE.
+    Returns False if any of the books has no copies left,
+    the caller has to roll back the transaction then.
+    """
+    taken = Book.objects.filter(pk__in=book_ids, inventory__gt=0).update(
+        inventory=F("inventory") - 1, updated_at=timezone.now()
+    )
+    if taken:
+        invalidate_books(book_ids)
+    return taken == len(book_ids)
+
+
+def return_copy(book_id: int) -> None:
+    """Puts one copy of the book back in a single UPDATE"""
+    Book.objects.filter(pk=book_id).update(
+        inventory=F("inventory") + 1, updated_at=timezone.now()
+    )
+    invalidate_books([book_id])
@@ -0,0 +1,81 @@
+import time
+import tracemalloc
+from decimal import Decimal
+
+from django.core.management import BaseCommand
+from django.db import connection, transaction
+from django.test.utils import CaptureQueriesContext
+from rest_framework.test import APIRequestFactory
+
+from books.models import Book
+from books.views import BookViewSet
+
+
+class Command(BaseCommand):
+    """
+    Django command to compare the paginated book list with the full dump
+    of the catalog. Seeded books are rolled back when the command finishes.
+    """
+
+    help = "Benchmarks cursor pagination of the book list against a full dump."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--books", type=int, default=100_000)
+        parser.add_argument("--page-size", type=int, default=50)
+        parser.add_argument("--pages", type=int, default=20)
+
+    def handle(self, *args, **options):
+        factory = APIRequestFactory(HTTP_HOST="localhost")
+        paginated_view = BookViewSet.as_view({"get": "list"})
+        full_dump_view = BookViewSet.as_view({"get": "list"}, pagination_class=None)
+
+        with transaction.atomic():
+            self.stdout.write(f"Seeding {options['books']} books...")
+            Book.objects.bulk_create(
+                (
+                    Book(
+                        title=f"Benchmark book {number:07d}",
+                        author="Benchmark author",
+                        cover=Book.Cover.SOFT,
+                        inventory=number % 10,
+                        daily_fee=Decimal("0.50"),
+                    )
+                    for number in range(options["books"])
+                ),
+                batch_size=5000,
+            )
+
+            request = factory.get("/api/books/books/")
+            self._report("Full dump", lambda: [full_dump_view(request).render()])
+
+            def walk_pages():
+                responses = []
+                url = f"/api/books/books/?page_size={options['page_size']}"
+                for _ in range(options["pages"]):
+                    response = paginated_view(factory.get(url)).render()
+                    responses.append(response)
+                    url = response.data["next"]
+                    if not url:
+                        break
+                return responses
+
+            self._report(f"Cursor pages (first {options['pages']})", walk_pages)
+
+            transaction.set_rollback(True)
+
+    def _report(self, label, run):
+        tracemalloc.start()
+        with CaptureQueriesContext(connection) as queries:
+            start = time.perf_counter()
+            responses = run()
+            elapsed = time.perf_counter() - start
+        _, peak_memory = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+
+        payload_size = sum(len(response.content) for response in responses)
+        self.stdout.write(
+            f"{label}: {len(responses)} response(s), "
+            f"{elapsed * 1000 / len(responses):.1f} ms per response, "
+            f"{len(queries)} queries, {payload_size / 1024:.0f} KiB sent, "
+            f"peak memory {peak_memory / 1024 / 1024:.1f} MiB"
+        )
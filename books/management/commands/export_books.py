@@ -0,0 +1,30 @@
+from django.core.management import BaseCommand
+
+from books.catalog import CSV, JSON_LINES, export_lines
+
+
+class Command(BaseCommand):
+    """Django command to export the whole catalog as CSV or JSON Lines"""
+
+    help = "Exports books to a CSV (with a header) or JSON Lines file."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--format", choices=(CSV, JSON_LINES), default=CSV)
+        parser.add_argument(
+            "--output", help="File to write the catalog to, stdout by default."
+        )
+        parser.add_argument("--chunk-size", type=int, default=2000)
+
+    def handle(self, *args, **options):
+        lines = export_lines(options["format"], chunk_size=options["chunk_size"])
+
+        if not options["output"]:
+            for chunk in lines:
+                self.stdout.write(chunk, ending="")
+            return
+
+        with open(options["output"], "w", newline="") as catalog_file:
+            catalog_file.writelines(lines)
+        self.stderr.write(
+            self.style.SUCCESS(f"Catalog exported to {options['output']}.")
+        )
@@ -0,0 +1,32 @@
+from django.core.management import BaseCommand, CommandError
+
+from books.catalog import CSV, JSON_LINES, BookImporter, read_rows
+
+
+class Command(BaseCommand):
+    """Django command to create or update books from a CSV or JSON Lines file"""
+
+    help = "Imports books from a CSV (with a header) or JSON Lines file."
+
+    def add_arguments(self, parser):
+        parser.add_argument("path")
+        parser.add_argument("--format", choices=(CSV, JSON_LINES))
+        parser.add_argument("--chunk-size", type=int, default=1000)
+
+    def handle(self, *args, **options):
+        file_format = options["format"] or options["path"].rsplit(".", 1)[-1]
+        if file_format not in (CSV, JSON_LINES):
+            raise CommandError("Unknown file format, use --format csv or jsonl.")
+
+        with open(options["path"], "rb") as catalog_file:
+            report = BookImporter(chunk_size=options["chunk_size"]).run(
+                read_rows(catalog_file, file_format)
+            )
+
+        for error in report["errors"]:
+            self.stderr.write(f"Row {error['row']}: {error['errors']}")
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"Imported {report['imported']} books, {report['failed']} rows failed."
+            )
+        )
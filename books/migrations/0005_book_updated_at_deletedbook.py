@@ -0,0 +1,32 @@
+# Generated by Django 4.1.7 on 2026-10-16 11:20
+
+from django.contrib.postgres.operations import AddIndexConcurrently
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    atomic = False
+
+    dependencies = [
+        ("books", "0004_book_trigram_indexes"),
+        ("borrowings", "0007_auto_20230413_1609"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="DeletedBook",
+            fields=[
+                ("book_id", models.BigIntegerField(primary_key=True, serialize=False)),
+                ("deleted_at", models.DateTimeField(auto_now=True, db_index=True)),
+            ],
+        ),
+        migrations.AddField(
+            model_name="book",
+            name="updated_at",
+            field=models.DateTimeField(auto_now=True),
+        ),
+        AddIndexConcurrently(
+            model_name="book",
+            index=models.Index(fields=["updated_at", "id"], name="book_updated_at_idx"),
+        ),
+    ]
@@ -0,0 +1,57 @@
+# Generated by Django 4.1.7 on 2026-10-16 12:40
+
+from django.db import migrations, models
+from django.utils import timezone
+
+
+def clamp_negative_inventory(apps, schema_editor):
+    # updated_at is bumped, so sync clients pick the fixed inventory up
+    Book = apps.get_model("books", "Book")
+    Book.objects.filter(inventory__lt=0).update(inventory=0, updated_at=timezone.now())
+
+
+class Migration(migrations.Migration):
+    # NOT VALID + VALIDATE keeps the table writable while existing rows
+    # are checked, instead of holding an exclusive lock for the whole scan.
+    # Every step commits on its own, so VALIDATE doesn't run in the
+    # transaction that took the lock of ADD CONSTRAINT.
+    atomic = False
+
+    dependencies = [
+        ("books", "0005_book_updated_at_deletedbook"),
+    ]
+
+    operations = [
+        migrations.SeparateDatabaseAndState(
+            database_operations=[
+                migrations.RunSQL(
+                    sql=(
+                        "ALTER TABLE books_book "
+                        "ADD CONSTRAINT book_inventory_not_negative "
+                        "CHECK (inventory >= 0) NOT VALID"
+                    ),
+                    reverse_sql=(
+                        "ALTER TABLE books_book "
+                        "DROP CONSTRAINT book_inventory_not_negative"
+                    ),
+                ),
+            ],
+            state_operations=[
+                migrations.AddConstraint(
+                    model_name="book",
+                    constraint=models.CheckConstraint(
+                        check=models.Q(("inventory__gte", 0)),
+                        name="book_inventory_not_negative",
+                    ),
+                ),
+            ],
+        ),
+        # New writes are already checked, rows written before would fail VALIDATE
+        migrations.RunPython(
+            clamp_negative_inventory, reverse_code=migrations.RunPython.noop
+        ),
+        migrations.RunSQL(
+            sql="ALTER TABLE books_book VALIDATE CONSTRAINT book_inventory_not_negative",
+            reverse_sql=migrations.RunSQL.noop,
+        ),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 4.1.7 on 2026-10-16 13:30
+
+from django.contrib.postgres.operations import AddIndexConcurrently
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    atomic = False
+
+    dependencies = [
+        ("books", "0006_book_inventory_not_negative"),
+    ]
+
+    operations = [
+        AddIndexConcurrently(
+            model_name="book",
+            index=models.Index(
+                condition=models.Q(("inventory__gt", 0)),
+                fields=["title"],
+                name="book_available_title_idx",
+            ),
+        ),
+    ]
@@ -1,3 +1,4 @@
+from django.contrib.postgres.indexes import GinIndex
 from django.core.validators import MinValueValidator
 from django.db import models
 
@@ -12,9 +13,44 @@ class Book(models.Model):
     cover = models.CharField(max_length=4, choices=Cover.choices)
     inventory = models.IntegerField(validators=[MinValueValidator(0)])
     daily_fee = models.DecimalField(max_digits=3, decimal_places=2)
+    updated_at = models.DateTimeField(auto_now=True)
 
     class Meta:
         ordering = ["title"]
+        indexes = [
+            GinIndex(
+                name="book_title_trgm_idx",
+                fields=["title"],
+                opclasses=["gin_trgm_ops"],
+            ),
+            GinIndex(
+                name="book_author_trgm_idx",
+                fields=["author"],
+                opclasses=["gin_trgm_ops"],
+            ),
+            models.Index(fields=["updated_at", "id"], name="book_updated_at_idx"),
+            models.Index(
+                fields=["title"],
+                condition=models.Q(inventory__gt=0),
+                name="book_available_title_idx",
+            ),
+        ]
+        constraints = [
+            models.CheckConstraint(
+                name="book_inventory_not_negative",
+                check=models.Q(inventory__gte=0),
+            )
+        ]
 
     def __str__(self):
         return self.title
+
+
+class DeletedBook(models.Model):
+    """Tombstone of a deleted book, so syncing clients can drop it too"""
+
+    book_id = models.BigIntegerField(primary_key=True)
+    deleted_at = models.DateTimeField(auto_now=True, db_index=True)
+
+    def __str__(self):
+        return f"Book {self.book_id} deleted at {self.deleted_at}"
@@ -0,0 +1,22 @@
+from library_service_api.pagination import KeysetCursorPagination
+
+
+class BookCursorPagination(KeysetCursorPagination):
+    """
+    Keyset pagination over the catalog ordered by title (id as tie-breaker).
+    Every page is an index range scan on the unique title index,
+    so there is no OFFSET and no COUNT(*) no matter how deep the client goes.
+    Search results with equal similarity are paged by id the same way.
+    """
+
+    ordering = ("title", "id")
+    page_size = 50
+    page_size_query_param = "page_size"
+    max_page_size = 200
+
+    def get_ordering(self, request, queryset, view):
+        """Search results are ordered by relevance instead of the title."""
+        if "similarity" in queryset.query.annotations:
+            return ("-similarity", "id")
+
+        return super().get_ordering(request, queryset, view)
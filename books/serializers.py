@@ -1,9 +1,100 @@
 from rest_framework import serializers
 
 from books.models import Book
+from books.sync import SYNC_LIMIT, SYNC_MAX_LIMIT, decode_position
+from library_service_api.sparse_fieldsets import SparseFieldsetMixin
 
 
-class BookSerializer(serializers.ModelSerializer):
+class BookSerializer(SparseFieldsetMixin, serializers.ModelSerializer):
     class Meta:
         model = Book
-        fields = ("id", "title", "author", "cover", "inventory", "daily_fee")
+        fields = (
+            "id",
+            "title",
+            "author",
+            "cover",
+            "inventory",
+            "daily_fee",
+            "updated_at",
+        )
+
+
+class BookFilterSerializer(serializers.Serializer):
+    """Blank parameters (ex. ?search=) are validated as not filtering"""
+
+    search = serializers.CharField(required=False, allow_blank=True)
+    available = serializers.BooleanField(required=False, allow_null=True)
+    cover = serializers.ChoiceField(
+        choices=Book.Cover.choices, required=False, allow_blank=True
+    )
+    min_daily_fee = serializers.DecimalField(
+        max_digits=3, decimal_places=2, required=False, allow_null=True
+    )
+    max_daily_fee = serializers.DecimalField(
+        max_digits=3, decimal_places=2, required=False, allow_null=True
+    )
+
+
+class BookImportSerializer(BookSerializer):
+    """Validates imported rows, books with existing titles get updated"""
+
+    class Meta(BookSerializer.Meta):
+        fields = ("title", "author", "cover", "inventory", "daily_fee")
+        extra_kwargs = {"title": {"validators": []}}
+
+
+class BookImportReportSerializer(serializers.Serializer):
+    imported = serializers.IntegerField()
+    failed = serializers.IntegerField()
+    errors = serializers.ListField(child=serializers.DictField())
+
+
+class BookInventoryChangeSerializer(serializers.Serializer):
+    id = serializers.IntegerField()
+    delta = serializers.IntegerField(required=False)
+    inventory = serializers.IntegerField(required=False, min_value=0)
+
+    def validate(self, data):
+        """Validates that exactly one of delta and inventory is provided."""
+        if ("delta" in data) == ("inventory" in data):
+            raise serializers.ValidationError(
+                "Provide either delta or inventory for the book."
+            )
+        return data
+
+
+class BookInventorySerializer(serializers.Serializer):
+    id = serializers.IntegerField()
+    inventory = serializers.IntegerField()
+
+
+class BookExportQuerySerializer(serializers.Serializer):
+    file_format = serializers.ChoiceField(choices=("csv", "jsonl"), default="csv")
+
+
+class BookSyncQuerySerializer(serializers.Serializer):
+    updated_since = serializers.DateTimeField(required=False)
+    cursor = serializers.CharField(required=False)
+    limit = serializers.IntegerField(
+        min_value=1, max_value=SYNC_MAX_LIMIT, default=SYNC_LIMIT
+    )
+
+    def validate_cursor(self, value):
+        try:
+            return decode_position(value)
+        except ValueError:
+            raise serializers.ValidationError("Invalid cursor.")
+
+    def validate(self, attrs):
+        if "updated_since" not in attrs and "cursor" not in attrs:
+            raise serializers.ValidationError(
+                {"updated_since": "This field is required."}
+            )
+        return attrs
+
+
+class BookSyncSerializer(serializers.Serializer):
+    synced_at = serializers.DateTimeField()
+    changed = BookSerializer(many=True)
+    deleted = serializers.ListField(child=serializers.IntegerField())
+    next = serializers.URLField(allow_null=True)
@@ -0,0 +1,18 @@
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from books.cache import invalidate_books
+from books.models import Book, DeletedBook
+
+
+@receiver(post_save, sender=Book)
+@receiver(post_delete, sender=Book)
+def invalidate_book_cache(sender, instance, **kwargs) -> None:
+    """Drops cached payloads of the book every time it is written"""
+    invalidate_books([instance.pk])
+
+
+@receiver(post_delete, sender=Book)
+def record_deleted_book(sender, instance, **kwargs) -> None:
+    """Leaves a tombstone of the book for clients syncing the catalog"""
+    DeletedBook.objects.update_or_create(book_id=instance.pk)
@@ -0,0 +1,89 @@
+import json
+from base64 import urlsafe_b64decode, urlsafe_b64encode
+from datetime import datetime
+from typing import Optional
+
+from django.utils.dateparse import parse_datetime
+
+from books.models import Book, DeletedBook
+from library_service_api.pagination import keyset_filter
+
+SYNC_LIMIT = 500
+SYNC_MAX_LIMIT = 2000
+CHANGED_ORDERING = ("updated_at", "id")
+DELETED_ORDERING = ("deleted_at", "book_id")
+
+
+def encode_position(position: dict) -> str:
+    """Continuation token of the next sync page"""
+    payload = json.dumps(position, default=datetime.isoformat)
+    return urlsafe_b64encode(payload.encode()).decode()
+
+
+def _datetime(value) -> datetime:
+    parsed = parse_datetime(value) if isinstance(value, str) else None
+    if parsed is None:
+        raise ValueError("Invalid datetime.")
+    return parsed
+
+
+def _key(value) -> Optional[list]:
+    if value is None:
+        return None
+    timestamp, row_id = value
+    if not isinstance(row_id, int):
+        raise ValueError("Invalid id.")
+    return [_datetime(timestamp), row_id]
+
+
+def decode_position(token: str) -> dict:
+    """Raises ValueError when the token wasn't made by encode_position()"""
+    try:
+        position = json.loads(urlsafe_b64decode(token.encode()))
+        return {
+            "since": _datetime(position["since"]),
+            "until": _datetime(position["until"]),
+            "changed": _key(position["changed"]),
+            "deleted": _key(position["deleted"]),
+        }
+    except (KeyError, TypeError):
+        raise ValueError("Invalid token.")
+
+
+def sync_page(position: dict, limit: int) -> tuple[list[Book], list[int], dict]:
+    """
+    Returns up to limit books changed and up to limit ids of books deleted
+    between 'since' and 'until' of the position, each stream continues
+    after the (timestamp, id) key it stopped at on the previous page.
+    The position of the next page is None when both streams are drained.
+    """
+    changed = Book.objects.filter(
+        updated_at__gt=position["since"], updated_at__lte=position["until"]
+    )
+    if position["changed"]:
+        changed = changed.filter(keyset_filter(CHANGED_ORDERING, position["changed"]))
+    changed = list(changed.order_by(*CHANGED_ORDERING)[: limit + 1])
+
+    deleted = DeletedBook.objects.filter(
+        deleted_at__gt=position["since"], deleted_at__lte=position["until"]
+    )
+    if position["deleted"]:
+        deleted = deleted.filter(keyset_filter(DELETED_ORDERING, position["deleted"]))
+    deleted = list(
+        deleted.order_by(*DELETED_ORDERING).values_list(*DELETED_ORDERING)[: limit + 1]
+    )
+
+    next_position = None
+    if len(changed) > limit or len(deleted) > limit:
+        changed, deleted = changed[:limit], deleted[:limit]
+        next_position = {
+            **position,
+            "changed": (
+                [changed[-1].updated_at, changed[-1].id]
+                if changed
+                else position["changed"]
+            ),
+            "deleted": list(deleted[-1]) if deleted else position["deleted"],
+        }
+
+    return changed, [book_id for _, book_id in deleted], next_position
@@ -1,27 +1,372 @@
+from datetime import timedelta
+from unittest import skipUnless
+from unittest.mock import patch
+
 from django.contrib.auth import get_user_model
-from django.test import TestCase
+from django.core.cache import cache
+from django.db import connection
+from django.test import TestCase, override_settings
 from django.urls import reverse
+from django.utils import timezone
 from rest_framework import status
 
 from rest_framework.test import APIClient
 
+from books.cache import book_detail_key, cache_stats
 from books.models import Book
+from books.pagination import BookCursorPagination
+from books.serializers import BookSerializer
+from books.views import BookViewSet
 
 BOOK_URL = reverse("books:book-list")
+CACHE_STATS_URL = reverse("books:book-cache-stats")
+SYNC_URL = reverse("books:book-sync")
+IMPORT_URL = reverse("books:book-import-books")
+INVENTORY_URL = reverse("books:book-adjust-inventory")
+EXPORT_URL = reverse("books:book-export")
+
+
+def detail_url(book_id):
+    return reverse("books:book-detail", args=[book_id])
+
+
+def sample_book(**params):
+    defaults = {
+        "title": "Harry Potter 2",
+        "author": "J.K. Rowling",
+        "cover": "HARD",
+        "inventory": 5,
+        "daily_fee": 0.5,
+    }
+    defaults.update(params)
+
+    return Book.objects.create(**defaults)
 
 
 class UnauthenticatedBookApiTests(TestCase):
     def setUp(self):
         self.client = APIClient()
+        cache.clear()
 
     def test_auth_not_required(self):
         response = self.client.get(BOOK_URL)
         self.assertEqual(response.status_code, status.HTTP_200_OK)
 
+    def test_list_books_is_paginated_by_cursor(self):
+        response = self.client.get(BOOK_URL)
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(set(response.data), {"next", "previous", "results"})
+
+    def test_list_books_with_selected_fields(self):
+        response = self.client.get(BOOK_URL, {"fields": "id,title"})
+
+        for book in response.data["results"]:
+            self.assertEqual(set(book), {"id", "title"})
+
+    def test_list_books_page_size_is_capped(self):
+        for number in range(BookCursorPagination.max_page_size + 1):
+            sample_book(title=f"Book {number:04d}")
+
+        response = self.client.get(
+            BOOK_URL, {"page_size": BookCursorPagination.max_page_size + 100}
+        )
+
+        self.assertEqual(
+            len(response.data["results"]), BookCursorPagination.max_page_size
+        )
+
+    def test_list_books_pages_cover_whole_catalog_in_title_order(self):
+        for number in range(7):
+            sample_book(title=f"Book {number}")
+
+        titles = []
+        url = f"{BOOK_URL}?page_size=3"
+        while url:
+            response = self.client.get(url)
+            titles.extend(book["title"] for book in response.data["results"])
+            url = response.data["next"]
+
+        self.assertEqual(
+            titles, list(Book.objects.order_by("title").values_list("title", flat=True))
+        )
+
+
+@skipUnless(connection.vendor == "postgresql", "Trigram search requires PostgreSQL")
+class BookSearchApiTests(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        cache.clear()
+        sample_book(title="The Hobbit", author="J.R.R. Tolkien")
+        sample_book(title="The Hobbit Companion", author="David Day")
+        sample_book(title="Dune", author="Frank Herbert")
+
+    def test_search_by_title_ranks_best_match_first(self):
+        response = self.client.get(BOOK_URL, {"search": "hobbit companion"})
+        titles = [book["title"] for book in response.data["results"]]
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(titles[0], "The Hobbit Companion")
+        self.assertNotIn("Dune", titles)
+
+    def test_search_by_author(self):
+        response = self.client.get(BOOK_URL, {"search": "herbert"})
+        titles = [book["title"] for book in response.data["results"]]
+
+        self.assertEqual(titles, ["Dune"])
+
+    def test_search_tolerates_typos(self):
+        response = self.client.get(BOOK_URL, {"search": "hobit"})
+        titles = [book["title"] for book in response.data["results"]]
+
+        self.assertIn("The Hobbit", titles)
+
+    def test_search_pages_through_equally_similar_books(self):
+        for number in range(25):
+            sample_book(title=f"Hobbit {number:02}", author="Unknown")
+
+        titles, url, params = [], BOOK_URL, {"search": "hobbit", "page_size": 10}
+        while url:
+            response = self.client.get(url, params)
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+            titles += [book["title"] for book in response.data["results"]]
+            url, params = response.data["next"], None
+
+        self.assertEqual(len(titles), len(set(titles)))
+        self.assertTrue({f"Hobbit {number:02}" for number in range(25)} <= set(titles))
+
+
+class BookFilterApiTests(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        cache.clear()
+        sample_book(title="Dune", cover="SOFT", daily_fee=1.5)
+        sample_book(title="Emma", inventory=0, daily_fee=0.5)
+
+    def get_titles(self, params):
+        response = self.client.get(BOOK_URL, params)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        titles = [book["title"] for book in response.data["results"]]
+        return [title for title in titles if title in ("Dune", "Emma")]
+
+    def test_filter_available_books(self):
+        self.assertEqual(self.get_titles({"available": "true"}), ["Dune"])
+        self.assertEqual(self.get_titles({"available": "false"}), ["Emma"])
+
+    def test_filter_by_cover(self):
+        self.assertEqual(self.get_titles({"cover": "SOFT"}), ["Dune"])
+
+    def test_filter_by_daily_fee_range(self):
+        self.assertEqual(self.get_titles({"min_daily_fee": "1.1"}), ["Dune"])
+        self.assertEqual(self.get_titles({"max_daily_fee": "0.9"}), ["Emma"])
+
+    def test_blank_filters_are_ignored(self):
+        params = {
+            "search": " ",
+            "available": "",
+            "cover": "",
+            "min_daily_fee": "",
+            "max_daily_fee": "",
+        }
+        self.assertEqual(self.get_titles(params), ["Dune", "Emma"])
+
+    def test_invalid_filter_is_rejected(self):
+        response = self.client.get(BOOK_URL, {"cover": "PAPER"})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+
+@override_settings(BOOK_CACHE_ENABLED=True)
+class BookCacheTests(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        cache.clear()
+        self.book = sample_book()
+
+    def test_repeated_list_is_served_from_cache(self):
+        self.client.get(BOOK_URL)
+        self.client.get(BOOK_URL)
+
+        self.assertEqual(cache_stats(), {"hits": 1, "misses": 1})
+
+    def test_repeated_retrieve_skips_database(self):
+        self.client.get(detail_url(self.book.id))
+
+        with self.assertNumQueries(0):
+            response = self.client.get(detail_url(self.book.id))
+        self.assertEqual(response.data["title"], self.book.title)
+
+    def test_sparse_retrieve_does_not_replace_cached_detail(self):
+        response = self.client.get(detail_url(self.book.id), {"fields": "id"})
+        self.assertEqual(response.data, {"id": self.book.id})
+
+        response = self.client.get(detail_url(self.book.id))
+        self.assertEqual(response.data["title"], self.book.title)
+        self.assertEqual(set(response.data), set(BookSerializer.Meta.fields))
+
+    def test_book_save_invalidates_cached_detail_and_list(self):
+        self.client.get(BOOK_URL)
+        self.client.get(detail_url(self.book.id))
+
+        self.book.inventory = 42
+        self.book.save()
+
+        detail = self.client.get(detail_url(self.book.id))
+        listed = self.client.get(BOOK_URL, {"page_size": 200})
+        self.assertEqual(detail.data["inventory"], 42)
+        self.assertIn(
+            42,
+            [
+                book["inventory"]
+                for book in listed.data["results"]
+                if book["id"] == self.book.id
+            ],
+        )
+
+    def test_book_delete_invalidates_cached_detail(self):
+        self.client.get(detail_url(self.book.id))
+        self.book.delete()
+
+        response = self.client.get(detail_url(self.book.id))
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+    @override_settings(BOOK_CACHE_ENABLED=False)
+    def test_disabled_cache_always_reads_database(self):
+        self.client.get(detail_url(self.book.id))
+        self.client.get(BOOK_URL)
+
+        response = self.client.get(detail_url(self.book.id))
+        self.assertEqual(response.data["title"], self.book.title)
+        self.assertIsNone(cache.get(book_detail_key(self.book.id)))
+        self.assertEqual(cache_stats(), {"hits": 0, "misses": 0})
+
+
+@override_settings(BOOK_CACHE_ENABLED=True)
+class BookConditionalGetTests(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        cache.clear()
+        self.book = sample_book()
+
+    def test_unchanged_catalog_returns_not_modified(self):
+        etag = self.client.get(BOOK_URL)["ETag"]
+
+        with self.assertNumQueries(0):
+            response = self.client.get(BOOK_URL, HTTP_IF_NONE_MATCH=etag)
+
+        self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+        self.assertEqual(response["ETag"], etag)
+        self.assertFalse(response.content)
+
+    def test_not_modified_skips_serializer(self):
+        etag = self.client.get(detail_url(self.book.id))["ETag"]
+        cache.delete(book_detail_key(self.book.id))
+
+        with patch.object(BookViewSet, "get_serializer") as serializer_mock:
+            response = self.client.get(
+                detail_url(self.book.id), HTTP_IF_NONE_MATCH=etag
+            )
+
+        self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+        serializer_mock.assert_not_called()
+
+    def test_book_write_changes_etag(self):
+        etag = self.client.get(BOOK_URL)["ETag"]
+
+        self.book.inventory += 1
+        self.book.save()
+        response = self.client.get(BOOK_URL, HTTP_IF_NONE_MATCH=etag)
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertNotEqual(response["ETag"], etag)
+
+    @override_settings(BOOK_CACHE_ENABLED=False)
+    def test_no_etag_without_shared_cache(self):
+        response = self.client.get(BOOK_URL, HTTP_IF_NONE_MATCH="*")
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertNotIn("ETag", response)
+
+        response = self.client.get(detail_url(self.book.id), HTTP_IF_NONE_MATCH="*")
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertNotIn("ETag", response)
+
+
+class BookSyncApiTests(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.book = sample_book()
+        self.synced_at = self.client.get(
+            SYNC_URL, {"updated_since": "2000-01-01T00:00:00Z"}
+        ).data["synced_at"]
+
+    def test_sync_requires_updated_since(self):
+        response = self.client.get(SYNC_URL)
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_sync_returns_changed_books(self):
+        Book.objects.update(updated_at=timezone.now() - timedelta(days=1))
+        changed_book = sample_book(title="Harry Potter 3")
+
+        response = self.client.get(SYNC_URL, {"updated_since": self.synced_at})
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(
+            [book["id"] for book in response.data["changed"]], [changed_book.id]
+        )
+
+    def test_inventory_change_updates_timestamp(self):
+        updated_at = self.book.updated_at
+
+        self.book.inventory -= 1
+        self.book.save()
+
+        self.assertGreater(self.book.updated_at, updated_at)
+
+    def test_sync_returns_tombstones_of_deleted_books(self):
+        book_id = self.book.id
+        self.book.delete()
+
+        response = self.client.get(SYNC_URL, {"updated_since": self.synced_at})
+
+        self.assertEqual(list(response.data["deleted"]), [book_id])
+
+    def test_sync_pages_changed_and_deleted_books(self):
+        books = [self.book] + [
+            sample_book(title=f"Harry Potter {number}") for number in range(3, 8)
+        ]
+        # Books changed at the same moment are paged by id
+        Book.objects.update(updated_at=timezone.now())
+        deleted_ids = [book.id for book in books[3:]]
+        for book in books[3:]:
+            book.delete()
+
+        changed_ids, synced_ids, synced_at = [], [], set()
+        url, params = SYNC_URL, {"updated_since": "2000-01-01T00:00:00Z", "limit": 2}
+        while url:
+            response = self.client.get(url, params)
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+            self.assertLessEqual(len(response.data["changed"]), 2)
+            self.assertLessEqual(len(response.data["deleted"]), 2)
+            changed_ids += [book["id"] for book in response.data["changed"]]
+            synced_ids += response.data["deleted"]
+            synced_at.add(response.data["synced_at"])
+            url, params = response.data["next"], None
+
+        self.assertEqual(
+            changed_ids, list(Book.objects.order_by("id").values_list("id", flat=True))
+        )
+        self.assertEqual(synced_ids, deleted_ids)
+        self.assertEqual(len(synced_at), 1)
+
+    def test_sync_rejects_invalid_cursor(self):
+        response = self.client.get(SYNC_URL, {"cursor": "invalid"})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
 
 class AuthenticatedBookApiTests(TestCase):
     def setUp(self):
         self.client = APIClient()
+        cache.clear()
         self.user = get_user_model().objects.create_user(
             "authenticated@library.com", "password"
         )
@@ -39,10 +384,29 @@ class AuthenticatedBookApiTests(TestCase):
         response = self.client.post(BOOK_URL, payload)
         self.assertEqual(response.status_code, status.HTTP_403_FORBIDDEN)
 
+    def test_import_books_forbidden(self):
+        response = self.client.post(
+            IMPORT_URL, "title,author\n", content_type="text/csv"
+        )
+        self.assertEqual(response.status_code, status.HTTP_403_FORBIDDEN)
+
+    def test_adjust_inventory_forbidden(self):
+        response = self.client.post(INVENTORY_URL, [], format="json")
+        self.assertEqual(response.status_code, status.HTTP_403_FORBIDDEN)
+
+    def test_export_books_forbidden(self):
+        response = self.client.get(EXPORT_URL)
+        self.assertEqual(response.status_code, status.HTTP_403_FORBIDDEN)
+
+    def test_cache_stats_forbidden(self):
+        response = self.client.get(CACHE_STATS_URL)
+        self.assertEqual(response.status_code, status.HTTP_403_FORBIDDEN)
+
 
 class AdminBookApiTests(TestCase):
     def setUp(self):
         self.client = APIClient()
+        cache.clear()
         self.user = get_user_model().objects.create_superuser(
             "admin@library.com", "password"
         )
@@ -63,3 +427,128 @@ class AdminBookApiTests(TestCase):
         self.assertEqual(response.status_code, status.HTTP_201_CREATED)
         for key in payload:
             self.assertEqual(payload[key], getattr(book, key))
+
+    @override_settings(BOOK_CACHE_ENABLED=True)
+    def test_cache_stats_allowed(self):
+        self.client.get(BOOK_URL)
+
+        response = self.client.get(CACHE_STATS_URL)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data, {"hits": 0, "misses": 1})
+
+    def test_import_books_from_csv(self):
+        sample_book(title="Dune", inventory=1)
+        catalog = (
+            "title,author,cover,inventory,daily_fee\n"
+            "Dune,Frank Herbert,SOFT,7,1.00\n"
+            "Emma,Jane Austen,HARD,2,0.50\n"
+        )
+
+        response = self.client.post(IMPORT_URL, catalog, content_type="text/csv")
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data["imported"], 2)
+        self.assertEqual(Book.objects.get(title="Dune").inventory, 7)
+        self.assertTrue(Book.objects.filter(title="Emma").exists())
+
+    def test_import_books_reports_invalid_rows(self):
+        catalog = (
+            '{"title": "Emma", "author": "Jane Austen", "cover": "HARD", '
+            '"inventory": 2, "daily_fee": "0.50"}\n'
+            "not a json\n"
+            '{"title": "Dune", "author": "Frank Herbert", "cover": "PAPER", '
+            '"inventory": -1, "daily_fee": "1.00"}\n'
+        )
+
+        response = self.client.post(
+            IMPORT_URL, catalog, content_type="application/jsonl"
+        )
+
+        self.assertEqual(response.data["imported"], 1)
+        self.assertEqual(response.data["failed"], 2)
+        self.assertEqual([error["row"] for error in response.data["errors"]], [2, 3])
+        self.assertEqual(
+            set(response.data["errors"][1]["errors"]), {"cover", "inventory"}
+        )
+
+    def test_import_books_unsupported_format(self):
+        response = self.client.post(IMPORT_URL, "<books/>", content_type="text/xml")
+        self.assertEqual(response.status_code, status.HTTP_415_UNSUPPORTED_MEDIA_TYPE)
+
+    def test_adjust_inventory_of_many_books(self):
+        first = sample_book(title="Dune", inventory=3)
+        second = sample_book(title="Emma", inventory=3)
+
+        response = self.client.post(
+            INVENTORY_URL,
+            [{"id": first.id, "delta": -2}, {"id": second.id, "inventory": 10}],
+            format="json",
+        )
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(
+            response.data,
+            [{"id": first.id, "inventory": 1}, {"id": second.id, "inventory": 10}],
+        )
+        first.refresh_from_db()
+        second.refresh_from_db()
+        self.assertEqual((first.inventory, second.inventory), (1, 10))
+
+    def test_adjust_inventory_below_zero_changes_nothing(self):
+        first = sample_book(title="Dune", inventory=3)
+        second = sample_book(title="Emma", inventory=1)
+
+        response = self.client.post(
+            INVENTORY_URL,
+            [{"id": first.id, "delta": 5}, {"id": second.id, "delta": -2}],
+            format="json",
+        )
+
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        first.refresh_from_db()
+        self.assertEqual(first.inventory, 3)
+
+    def test_adjust_inventory_of_unknown_book_fails(self):
+        book = sample_book(title="Dune", inventory=3)
+
+        response = self.client.post(
+            INVENTORY_URL,
+            [{"id": book.id, "delta": 1}, {"id": book.id + 1000, "delta": 1}],
+            format="json",
+        )
+
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        book.refresh_from_db()
+        self.assertEqual(book.inventory, 3)
+
+    def test_adjust_inventory_requires_delta_or_inventory(self):
+        book = sample_book(title="Dune", inventory=3)
+
+        response = self.client.post(
+            INVENTORY_URL,
+            [{"id": book.id, "delta": 1, "inventory": 5}],
+            format="json",
+        )
+
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_export_books_as_csv(self):
+        response = self.client.get(EXPORT_URL)
+        lines = b"".join(response.streaming_content).decode().splitlines()
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response["Content-Type"], "text/csv")
+        self.assertEqual(lines[0], "id,title,author,cover,inventory,daily_fee")
+        self.assertEqual(len(lines) - 1, Book.objects.count())
+
+    def test_exported_json_lines_can_be_imported_back(self):
+        response = self.client.get(EXPORT_URL, {"file_format": "jsonl"})
+        catalog = b"".join(response.streaming_content)
+        Book.objects.update(inventory=0)
+
+        response = self.client.post(
+            IMPORT_URL, catalog, content_type="application/jsonl"
+        )
+
+        self.assertEqual(response.data["imported"], Book.objects.count())
+        self.assertFalse(Book.objects.filter(inventory=0).exists())
@@ -1,14 +1,108 @@
-from drf_spectacular.utils import extend_schema_view, extend_schema
-from rest_framework import viewsets
+from datetime import timedelta
 
+from django.contrib.postgres.search import TrigramWordSimilarity
+from django.db import IntegrityError, transaction
+from django.db.models import FloatField, Q
+from django.db.models.functions import Cast, Greatest
+from django.http import StreamingHttpResponse
+from django.utils import timezone
+from django.utils.http import parse_etags
+from drf_spectacular.types import OpenApiTypes
+from drf_spectacular.utils import OpenApiParameter, extend_schema_view, extend_schema
+from rest_framework import status, viewsets
+from rest_framework.decorators import action
+from rest_framework.exceptions import UnsupportedMediaType, ValidationError
+from rest_framework.permissions import IsAdminUser
+from rest_framework.response import Response
+from rest_framework.utils.urls import remove_query_param, replace_query_param
+
+from books.cache import (
+    book_detail_key,
+    book_list_key,
+    cache_stats,
+    cached_payload,
+    get_catalog_version,
+)
+from books.catalog import (
+    CONTENT_TYPE_FORMATS,
+    FORMAT_CONTENT_TYPES,
+    BookImporter,
+    export_lines,
+    read_rows,
+)
+from books.inventory import adjust_inventory
 from books.models import Book
+from books.pagination import BookCursorPagination
 from books.permissions import IsAdminOrReadOnly
-from books.serializers import BookSerializer
+from books.sync import (
+    SYNC_LIMIT,
+    SYNC_MAX_LIMIT,
+    encode_position,
+    sync_page,
+)
+from books.serializers import (
+    BookFilterSerializer,
+    BookImportReportSerializer,
+    BookInventoryChangeSerializer,
+    BookInventorySerializer,
+    BookExportQuerySerializer,
+    BookSerializer,
+    BookSyncQuerySerializer,
+    BookSyncSerializer,
+)
+from library_service_api.sparse_fieldsets import (
+    SPARSE_FIELDSET_PARAMETERS,
+    requested_fields,
+)
 
 
 @extend_schema_view(
-    list=extend_schema(description="Endpoint for getting all the books in the library"),
-    retrieve=extend_schema(description="Endpoint for getting a specific book"),
+    list=extend_schema(
+        description="Endpoint for getting the books in the library page by page",
+        parameters=[
+            OpenApiParameter(
+                name="search",
+                description=(
+                    "Search by title and author, the most relevant books "
+                    "come first (ex. ?search=potter)."
+                ),
+                required=False,
+                type=str,
+            ),
+            OpenApiParameter(
+                name="available",
+                description=(
+                    "Filter by books that can be borrowed now (ex. ?available=true)."
+                ),
+                required=False,
+                type=bool,
+            ),
+            OpenApiParameter(
+                name="cover",
+                description="Filter by cover (ex. ?cover=HARD).",
+                required=False,
+                type=str,
+                enum=Book.Cover.values,
+            ),
+            OpenApiParameter(
+                name="min_daily_fee",
+                description="Filter by daily fee from (ex. ?min_daily_fee=0.5).",
+                required=False,
+                type=float,
+            ),
+            OpenApiParameter(
+                name="max_daily_fee",
+                description="Filter by daily fee up to (ex. ?max_daily_fee=1.5).",
+                required=False,
+                type=float,
+            ),
+            *SPARSE_FIELDSET_PARAMETERS,
+        ],
+    ),
+    retrieve=extend_schema(
+        description="Endpoint for getting a specific book",
+        parameters=SPARSE_FIELDSET_PARAMETERS,
+    ),
     create=extend_schema(description="Endpoint for creating a new book"),
     update=extend_schema(description="Endpoint for updating a book"),
     partial_update=extend_schema(description="Endpoint for updating a book partially"),
@@ -18,3 +112,291 @@ class BookViewSet(viewsets.ModelViewSet):
     queryset = Book.objects.all()
     serializer_class = BookSerializer
     permission_classes = (IsAdminOrReadOnly,)
+    pagination_class = BookCursorPagination
+    # Writes committed a bit later than their updated_at are not lost,
+    # books changed during this window are just sent twice
+    sync_overlap = timedelta(seconds=5)
+
+    def get_queryset(self):
+        queryset = super().get_queryset()
+
+        if self.action in ("list", "retrieve"):
+            fields = requested_fields(self.request, BookSerializer.Meta.fields)
+            # Cursor pagination needs the ordering columns
+            queryset = queryset.only(*fields | {"id", "title"})
+
+        if self.action != "list":
+            return queryset
+
+        filters = BookFilterSerializer(data=self.request.query_params.dict())
+        filters.is_valid(raise_exception=True)
+        filters = filters.validated_data
+
+        if filters.get("available") is not None:
+            # inventory > 0 is served by the partial index on title
+            if filters["available"]:
+                queryset = queryset.filter(inventory__gt=0)
+            else:
+                queryset = queryset.filter(inventory=0)
+        if filters.get("cover"):
+            queryset = queryset.filter(cover=filters["cover"])
+        if filters.get("min_daily_fee") is not None:
+            queryset = queryset.filter(daily_fee__gte=filters["min_daily_fee"])
+        if filters.get("max_daily_fee") is not None:
+            queryset = queryset.filter(daily_fee__lte=filters["max_daily_fee"])
+
+        search = filters.get("search")
+        if search:
+            # Word similarity operators are served by the trigram GIN indexes
+            queryset = queryset.filter(
+                Q(title__trigram_word_similar=search)
+                | Q(author__trigram_word_similar=search)
+            ).annotate(
+                # Cast from real, so the value in the page cursor compares exactly
+                similarity=Cast(
+                    Greatest(
+                        TrigramWordSimilarity(search, "title"),
+                        TrigramWordSimilarity(search, "author"),
+                    ),
+                    FloatField(),
+                )
+            )
+
+        return queryset
+
+    def list(self, request, *args, **kwargs):
+        version = get_catalog_version()
+
+        def build_payload():
+            return super(BookViewSet, self).list(request, *args, **kwargs).data
+
+        return self._conditional_response(
+            request,
+            version,
+            lambda: cached_payload(
+                book_list_key(version, request.build_absolute_uri()), build_payload
+            ),
+        )
+
+    def retrieve(self, request, *args, **kwargs):
+        pk = kwargs["pk"]
+        if not pk.isdigit():
+            return super().retrieve(request, *args, **kwargs)
+
+        def build_payload():
+            return super(BookViewSet, self).retrieve(request, *args, **kwargs).data
+
+        # Only full details are cached, one key is shared by every client
+        if requested_fields(request, BookSerializer.Meta.fields) != set(
+            BookSerializer.Meta.fields
+        ):
+            return self._conditional_response(
+                request, get_catalog_version(), build_payload
+            )
+
+        return self._conditional_response(
+            request,
+            get_catalog_version(),
+            lambda: cached_payload(book_detail_key(int(pk)), build_payload),
+        )
+
+    @staticmethod
+    def _conditional_response(request, version, build_payload):
+        """
+        Tags the response with the catalog version and answers
+        304 Not Modified, without building the payload,
+        when the client already has this version.
+        Responses are not tagged when there is no shared catalog version.
+        """
+        if version is None:
+            return Response(build_payload())
+
+        etag = f'"{version}"'
+        client_etags = parse_etags(request.headers.get("If-None-Match", ""))
+
+        if etag in client_etags or "*" in client_etags:
+            return Response(status=status.HTTP_304_NOT_MODIFIED, headers={"ETag": etag})
+
+        return Response(build_payload(), headers={"ETag": etag})
+
+    @action(
+        methods=["GET"],
+        detail=False,
+        url_path="cache-stats",
+        permission_classes=(IsAdminUser,),
+    )
+    def cache_stats(self, request):
+        """Endpoint for getting hit and miss counters of the book cache."""
+        return Response(cache_stats())
+
+    @extend_schema(
+        parameters=[
+            OpenApiParameter(
+                name="updated_since",
+                description=(
+                    "'synced_at' of the previous sync "
+                    "(ex. ?updated_since=2023-04-13T16:09:00Z), "
+                    "required unless a cursor is given."
+                ),
+                type=str,
+            ),
+            OpenApiParameter(
+                name="cursor",
+                description="Continuation token of the sync, pass 'next' instead.",
+                type=str,
+            ),
+            OpenApiParameter(
+                name="limit",
+                description=(
+                    f"Books and deleted ids per page "
+                    f"(default {SYNC_LIMIT}, at most {SYNC_MAX_LIMIT})."
+                ),
+                type=int,
+            ),
+        ],
+        responses=BookSyncSerializer,
+    )
+    @action(methods=["GET"], detail=False, url_path="sync")
+    def sync(self, request):
+        """
+        Endpoint for getting books changed and deleted since the previous sync.
+        Changes come page by page, follow 'next' until it is null and then
+        pass returned 'synced_at' as 'updated_since' to the next sync.
+        """
+        query_serializer = BookSyncQuerySerializer(data=request.query_params)
+        query_serializer.is_valid(raise_exception=True)
+        query = query_serializer.validated_data
+        position = query.get("cursor") or {
+            "since": query["updated_since"] - self.sync_overlap,
+            "until": timezone.now(),
+            "changed": None,
+            "deleted": None,
+        }
+
+        changed, deleted, next_position = sync_page(position, query["limit"])
+
+        next_url = None
+        if next_position:
+            next_url = replace_query_param(
+                remove_query_param(request.build_absolute_uri(), "updated_since"),
+                "cursor",
+                encode_position(next_position),
+            )
+        serializer = BookSyncSerializer(
+            {
+                "synced_at": position["until"],
+                "changed": changed,
+                "deleted": deleted,
+                "next": next_url,
+            }
+        )
+        return Response(serializer.data)
+
+    @extend_schema(
+        request={
+            "text/csv": OpenApiTypes.STR,
+            "application/jsonl": OpenApiTypes.STR,
+        },
+        responses=BookImportReportSerializer,
+    )
+    @action(
+        methods=["POST"],
+        detail=False,
+        url_path="import",
+        permission_classes=(IsAdminUser,),
+    )
+    def import_books(self, request):
+        """
+        Endpoint for creating or updating many books at once (for admins).
+        Accepts CSV with a header or JSON Lines in the request body,
+        books with existing titles are updated.
+        """
+        file_format = CONTENT_TYPE_FORMATS.get(request.content_type.split(";")[0])
+        if file_format is None:
+            raise UnsupportedMediaType(request.content_type)
+
+        report = BookImporter().run(read_rows(request.stream or [], file_format))
+
+        return Response(BookImportReportSerializer(report).data)
+
+    @extend_schema(
+        request=BookInventoryChangeSerializer(many=True),
+        responses=BookInventorySerializer(many=True),
+    )
+    @action(
+        methods=["POST"],
+        detail=False,
+        url_path="inventory",
+        permission_classes=(IsAdminUser,),
+    )
+    def adjust_inventory(self, request):
+        """
+        Endpoint for changing inventory of many books at once (for admins).
+        Takes a list of {"id", "delta"} or {"id", "inventory"} items,
+        nothing is changed if any of them fails.
+        """
+        serializer = BookInventoryChangeSerializer(data=request.data, many=True)
+        serializer.is_valid(raise_exception=True)
+        changes = serializer.validated_data
+
+        book_ids = [change["id"] for change in changes]
+        if len(set(book_ids)) != len(book_ids):
+            raise ValidationError("Every book can be changed only once per request.")
+
+        try:
+            with transaction.atomic():
+                inventory = adjust_inventory(changes)
+                missing_ids = set(book_ids) - set(inventory)
+                if missing_ids:
+                    raise ValidationError(
+                        f"Books with ids {sorted(missing_ids)} do not exist."
+                    )
+        except IntegrityError:
+            raise ValidationError("Inventory of a book cannot be negative.")
+
+        return Response(
+            BookInventorySerializer(
+                [
+                    {"id": book_id, "inventory": inventory[book_id]}
+                    for book_id in book_ids
+                ],
+                many=True,
+            ).data
+        )
+
+    @extend_schema(
+        parameters=[
+            OpenApiParameter(
+                name="file_format",
+                description="Export file format (ex. ?file_format=jsonl).",
+                required=False,
+                type=str,
+                enum=tuple(FORMAT_CONTENT_TYPES),
+            ),
+        ],
+        responses={
+            (200, content_type): OpenApiTypes.STR
+            for content_type in FORMAT_CONTENT_TYPES.values()
+        },
+    )
+    @action(
+        methods=["GET"],
+        detail=False,
+        url_path="export",
+        permission_classes=(IsAdminUser,),
+    )
+    def export(self, request):
+        """
+        Endpoint for downloading the whole catalog as CSV or JSON Lines
+        (for admins). The file is streamed while it is read from the database.
+        """
+        query_serializer = BookExportQuerySerializer(data=request.query_params.dict())
+        query_serializer.is_valid(raise_exception=True)
+        file_format = query_serializer.validated_data["file_format"]
+
+        response = StreamingHttpResponse(
+            export_lines(file_format),
+            content_type=FORMAT_CONTENT_TYPES[file_format],
+        )
+        response["Content-Disposition"] = f'attachment; filename="books.{file_format}"'
+        return response
@@ -1,6 +1,8 @@
 from django.contrib import admin
 
-from borrowings.models import Borrowing, Payment
+from borrowings.models import Borrowing, Notification, Payment, UserBalance
 
 admin.site.register(Borrowing)
 admin.site.register(Payment)
+admin.site.register(Notification)
+admin.site.register(UserBalance)
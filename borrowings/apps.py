@@ -4,3 +4,7 @@ from django.apps import AppConfig
 class BorrowingsConfig(AppConfig):
     default_auto_field = "django.db.models.BigAutoField"
     name = "borrowings"
+
+    def ready(self):
+        import borrowings.checks  # noqa: F401
+        import borrowings.signals  # noqa: F401
@@ -0,0 +1,31 @@
+from decimal import Decimal
+
+from django.db.models import F, QuerySet
+
+from borrowings.models import UserBalance
+
+
+def charge(user_id: int, amount: Decimal, payments: int = 1) -> None:
+    """Adds new unpaid payments to the user balance"""
+    UserBalance.objects.get_or_create(user_id=user_id)
+    UserBalance.objects.filter(user_id=user_id).update(
+        unpaid_payments=F("unpaid_payments") + payments,
+        outstanding=F("outstanding") + amount,
+    )
+
+
+def settle(user_id: int, amount: Decimal, payments: int = 1) -> None:
+    """Removes paid payments from the user balance"""
+    UserBalance.objects.filter(user_id=user_id).update(
+        unpaid_payments=F("unpaid_payments") - payments,
+        outstanding=F("outstanding") - amount,
+    )
+
+
+def unpaid_balance(user_id: int) -> QuerySet:
+    """Balance of the user, empty when every payment is paid"""
+    return UserBalance.objects.filter(user_id=user_id, unpaid_payments__gt=0)
+
+
+def has_unpaid_payments(user_id: int) -> bool:
+    return unpaid_balance(user_id).exists()
@@ -0,0 +1,23 @@
+from django.conf import settings
+from django.core.checks import Error, Tags, register
+
+
+@register(Tags.security, deploy=False)
+def check_stripe_webhook_secret(app_configs, **kwargs) -> list[Error]:
+    """
+    Payments are marked as paid only by the Stripe webhook,
+    so Stripe can't be enabled without its signing secret.
+    """
+    if settings.STRIPE_SECRET_KEY and not settings.STRIPE_WEBHOOK_SECRET:
+        return [
+            Error(
+                "STRIPE_SECRET_KEY is set without STRIPE_WEBHOOK_SECRET.",
+                hint=(
+                    "Copy the signing secret of the Stripe webhook endpoint "
+                    "into STRIPE_WEBHOOK_SECRET, payments are never marked "
+                    "as paid without it."
+                ),
+                id="borrowings.E001",
+            )
+        ]
+    return []
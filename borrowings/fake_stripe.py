@@ -0,0 +1,35 @@
+import hashlib
+import hmac
+import json
+import time
+import uuid
+from typing import Optional
+
+
+def checkout_session_event(
+    event_type: str, session_id: str, payment_status: str = "paid"
+) -> bytes:
+    """Builds a Stripe event payload about a checkout session"""
+    return json.dumps(
+        {
+            "id": f"evt_{uuid.uuid4().hex}",
+            "object": "event",
+            "type": event_type,
+            "data": {
+                "object": {
+                    "id": session_id,
+                    "object": "checkout.session",
+                    "payment_status": payment_status,
+                }
+            },
+        }
+    ).encode()
+
+
+def sign(payload: bytes, secret: str, timestamp: Optional[int] = None) -> str:
+    """Returns a Stripe-Signature header Stripe would send with the payload"""
+    timestamp = timestamp or int(time.time())
+    signature = hmac.new(
+        secret.encode(), f"{timestamp}.".encode() + payload, hashlib.sha256
+    ).hexdigest()
+    return f"t={timestamp},v1={signature}"
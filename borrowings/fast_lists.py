@@ -0,0 +1,138 @@
+from collections import defaultdict
+from typing import Iterable
+
+from django.db.models import QuerySet
+
+from books.serializers import BookSerializer
+from borrowings.models import Payment
+from borrowings.serializers import (
+    BorrowingPaymentSerializer,
+    BorrowingSerializer,
+    PaymentSerializer,
+)
+
+# Fields convert values exactly like the serializers do
+_BOOK_FIELDS = BookSerializer().fields
+_BORROWING_FIELDS = BorrowingSerializer().fields
+_PAYMENT_FIELDS = PaymentSerializer().fields
+_BORROWING_PAYMENT_FIELDS = BorrowingPaymentSerializer().fields
+
+_BORROWING_COLUMNS = {
+    "id": ("id",),
+    "borrow_date": ("borrow_date",),
+    "expected_return_date": ("expected_return_date",),
+    "actual_return_date": ("actual_return_date",),
+    "book": tuple(f"book__{name}" for name in BookSerializer.Meta.fields),
+    "user": ("user__email",),
+    "payments": ("id",),
+}
+
+
+def borrowing_columns(fields: Iterable[str], prefix: str = "") -> set[str]:
+    """Columns the borrowing fields are rendered from"""
+    return {prefix + column for field in fields for column in _BORROWING_COLUMNS[field]}
+
+
+def borrowing_values(queryset: QuerySet, fields: set[str]) -> QuerySet:
+    """
+    Turns the borrowing queryset into rows of the columns the fields need,
+    cursor pagination also needs borrow_date and id.
+    """
+    columns = borrowing_columns(fields) | {"id", "borrow_date"}
+    return queryset.select_related(None).prefetch_related(None).values(*sorted(columns))
+
+
+def payment_values(queryset: QuerySet, fields: set[str]) -> QuerySet:
+    """Turns the payment queryset into rows of the columns the fields need"""
+    columns = {"id"} | (fields - {"borrowing"})
+    if "borrowing" in fields:
+        columns |= borrowing_columns(BorrowingSerializer.Meta.fields, "borrowing__")
+    return queryset.select_related(None).prefetch_related(None).values(*sorted(columns))
+
+
+def _represent(field, value):
+    return None if value is None else field.to_representation(value)
+
+
+def _payments_of(borrowing_ids: list[int]) -> dict[int, list[dict]]:
+    """
+    Renders payments of the borrowings like BorrowingPaymentSerializer does,
+    with one query for all of them.
+    """
+    payments = defaultdict(list)
+    rows = (
+        Payment.objects.filter(borrowing_id__in=borrowing_ids)
+        .order_by("id")
+        .values("borrowing_id", *BorrowingPaymentSerializer.Meta.fields)
+    )
+    for row in rows:
+        payments[row["borrowing_id"]].append(
+            {
+                name: _represent(_BORROWING_PAYMENT_FIELDS[name], row[name])
+                for name in BorrowingPaymentSerializer.Meta.fields
+            }
+        )
+    return payments
+
+
+def _render_book(row: dict, prefix: str) -> dict:
+    return {
+        name: _represent(_BOOK_FIELDS[name], row[f"{prefix}book__{name}"])
+        for name in BookSerializer.Meta.fields
+    }
+
+
+def render_borrowings(
+    rows: Iterable[dict], fields: set[str], prefix: str = ""
+) -> list[dict]:
+    """
+    Builds the same data as BorrowingSerializer(many=True) from rows
+    of borrowing_values(), without the per-object field machinery.
+    """
+    rows = list(rows)
+    payments = {}
+    if "payments" in fields:
+        payments = _payments_of([row[f"{prefix}id"] for row in rows])
+
+    names = [name for name in BorrowingSerializer.Meta.fields if name in fields]
+    borrowings = []
+    for row in rows:
+        borrowing = {}
+        for name in names:
+            if name == "book":
+                borrowing[name] = _render_book(row, prefix)
+            elif name == "user":
+                borrowing[name] = row[f"{prefix}user__email"]
+            elif name == "payments":
+                borrowing[name] = payments.get(row[f"{prefix}id"], [])
+            else:
+                borrowing[name] = _represent(
+                    _BORROWING_FIELDS[name], row[prefix + name]
+                )
+        borrowings.append(borrowing)
+    return borrowings
+
+
+def render_payments(rows: Iterable[dict], fields: set[str]) -> list[dict]:
+    """
+    Builds the same data as PaymentSerializer(many=True) from rows
+    of payment_values(), without the per-object field machinery.
+    """
+    rows = list(rows)
+    borrowings = []
+    if "borrowing" in fields:
+        borrowings = render_borrowings(
+            rows, set(BorrowingSerializer.Meta.fields), prefix="borrowing__"
+        )
+
+    names = [name for name in PaymentSerializer.Meta.fields if name in fields]
+    payments = []
+    for row, borrowing in zip(rows, borrowings or [None] * len(rows)):
+        payment = {}
+        for name in names:
+            if name == "borrowing":
+                payment[name] = borrowing
+            else:
+                payment[name] = _represent(_PAYMENT_FIELDS[name], row[name])
+        payments.append(payment)
+    return payments
@@ -0,0 +1,135 @@
+import time
+from datetime import date, timedelta
+from decimal import Decimal
+
+from django.contrib.auth import get_user_model
+from django.core.management import BaseCommand
+from django.db import connection, transaction
+from django.test.utils import CaptureQueriesContext
+from rest_framework.renderers import JSONRenderer
+from rest_framework.request import Request
+from rest_framework.test import APIRequestFactory
+
+from books.models import Book
+from borrowings.fast_lists import (
+    borrowing_values,
+    payment_values,
+    render_borrowings,
+    render_payments,
+)
+from borrowings.models import Borrowing, Payment
+from borrowings.serializers import BorrowingSerializer, PaymentSerializer
+from borrowings.views import BorrowingViewSet, PaymentViewSet
+
+
+class Command(BaseCommand):
+    """
+    Django command to compare rendering borrowing and payment list pages
+    with the serializers and with the fast path from plain rows.
+    Seeded rows are rolled back when the command finishes.
+    """
+
+    help = "Benchmarks the borrowing and payment list fast path."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--borrowings", type=int, default=10_000)
+        parser.add_argument("--page-size", type=int, default=200)
+        parser.add_argument("--repeat", type=int, default=20)
+
+    def handle(self, *args, **options):
+        request = Request(APIRequestFactory().get("/"))
+        size = options["page_size"]
+
+        with transaction.atomic():
+            self._seed(options["borrowings"])
+
+            borrowings = BorrowingViewSet.queryset.order_by("-borrow_date", "-id")
+            fields = set(BorrowingSerializer.Meta.fields)
+            self._compare(
+                "Borrowings",
+                options["repeat"],
+                lambda: BorrowingSerializer(
+                    borrowings[:size], many=True, context={"request": request}
+                ).data,
+                lambda: render_borrowings(
+                    borrowing_values(borrowings, fields)[:size], fields
+                ),
+            )
+
+            payments = PaymentViewSet.queryset.order_by("-id")
+            fields = set(PaymentSerializer.Meta.fields)
+            self._compare(
+                "Payments",
+                options["repeat"],
+                lambda: PaymentSerializer(
+                    payments[:size], many=True, context={"request": request}
+                ).data,
+                lambda: render_payments(
+                    payment_values(payments, fields)[:size], fields
+                ),
+            )
+
+            transaction.set_rollback(True)
+
+    def _seed(self, count):
+        self.stdout.write(f"Seeding {count} borrowings with payments...")
+        prefix = f"list-benchmark-{time.time_ns()}"
+        users = get_user_model().objects.bulk_create(
+            get_user_model()(email=f"{prefix}-{number}@library.com")
+            for number in range(100)
+        )
+        books = Book.objects.bulk_create(
+            Book(
+                title=f"{prefix} book {number}",
+                author="Benchmark author",
+                cover=Book.Cover.SOFT,
+                inventory=5,
+                daily_fee=Decimal("0.50"),
+            )
+            for number in range(100)
+        )
+        borrowings = Borrowing.objects.bulk_create(
+            (
+                Borrowing(
+                    borrow_date=date.today() - timedelta(days=number % 365),
+                    expected_return_date=date.today() + timedelta(days=7),
+                    user=users[number % len(users)],
+                    book=books[number % len(books)],
+                )
+                for number in range(count)
+            ),
+            batch_size=5000,
+        )
+        Payment.objects.bulk_create(
+            (
+                Payment(
+                    status=Payment.Status.PAID,
+                    type=payment_type,
+                    borrowing=borrowing,
+                    to_pay=Decimal("3.50"),
+                )
+                for borrowing in borrowings
+                for payment_type in (Payment.Type.PAYMENT, Payment.Type.FINE)
+            ),
+            batch_size=5000,
+        )
+
+    def _compare(self, label, repeat, serialize, render):
+        timings = {}
+        for name, run in (("serializer", serialize), ("fast path", render)):
+            with CaptureQueriesContext(connection) as queries:
+                start = time.perf_counter()
+                for _ in range(repeat):
+                    content = JSONRenderer().render(run())
+                elapsed = (time.perf_counter() - start) / repeat
+            timings[name] = elapsed
+            self.stdout.write(
+                f"{label} ({name}): {elapsed * 1000:.1f} ms per page, "
+                f"{len(queries) // repeat} queries, {len(content) / 1024:.0f} KiB"
+            )
+
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"{label}: {timings['serializer'] / timings['fast path']:.1f}x faster"
+            )
+        )
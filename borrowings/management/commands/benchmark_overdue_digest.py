@@ -0,0 +1,75 @@
+import time
+from datetime import date, timedelta
+from decimal import Decimal
+from unittest.mock import patch
+
+from django.contrib.auth import get_user_model
+from django.core.management import BaseCommand
+from django.db import connection, transaction
+from django.test.utils import CaptureQueriesContext
+
+from books.models import Book
+from borrowings.models import Borrowing, Notification
+from borrowings.tasks import check_overdue_borrowings
+
+
+class Command(BaseCommand):
+    """
+    Django command to measure the overdue digest task on many overdue
+    borrowings. Seeded rows are rolled back when the command finishes.
+    """
+
+    help = "Benchmarks the overdue borrowings digest."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--borrowings", type=int, default=100_000)
+        parser.add_argument("--users", type=int, default=1000)
+        parser.add_argument("--books", type=int, default=1000)
+
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            self.stdout.write(f"Seeding {options['borrowings']} overdue borrowings...")
+            prefix = f"overdue-benchmark-{time.time_ns()}"
+            users = get_user_model().objects.bulk_create(
+                get_user_model()(email=f"{prefix}-{number}@library.com")
+                for number in range(options["users"])
+            )
+            books = Book.objects.bulk_create(
+                Book(
+                    title=f"{prefix} book {number}",
+                    author="Benchmark author",
+                    cover=Book.Cover.SOFT,
+                    inventory=0,
+                    daily_fee=Decimal("0.50"),
+                )
+                for number in range(options["books"])
+            )
+            expected_return_date = date.today() - timedelta(days=7)
+            Borrowing.objects.bulk_create(
+                (
+                    Borrowing(
+                        borrow_date=expected_return_date - timedelta(days=7),
+                        expected_return_date=expected_return_date,
+                        user=users[number % len(users)],
+                        book=books[number % len(books)],
+                    )
+                    for number in range(options["borrowings"])
+                ),
+                batch_size=5000,
+            )
+            sent_before = Notification.objects.count()
+
+            with patch("borrowings.messenger.CHAT_ID", "benchmark"), patch(
+                "borrowings.tasks.deliver_notifications.delay"
+            ), CaptureQueriesContext(connection) as queries:
+                start = time.perf_counter()
+                check_overdue_borrowings()
+                elapsed = time.perf_counter() - start
+
+            messages = Notification.objects.count() - sent_before
+            self.stdout.write(
+                f"Overdue digest: {elapsed:.2f} s, {len(queries)} queries, "
+                f"{messages} message(s) queued"
+            )
+
+            transaction.set_rollback(True)
@@ -1,22 +1,46 @@
-from datetime import date
+import time
+from datetime import date, timedelta
+from typing import Iterable, Iterator
 
 import requests
+from django.db import transaction
+from django.db.models import Q
+from django.utils import timezone
+from requests.adapters import HTTPAdapter
 
 from books.models import Book
+from borrowings.models import Notification
 from library_service_api.settings import TELEGRAM_TOKEN, CHAT_ID
 from users.models import User
 
+TELEGRAM_MESSAGE_LENGTH = 4096
+# Telegram allows about one message per second to the same chat
+TELEGRAM_SEND_INTERVAL = 1
+TELEGRAM_TIMEOUT = (3.05, 10)
+OVERDUE_DIGEST_MAX_MESSAGES = 5
+# Claimed messages are sent again if they are not sent within the lease
+NOTIFICATION_CLAIM_LEASE = timedelta(minutes=5)
+
+telegram_session = requests.Session()
+telegram_session.mount("https://", HTTPAdapter(pool_connections=1, pool_maxsize=4))
+
+
+class TelegramRateLimited(Exception):
+    def __init__(self, retry_after: int):
+        super().__init__(f"Too many requests, retry after {retry_after} s.")
+        self.retry_after = retry_after
+
 
 def send_notification(message: str) -> None:
     """
-    Sends a message to admin
+    Queues a message to admin. It is written to the outbox
+    in the current transaction and sent after the commit.
     """
     if CHAT_ID:
-        url = (
-            f"https://api.telegram.org/bot{TELEGRAM_TOKEN}/"
-            f"sendMessage?chat_id={CHAT_ID}&text={message}"
-        )
-        requests.get(url)
+        from borrowings.tasks import delay_on_commit, deliver_notifications
+
+        Notification.objects.create(message=message)
+        delay_on_commit(deliver_notifications)
 
 
 def send_borrowing_create_message(
@@ -29,3 +53,136 @@ def send_borrowing_create_message(
         f"{expected_return_date.strftime('%Y-%m-%d')}."
     )
     send_notification(message)
+
+
+def send_checkout_message(
+    user: User, books: list[Book], expected_return_date: date
+) -> None:
+    """Sends one message about all the books borrowed at once"""
+    titles = ", ".join(book.title for book in books)
+    message = (
+        f"User {user.email} have just borrowed {len(books)} books: {titles}. "
+        f"They are expected to be returned 'till "
+        f"{expected_return_date.strftime('%Y-%m-%d')}."
+    )
+    send_notification(message)
+
+
+def build_overdue_digest(
+    overdue_borrowings: Iterable[tuple[str, str, date]],
+    max_messages: int = OVERDUE_DIGEST_MAX_MESSAGES,
+) -> list[str]:
+    """
+    Builds the overdue digest from (user email, book title,
+    expected return date) rows. Every message fits into one Telegram message,
+    borrowings that don't fit into max_messages are only counted.
+    """
+    messages = []
+    lines = ["Overdue borrowings:"]
+    length = len(lines[0])
+    not_listed = 0
+
+    for email, title, expected_return_date in overdue_borrowings:
+        if len(messages) == max_messages:
+            not_listed += 1
+            continue
+
+        line = f"- {email}: {title} (expected {expected_return_date})"
+        if length + len(line) + 1 > TELEGRAM_MESSAGE_LENGTH:
+            messages.append("\n".join(lines))
+            lines = ["Overdue borrowings (continued):"]
+            length = len(lines[0])
+            if len(messages) == max_messages:
+                not_listed += 1
+                continue
+        lines.append(line)
+        length += len(line) + 1
+
+    if len(lines) > 1:
+        messages.append("\n".join(lines))
+    if not messages:
+        return ["There are no overdue borrowings."]
+    if not_listed:
+        messages.append(f"And {not_listed} more overdue borrowings.")
+    return messages
+
+
+def send_telegram_message(text: str) -> None:
+    response = telegram_session.post(
+        f"https://api.telegram.org/bot{TELEGRAM_TOKEN}/sendMessage",
+        data={"chat_id": CHAT_ID, "text": text[:TELEGRAM_MESSAGE_LENGTH]},
+        timeout=TELEGRAM_TIMEOUT,
+    )
+    if response.status_code == 429:
+        retry_after = response.json().get("parameters", {}).get("retry_after", 1)
+        raise TelegramRateLimited(retry_after)
+    response.raise_for_status()
+
+
+def coalesce(notifications: list[Notification]) -> Iterator[list[Notification]]:
+    """
+    Groups notifications into as few Telegram messages as possible.
+    A message longer than the Telegram limit is sent on its own.
+    """
+    group, length = [], 0
+    for notification in notifications:
+        added_length = len(notification.message) + (2 if group else 0)
+        if group and length + added_length > TELEGRAM_MESSAGE_LENGTH:
+            yield group
+            group, length = [], 0
+            added_length = len(notification.message)
+        group.append(notification)
+        length += added_length
+    if group:
+        yield group
+
+
+def claim_notifications(batch_size: int) -> list[Notification]:
+    """
+    Claims a batch of queued messages in a short transaction.
+    Rows claimed by another worker within the lease are skipped.
+    """
+    now = timezone.now()
+    with transaction.atomic():
+        notifications = list(
+            Notification.objects.filter(sent_at__isnull=True)
+            .filter(
+                Q(claimed_at__isnull=True)
+                | Q(claimed_at__lt=now - NOTIFICATION_CLAIM_LEASE)
+            )
+            .select_for_update(skip_locked=True)
+            .order_by("id")[:batch_size]
+        )
+        Notification.objects.filter(
+            id__in=[notification.id for notification in notifications]
+        ).update(claimed_at=now)
+    return notifications
+
+
+def deliver_notification_batch(batch_size: int = 100) -> bool:
+    """
+    Sends a batch of queued messages to admin, coalesced into as few
+    Telegram messages as possible. No transaction is open while Telegram
+    is called, rows are claimed before and marked as sent after every
+    message. Messages sent before a failure stay sent, the rest are
+    released for the retry. Returns whether more messages are waiting.
+    """
+    notifications = claim_notifications(batch_size)
+    unsent = [notification.id for notification in notifications]
+
+    for number, group in enumerate(coalesce(notifications)):
+        if number:
+            time.sleep(TELEGRAM_SEND_INTERVAL)
+        try:
+            send_telegram_message(
+                "\n\n".join(notification.message for notification in group)
+            )
+        except (TelegramRateLimited, requests.RequestException):
+            Notification.objects.filter(id__in=unsent).update(claimed_at=None)
+            raise
+
+        sent = [notification.id for notification in group]
+        Notification.objects.filter(id__in=sent).update(sent_at=timezone.now())
+        unsent = unsent[len(sent) :]
+
+    return len(notifications) == batch_size
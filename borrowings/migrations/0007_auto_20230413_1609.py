@@ -6,7 +6,16 @@ from django.db.migrations import RunPython
 
 def func(apps, schema_editor):
     from django.core.management import call_command
-    call_command("loaddata", "fixture_data.json")
+    from django.core.serializers import python
+
+    # Load the fixture with the historical models, so it keeps matching
+    # the tables of this migration when new fields are added to the models.
+    real_apps = python.apps
+    python.apps = apps
+    try:
+        call_command("loaddata", "fixture_data.json")
+    finally:
+        python.apps = real_apps
 
 
 def reverse_func(apps, schema_editor):
@@ -18,6 +27,7 @@ class Migration(migrations.Migration):
         ("borrowings", "0006_alter_payment_session_id_alter_payment_session_url"),
         ("sessions", "0001_initial"),
         ("django_celery_beat", "0018_improve_crontab_helptext"),
+        ("admin", "0003_logentry_add_action_flag_choices"),
     ]
 
     operations = [RunPython(func, reverse_func)]
@@ -0,0 +1,71 @@
+# Generated by Django 4.1.7 on 2026-10-16 23:05
+
+from django.contrib.postgres.operations import AddIndexConcurrently
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    atomic = False
+
+    dependencies = [
+        ("borrowings", "0009_payment_expires_at"),
+    ]
+
+    operations = [
+        AddIndexConcurrently(
+            model_name="borrowing",
+            index=models.Index(
+                fields=["user", "actual_return_date"],
+                name="borrowing_user_returned_idx",
+            ),
+        ),
+        AddIndexConcurrently(
+            model_name="borrowing",
+            index=models.Index(
+                condition=models.Q(("actual_return_date__isnull", True)),
+                fields=["expected_return_date"],
+                name="borrowing_active_expected_idx",
+            ),
+        ),
+        AddIndexConcurrently(
+            model_name="payment",
+            index=models.Index(
+                fields=["borrowing", "status"],
+                name="payment_borrowing_status_idx",
+            ),
+        ),
+        # The unique index is built without blocking writes,
+        # then the constraint takes it over with a short lock
+        migrations.SeparateDatabaseAndState(
+            database_operations=[
+                migrations.RunSQL(
+                    sql=(
+                        "CREATE UNIQUE INDEX CONCURRENTLY payment_session_id_unique "
+                        "ON borrowings_payment (session_id)"
+                    ),
+                    reverse_sql=(
+                        "DROP INDEX CONCURRENTLY IF EXISTS payment_session_id_unique"
+                    ),
+                ),
+                migrations.RunSQL(
+                    sql=(
+                        "ALTER TABLE borrowings_payment "
+                        "ADD CONSTRAINT payment_session_id_unique "
+                        "UNIQUE USING INDEX payment_session_id_unique"
+                    ),
+                    reverse_sql=(
+                        "ALTER TABLE borrowings_payment "
+                        "DROP CONSTRAINT payment_session_id_unique"
+                    ),
+                ),
+            ],
+            state_operations=[
+                migrations.AddConstraint(
+                    model_name="payment",
+                    constraint=models.UniqueConstraint(
+                        fields=("session_id",), name="payment_session_id_unique"
+                    ),
+                ),
+            ],
+        ),
+    ]
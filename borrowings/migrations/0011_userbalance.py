@@ -0,0 +1,58 @@
+# Generated by Django 4.1.7 on 2026-10-16 22:54
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+def fill_balances(apps, schema_editor):
+    Payment = apps.get_model("borrowings", "Payment")
+    UserBalance = apps.get_model("borrowings", "UserBalance")
+
+    unpaid = (
+        Payment.objects.exclude(status="PAID")
+        .values("borrowing__user")
+        .annotate(count=models.Count("id"), total=models.Sum("to_pay"))
+    )
+    UserBalance.objects.bulk_create(
+        (
+            UserBalance(
+                user_id=row["borrowing__user"],
+                unpaid_payments=row["count"],
+                outstanding=row["total"],
+            )
+            for row in unpaid.iterator()
+        ),
+        batch_size=1000,
+    )
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("users", "0001_initial"),
+        ("borrowings", "0010_borrowing_payment_indexes"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="UserBalance",
+            fields=[
+                (
+                    "user",
+                    models.OneToOneField(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        primary_key=True,
+                        related_name="balance",
+                        serialize=False,
+                        to=settings.AUTH_USER_MODEL,
+                    ),
+                ),
+                ("unpaid_payments", models.PositiveIntegerField(default=0)),
+                (
+                    "outstanding",
+                    models.DecimalField(decimal_places=2, default=0, max_digits=10),
+                ),
+            ],
+        ),
+        migrations.RunPython(fill_balances, migrations.RunPython.noop),
+    ]
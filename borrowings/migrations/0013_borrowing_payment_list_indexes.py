@@ -0,0 +1,43 @@
+# Generated by Django 4.1.7 on 2026-10-16 23:00
+
+from django.contrib.postgres.operations import AddIndexConcurrently
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    atomic = False
+
+    dependencies = [
+        ("borrowings", "0012_payment_session_id_idx"),
+    ]
+
+    operations = [
+        AddIndexConcurrently(
+            model_name="borrowing",
+            index=models.Index(
+                fields=["borrow_date", "id"], name="borrowing_borrow_date_idx"
+            ),
+        ),
+        AddIndexConcurrently(
+            model_name="borrowing",
+            index=models.Index(
+                condition=models.Q(("actual_return_date__isnull", True)),
+                fields=["borrow_date", "id"],
+                name="borrowing_active_borrowed_idx",
+            ),
+        ),
+        AddIndexConcurrently(
+            model_name="borrowing",
+            index=models.Index(
+                fields=["actual_return_date"], name="borrowing_returned_date_idx"
+            ),
+        ),
+        AddIndexConcurrently(
+            model_name="payment",
+            index=models.Index(fields=["status", "id"], name="payment_status_id_idx"),
+        ),
+        AddIndexConcurrently(
+            model_name="payment",
+            index=models.Index(fields=["type", "id"], name="payment_type_id_idx"),
+        ),
+    ]
@@ -0,0 +1,29 @@
+# Generated by Django 4.1.7 on 2026-10-16 23:40
+
+import django.utils.timezone
+from django.contrib.postgres.operations import AddIndexConcurrently
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    atomic = False
+
+    dependencies = [
+        ("borrowings", "0013_borrowing_payment_list_indexes"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="payment",
+            name="created_at",
+            field=models.DateTimeField(default=django.utils.timezone.now),
+        ),
+        AddIndexConcurrently(
+            model_name="payment",
+            index=models.Index(
+                condition=models.Q(("session_id__isnull", True), ("status", "PENDING")),
+                fields=["created_at"],
+                name="payment_missing_session_idx",
+            ),
+        ),
+    ]
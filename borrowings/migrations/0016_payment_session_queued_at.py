@@ -0,0 +1,36 @@
+# Generated by Django 4.1.7 on 2026-10-17 10:20
+
+import django.utils.timezone
+from django.contrib.postgres.operations import (
+    AddIndexConcurrently,
+    RemoveIndexConcurrently,
+)
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    atomic = False
+
+    dependencies = [
+        ("borrowings", "0015_notification_claimed_at"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="payment",
+            name="session_queued_at",
+            field=models.DateTimeField(default=django.utils.timezone.now),
+        ),
+        RemoveIndexConcurrently(
+            model_name="payment",
+            name="payment_missing_session_idx",
+        ),
+        AddIndexConcurrently(
+            model_name="payment",
+            index=models.Index(
+                condition=models.Q(("session_id__isnull", True), ("status", "PENDING")),
+                fields=["session_queued_at"],
+                name="payment_missing_session_idx",
+            ),
+        ),
+    ]
@@ -1,5 +1,6 @@
 from django.db import models
 from django.db.models import DO_NOTHING, Q, F
+from django.utils import timezone
 from django.utils.translation import gettext_lazy as _
 
 from books.models import Book
@@ -23,6 +24,28 @@ class Borrowing(models.Model):
                 ),
             )
         ]
+        indexes = [
+            models.Index(
+                fields=["user", "actual_return_date"],
+                name="borrowing_user_returned_idx",
+            ),
+            models.Index(
+                fields=["expected_return_date"],
+                name="borrowing_active_expected_idx",
+                condition=Q(actual_return_date__isnull=True),
+            ),
+            models.Index(
+                fields=["borrow_date", "id"], name="borrowing_borrow_date_idx"
+            ),
+            models.Index(
+                fields=["borrow_date", "id"],
+                name="borrowing_active_borrowed_idx",
+                condition=Q(actual_return_date__isnull=True),
+            ),
+            models.Index(
+                fields=["actual_return_date"], name="borrowing_returned_date_idx"
+            ),
+        ]
 
     def __str__(self):
         return (
@@ -49,9 +72,78 @@ class Payment(models.Model):
     session_url = models.CharField(max_length=500, null=True, blank=True)
     session_id = models.CharField(max_length=500, null=True, blank=True)
     to_pay = models.DecimalField(decimal_places=2, max_digits=4)
+    expires_at = models.DateTimeField(null=True, blank=True)
+    created_at = models.DateTimeField(default=timezone.now)
+    # When a checkout session task was last queued for the payment
+    session_queued_at = models.DateTimeField(default=timezone.now)
+
+    class Meta:
+        indexes = [
+            # Pending payments whose checkout session task was lost
+            models.Index(
+                fields=["session_queued_at"],
+                name="payment_missing_session_idx",
+                condition=Q(status="PENDING", session_id__isnull=True),
+            ),
+            # Payments of a multi-book checkout share one session
+            models.Index(fields=["session_id"], name="payment_session_id_idx"),
+            models.Index(
+                fields=["expires_at"],
+                name="payment_pending_expires_idx",
+                condition=Q(status="PENDING"),
+            ),
+            models.Index(
+                fields=["borrowing", "status"],
+                name="payment_borrowing_status_idx",
+            ),
+            models.Index(fields=["status", "id"], name="payment_status_id_idx"),
+            models.Index(fields=["type", "id"], name="payment_type_id_idx"),
+        ]
 
     def __str__(self):
         return (
             f"{self.status}: {self.get_type_display()} of {self.to_pay} "
             f"dollars for the {self.borrowing}"
         )
+
+
+class Notification(models.Model):
+    """
+    Outbox of admin Telegram messages. Rows are written in the same
+    transaction as the change they describe and sent by a Celery task.
+    A worker claims rows before sending them, the claim lapses
+    if the worker dies before they are sent.
+    """
+
+    message = models.TextField()
+    created_at = models.DateTimeField(auto_now_add=True)
+    claimed_at = models.DateTimeField(null=True, blank=True)
+    sent_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        indexes = [
+            models.Index(
+                fields=["id"],
+                name="notification_unsent_idx",
+                condition=Q(sent_at__isnull=True),
+            )
+        ]
+
+    def __str__(self):
+        return self.message
+
+
+class UserBalance(models.Model):
+    """
+    Unpaid payments of a user, kept up to date with every payment
+    so checkout doesn't have to count them.
+    """
+
+    user = models.OneToOneField(
+        User, on_delete=models.CASCADE, primary_key=True, related_name="balance"
+    )
+    unpaid_payments = models.PositiveIntegerField(default=0)
+    outstanding = models.DecimalField(max_digits=10, decimal_places=2, default=0)
+
+    def __str__(self):
+        return f"{self.user.email}: {self.outstanding} dollars unpaid"
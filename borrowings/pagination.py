@@ -0,0 +1,25 @@
+from rest_framework.pagination import CursorPagination
+
+from library_service_api.pagination import KeysetCursorPagination
+
+
+class BorrowingCursorPagination(KeysetCursorPagination):
+    """
+    Keyset pagination over borrowings, the latest ones first
+    (id as tie-breaker). Pages are index range scans on (borrow_date, id),
+    with no OFFSET and no COUNT(*), also within one borrow date.
+    """
+
+    ordering = ("-borrow_date", "-id")
+    page_size = 50
+    page_size_query_param = "page_size"
+    max_page_size = 200
+
+
+class PaymentCursorPagination(CursorPagination):
+    """Keyset pagination over payments, the latest ones first"""
+
+    ordering = ("-id",)
+    page_size = 50
+    page_size_query_param = "page_size"
+    max_page_size = 200
@@ -1,23 +1,75 @@
-from datetime import timedelta
+from collections import Counter, defaultdict
 from decimal import Decimal
 
 from django.db import transaction
-from django.db.models import Q
+from django.urls import reverse
 from rest_framework import serializers
 
+from books.inventory import adjust_inventory, return_copy, take_copies, take_copy
+from books.models import Book
 from books.serializers import BookSerializer
-from borrowings.messenger import send_borrowing_create_message
+from borrowings.balance import charge, has_unpaid_payments
+from borrowings.messenger import send_borrowing_create_message, send_checkout_message
 from borrowings.models import Borrowing, Payment
-from borrowings.stripe import create_stripe_session, FINE_MULTIPLIER
+from borrowings.stripe import (
+    calculate_to_pay,
+    create_stripe_session,
+    session_expires_at,
+)
+from borrowings.tasks import create_checkout_session, delay_on_commit
 from library_service_api.settings import STRIPE_PUBLIC_KEY
+from library_service_api.sparse_fieldsets import SparseFieldsetMixin
+
+
+def create_pending_payments(request, payments: list[Payment]) -> list[Payment]:
+    """
+    Creates pending payments without a Stripe session.
+    One session per user is created by a Celery task once the payments
+    are committed, clients get its url from the payment endpoint.
+    """
+    payments = Payment.objects.bulk_create(payments)
+
+    payments_by_user = defaultdict(list)
+    for payment in payments:
+        payments_by_user[payment.borrowing.user_id].append(payment)
+
+    abs_url = request.build_absolute_uri(reverse("borrowings:borrowing-list"))
+    for user_id, user_payments in payments_by_user.items():
+        charge(
+            user_id,
+            sum(payment.to_pay for payment in user_payments),
+            payments=len(user_payments),
+        )
+        if STRIPE_PUBLIC_KEY:
+            payment_ids = [payment.id for payment in user_payments]
+            delay_on_commit(create_checkout_session, payment_ids, abs_url)
+
+    return payments
+
+
+def create_pending_payment(
+    request, borrowing: Borrowing, payment_type: str, to_pay: Decimal
+) -> Payment:
+    payment = Payment(
+        status="PENDING", type=payment_type, borrowing=borrowing, to_pay=to_pay
+    )
+    return create_pending_payments(request, [payment])[0]
+
 
+class BorrowingPaymentSerializer(serializers.ModelSerializer):
+    """Payment inside a borrowing, built from the payment row only"""
 
-class BorrowingSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = Payment
+        fields = ("id", "status", "type", "to_pay")
+
+
+class BorrowingSerializer(SparseFieldsetMixin, serializers.ModelSerializer):
     borrow_date = serializers.DateField(required=True)
     expected_return_date = serializers.DateField(required=True)
     book = BookSerializer()
     user = serializers.CharField()
-    payments = serializers.StringRelatedField(many=True)
+    payments = BorrowingPaymentSerializer(many=True, read_only=True)
 
     class Meta:
         model = Borrowing
@@ -33,14 +85,31 @@ class BorrowingSerializer(serializers.ModelSerializer):
         read_only_fields = ("payments",)
 
 
+class BorrowingFilterSerializer(serializers.Serializer):
+    is_active = serializers.BooleanField(required=False)
+    user_id = serializers.IntegerField(required=False)
+    borrowed_after = serializers.DateField(required=False)
+    borrowed_before = serializers.DateField(required=False)
+    returned_after = serializers.DateField(required=False)
+    returned_before = serializers.DateField(required=False)
+
+
 class BorrowingCreateSerializer(serializers.ModelSerializer):
     borrow_date = serializers.DateField(required=True)
     expected_return_date = serializers.DateField(required=True)
     user = serializers.HiddenField(default=serializers.CurrentUserDefault())
+    payments = serializers.PrimaryKeyRelatedField(many=True, read_only=True)
 
     class Meta:
         model = Borrowing
-        fields = ("id", "borrow_date", "expected_return_date", "book", "user")
+        fields = (
+            "id",
+            "borrow_date",
+            "expected_return_date",
+            "book",
+            "user",
+            "payments",
+        )
 
     def validate(self, data):
         """
@@ -52,10 +121,7 @@ class BorrowingCreateSerializer(serializers.ModelSerializer):
             raise serializers.ValidationError(
                 "Borrow date cannot be after return date."
             )
-        user_payments_unpaid = Payment.objects.filter(
-            Q(borrowing__user=data["user"]) & ~Q(status="PAID")
-        )
-        if user_payments_unpaid:
+        if has_unpaid_payments(data["user"].id):
             raise serializers.ValidationError(
                 "Make sure you paid your previous borrowings "
                 "and fines before creating new borrowing."
@@ -65,36 +131,23 @@ class BorrowingCreateSerializer(serializers.ModelSerializer):
 
     def create(self, validated_data):
         with transaction.atomic():
+            book = validated_data["book"]
+            if not take_copy(book.id):
+                raise serializers.ValidationError(
+                    {"book": "There are no copies of this book left."}
+                )
             borrowing = Borrowing.objects.create(**validated_data)
-            book = borrowing.book
-            book.inventory -= 1
-            book.save()
 
-            if STRIPE_PUBLIC_KEY:
-                session = create_stripe_session(
+            create_pending_payment(
+                self.context["request"],
+                borrowing,
+                Payment.Type.PAYMENT,
+                calculate_to_pay(
                     borrowing,
-                    self.context["request"].build_absolute_uri(),
                     borrowing.borrow_date,
                     borrowing.expected_return_date,
                     is_fine=False,
-                )
-            else:
-                session = {
-                    "url": None,
-                    "id": None,
-                    "amount_total": (
-                        borrowing.expected_return_date - borrowing.borrow_date
-                    ).days
-                    * borrowing.book.daily_fee
-                    * 100,
-                }
-            Payment.objects.create(
-                status="PENDING",
-                type="PAYMENT",
-                borrowing=borrowing,
-                session_url=session["url"],
-                session_id=session["id"],
-                to_pay=Decimal(session["amount_total"] / 100),
+                ),
             )
 
             send_borrowing_create_message(
@@ -104,6 +157,84 @@ class BorrowingCreateSerializer(serializers.ModelSerializer):
             return borrowing
 
 
+class BorrowingCheckoutSerializer(BorrowingCreateSerializer):
+    books = serializers.PrimaryKeyRelatedField(
+        many=True, queryset=Book.objects.only("id", "title", "daily_fee")
+    )
+    borrowings = serializers.ListField(child=serializers.IntegerField(), read_only=True)
+    payments = serializers.ListField(child=serializers.IntegerField(), read_only=True)
+
+    max_books = 10
+
+    class Meta:
+        model = Borrowing
+        fields = (
+            "borrow_date",
+            "expected_return_date",
+            "books",
+            "user",
+            "borrowings",
+            "payments",
+        )
+
+    def validate_books(self, value):
+        """Validates that every book is borrowed once and the cart is not too big"""
+        if not value:
+            raise serializers.ValidationError("Choose at least one book.")
+        if len(value) > self.max_books:
+            raise serializers.ValidationError(
+                f"No more than {self.max_books} books can be borrowed at once."
+            )
+        if len({book.id for book in value}) != len(value):
+            raise serializers.ValidationError("Every book can be borrowed only once.")
+        return value
+
+    def create(self, validated_data):
+        books = validated_data["books"]
+        with transaction.atomic():
+            if not take_copies([book.id for book in books]):
+                raise serializers.ValidationError(
+                    {"books": "There are no copies of some of these books left."}
+                )
+            borrowings = Borrowing.objects.bulk_create(
+                Borrowing(
+                    borrow_date=validated_data["borrow_date"],
+                    expected_return_date=validated_data["expected_return_date"],
+                    book=book,
+                    user=validated_data["user"],
+                )
+                for book in books
+            )
+
+            payments = create_pending_payments(
+                self.context["request"],
+                [
+                    Payment(
+                        status="PENDING",
+                        type=Payment.Type.PAYMENT,
+                        borrowing=borrowing,
+                        to_pay=calculate_to_pay(
+                            borrowing,
+                            borrowing.borrow_date,
+                            borrowing.expected_return_date,
+                            is_fine=False,
+                        ),
+                    )
+                    for borrowing in borrowings
+                ],
+            )
+
+            send_checkout_message(
+                validated_data["user"], books, validated_data["expected_return_date"]
+            )
+
+        return {
+            **validated_data,
+            "borrowings": [borrowing.id for borrowing in borrowings],
+            "payments": [payment.id for payment in payments],
+        }
+
+
 class BorrowingReturnSerializer(serializers.ModelSerializer):
     class Meta:
         model = Borrowing
@@ -125,46 +256,105 @@ class BorrowingReturnSerializer(serializers.ModelSerializer):
         return value
 
     def update(self, instance, validated_data):
-        was_not_returned = instance.actual_return_date
-        if not was_not_returned:
-            instance.book.inventory += 1
-            instance.book.save()
-        instance.actual_return_date = validated_data["actual_return_date"]
-        instance.save()
-
-        if instance.actual_return_date - instance.expected_return_date > timedelta(0):
-            if STRIPE_PUBLIC_KEY:
-                session = create_stripe_session(
+        with transaction.atomic():
+            was_not_returned = instance.actual_return_date
+            if not was_not_returned:
+                return_copy(instance.book_id)
+            instance.actual_return_date = validated_data["actual_return_date"]
+            instance.save()
+
+            if instance.actual_return_date > instance.expected_return_date:
+                create_pending_payment(
+                    self.context["request"],
                     instance,
-                    self.context["request"].build_absolute_uri(),
-                    instance.expected_return_date,
-                    instance.actual_return_date,
-                    is_fine=True,
+                    Payment.Type.FINE,
+                    calculate_to_pay(
+                        instance,
+                        instance.expected_return_date,
+                        instance.actual_return_date,
+                        is_fine=True,
+                    ),
                 )
-            else:
-                session = {
-                    "url": None,
-                    "id": None,
-                    "amount_total": (
-                        instance.actual_return_date - instance.expected_return_date
-                    ).days
-                    * instance.book.daily_fee
-                    * FINE_MULTIPLIER
-                    * 100,
-                }
-            Payment.objects.create(
-                status="PENDING",
-                type="FINE",
-                borrowing=instance,
-                session_url=session["url"],
-                session_id=session["id"],
-                to_pay=Decimal(session["amount_total"] / 100),
-            )
 
         return instance
 
 
-class PaymentSerializer(serializers.ModelSerializer):
+class BorrowingBulkReturnSerializer(serializers.Serializer):
+    borrowings = serializers.ListField(
+        child=serializers.IntegerField(), allow_empty=False, max_length=500
+    )
+    actual_return_date = serializers.DateField()
+    fines = serializers.ListField(child=serializers.IntegerField(), read_only=True)
+
+    def validate_borrowings(self, value):
+        if len(set(value)) != len(value):
+            raise serializers.ValidationError(
+                "Every borrowing can be returned only once per request."
+            )
+        return value
+
+    def create(self, validated_data):
+        borrowing_ids = validated_data["borrowings"]
+        actual_return_date = validated_data["actual_return_date"]
+
+        with transaction.atomic():
+            borrowings = list(
+                Borrowing.objects.select_for_update(of=("self",))
+                .select_related("book", "user")
+                .filter(id__in=borrowing_ids, actual_return_date__isnull=True)
+            )
+            not_returnable = set(borrowing_ids) - {
+                borrowing.id for borrowing in borrowings
+            }
+            if not_returnable:
+                raise serializers.ValidationError(
+                    {
+                        "borrowings": f"Borrowings with ids {sorted(not_returnable)} "
+                        f"do not exist or were already returned."
+                    }
+                )
+            if any(
+                borrowing.borrow_date > actual_return_date for borrowing in borrowings
+            ):
+                raise serializers.ValidationError(
+                    {"actual_return_date": "Borrow date cannot be after return date."}
+                )
+
+            Borrowing.objects.filter(id__in=borrowing_ids).update(
+                actual_return_date=actual_return_date
+            )
+            returned_copies = Counter(borrowing.book_id for borrowing in borrowings)
+            adjust_inventory(
+                [
+                    {"id": book_id, "delta": copies}
+                    for book_id, copies in returned_copies.items()
+                ]
+            )
+
+            fines = []
+            for borrowing in borrowings:
+                borrowing.actual_return_date = actual_return_date
+                if actual_return_date > borrowing.expected_return_date:
+                    fines.append(
+                        Payment(
+                            status="PENDING",
+                            type=Payment.Type.FINE,
+                            borrowing=borrowing,
+                            to_pay=calculate_to_pay(
+                                borrowing,
+                                borrowing.expected_return_date,
+                                actual_return_date,
+                                is_fine=True,
+                            ),
+                        )
+                    )
+            if fines:
+                fines = create_pending_payments(self.context["request"], fines)
+
+        return {**validated_data, "fines": [fine.id for fine in fines]}
+
+
+class PaymentSerializer(SparseFieldsetMixin, serializers.ModelSerializer):
     borrowing = BorrowingSerializer()
 
     class Meta:
@@ -181,6 +371,11 @@ class PaymentSerializer(serializers.ModelSerializer):
         read_only_fields = ("session_url", "session_id")
 
 
+class PaymentFilterSerializer(serializers.Serializer):
+    status = serializers.ChoiceField(choices=Payment.Status.choices, required=False)
+    type = serializers.ChoiceField(choices=Payment.Type.choices, required=False)
+
+
 class PaymentRenewSerializer(serializers.ModelSerializer):
     class Meta:
         model = Payment
@@ -210,6 +405,7 @@ class PaymentRenewSerializer(serializers.ModelSerializer):
 
             instance.session_id = session["id"]
             instance.session_url = session["url"]
+            instance.expires_at = session_expires_at(session)
             instance.status = "PENDING"
             instance.save()
 
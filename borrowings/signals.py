@@ -0,0 +1,59 @@
+from decimal import Decimal
+from typing import Optional
+
+from django.db.models.signals import post_delete, post_save, pre_save
+from django.dispatch import receiver
+
+from borrowings.balance import charge, settle
+from borrowings.models import Payment
+
+BALANCE_FIELDS = {"status", "to_pay", "borrowing"}
+
+
+def _owed(user_id: int, status: str, to_pay: Decimal) -> Optional[tuple]:
+    """User and amount the payment adds to the balance, None when it is paid"""
+    if status == Payment.Status.PAID:
+        return None
+    return user_id, to_pay
+
+
+@receiver(pre_save, sender=Payment)
+def remember_owed_amount(sender, instance, update_fields=None, **kwargs) -> None:
+    """Keeps what the row added to the balance before it is saved"""
+    instance._balance_changes = update_fields is None or bool(
+        BALANCE_FIELDS & set(update_fields)
+    )
+    instance._owed_before = None
+    if instance._balance_changes and not instance._state.adding:
+        row = (
+            Payment.objects.filter(pk=instance.pk)
+            .values_list("borrowing__user_id", "status", "to_pay")
+            .first()
+        )
+        instance._owed_before = row and _owed(*row)
+
+
+@receiver(post_save, sender=Payment)
+def update_balance_on_save(sender, instance, **kwargs) -> None:
+    """
+    Charges or settles the balance whenever a saved payment becomes
+    unpaid or paid, whoever saves it (ex. an admin). Payments made with
+    bulk_create() send no signals, create_pending_payments() charges them.
+    """
+    if not instance._balance_changes:
+        return
+
+    owed = _owed(instance.borrowing.user_id, instance.status, instance.to_pay)
+    if owed == instance._owed_before:
+        return
+    if instance._owed_before:
+        settle(*instance._owed_before)
+    if owed:
+        charge(*owed)
+
+
+@receiver(post_delete, sender=Payment)
+def settle_deleted_payment(sender, instance, **kwargs) -> None:
+    """A deleted unpaid payment is no longer owed"""
+    if instance.status != Payment.Status.PAID:
+        settle(instance.borrowing.user_id, instance.to_pay)
@@ -1,14 +1,58 @@
-from datetime import date
+import hashlib
+from datetime import date, datetime, timezone
+from decimal import Decimal
+from typing import Optional
 
 import stripe
 from django.conf import settings
+from django.db import transaction
 
-from borrowings.models import Borrowing
+from borrowings.messenger import send_notification
+from borrowings.models import Borrowing, Payment
 
 FINE_MULTIPLIER = 2
 stripe.api_key = settings.STRIPE_SECRET_KEY
 
 
+def calculate_to_pay(
+    borrowing: Borrowing, start_date: date, end_date: date, is_fine: bool
+) -> Decimal:
+    to_pay = (end_date - start_date).days * borrowing.book.daily_fee
+    if is_fine:
+        to_pay *= FINE_MULTIPLIER
+    return to_pay
+
+
+def _line_item(borrowing: Borrowing, to_pay: Decimal, is_fine: bool) -> dict:
+    product = "Fine for " if is_fine else ""
+    return {
+        "price_data": {
+            "currency": "usd",
+            "unit_amount": int(to_pay * 100),
+            "product_data": {
+                "name": product + str(borrowing),
+            },
+        },
+        "quantity": 1,
+    }
+
+
+def _checkout_session(
+    borrowing: Borrowing,
+    abs_url: str,
+    line_items: list[dict],
+    idempotency_key: Optional[str] = None,
+) -> stripe.checkout.Session:
+    abs_url = abs_url.rsplit("/", 2)[0] + "/borrowings/" + str(borrowing.id)
+    return stripe.checkout.Session.create(
+        line_items=line_items,
+        mode="payment",
+        success_url=abs_url + "/success?session_id={CHECKOUT_SESSION_ID}",
+        cancel_url=abs_url + "/cancel?session_id={CHECKOUT_SESSION_ID}",
+        idempotency_key=idempotency_key,
+    )
+
+
 def create_stripe_session(
     borrowing: Borrowing,
     abs_url: str,
@@ -16,29 +60,61 @@ def create_stripe_session(
     end_date: date,
     is_fine: bool,
 ) -> stripe.checkout.Session:
-    to_pay = (end_date - start_date).days * borrowing.book.daily_fee
-    product = ""
-    if is_fine:
-        to_pay *= FINE_MULTIPLIER
-        product = "Fine for "
+    to_pay = calculate_to_pay(borrowing, start_date, end_date, is_fine)
+    return _checkout_session(
+        borrowing, abs_url, [_line_item(borrowing, to_pay, is_fine)]
+    )
 
-    abs_url = abs_url.rsplit("/", 2)[0] + "/borrowings/" + str(borrowing.id)
-    checkout_session = stripe.checkout.Session.create(
-        line_items=[
-            {
-                "price_data": {
-                    "currency": "usd",
-                    "unit_amount": int(to_pay * 100),
-                    "product_data": {
-                        "name": product + str(borrowing),
-                    },
-                },
-                "quantity": 1,
-            },
+
+def create_payments_session(
+    payments: list[Payment], abs_url: str
+) -> stripe.checkout.Session:
+    """
+    Creates one checkout session for all the payments, a line item per payment.
+    Stripe redirects back to the borrowing of the first payment.
+    Stripe returns the same session for the same payments and url
+    within a day instead of creating another one.
+    """
+    key = f"{abs_url}:" + ",".join(str(payment.id) for payment in payments)
+    return _checkout_session(
+        payments[0].borrowing,
+        abs_url,
+        [
+            _line_item(payment.borrowing, payment.to_pay, payment.type == "FINE")
+            for payment in payments
         ],
-        mode="payment",
-        success_url=abs_url + "/success?session_id={CHECKOUT_SESSION_ID}",
-        cancel_url=abs_url + "/cancel?session_id={CHECKOUT_SESSION_ID}",
+        idempotency_key="checkout-" + hashlib.sha256(key.encode()).hexdigest(),
     )
 
-    return checkout_session
+
+def session_expires_at(session: stripe.checkout.Session) -> datetime:
+    return datetime.fromtimestamp(session["expires_at"], tz=timezone.utc)
+
+
+def mark_session_paid(session_id: str) -> int:
+    """
+    Marks payments of the checkout session as paid and notifies admin.
+    Payments that are already paid are left as they are,
+    so repeated events change nothing.
+    """
+    with transaction.atomic():
+        payments = list(
+            Payment.objects.select_for_update(of=("self",))
+            .select_related("borrowing__book", "borrowing__user")
+            .filter(session_id=session_id)
+            .exclude(status="PAID")
+        )
+        for payment in payments:
+            payment.status = "PAID"
+            # The balance is settled by the post_save signal
+            payment.save(update_fields=["status"])
+            send_notification(f"{payment} was paid.")
+
+    return len(payments)
+
+
+def mark_session_expired(session_id: str) -> int:
+    """Marks pending payments of the checkout session as expired"""
+    return Payment.objects.filter(session_id=session_id, status="PENDING").update(
+        status="EXPIRED"
+    )
@@ -1,50 +1,181 @@
-import time
+import logging
 from datetime import date, timedelta
 
+import requests
 import stripe
-from celery import shared_task
+from celery import Task, shared_task
+from django.db import transaction
+from django.urls import reverse
+from django.utils import timezone
 
-from borrowings.messenger import send_notification
+from borrowings.messenger import (
+    TelegramRateLimited,
+    build_overdue_digest,
+    deliver_notification_batch,
+    send_notification,
+)
 from borrowings.models import Payment, Borrowing
-from library_service_api.settings import STRIPE_PUBLIC_KEY
+from borrowings.stripe import create_payments_session, session_expires_at
+from library_service_api.settings import SITE_URL, STRIPE_PUBLIC_KEY
+
+CHECKOUT_SESSION_RETRIES = 10
+CHECKOUT_SESSION_BACKOFF_MAX = 10 * 60
+# Longer than create_checkout_session keeps retrying (backoff adds up
+# to about 17 minutes), so a payment is never queued twice at once
+MISSING_SESSION_AFTER = timedelta(hours=1)
+
+logger = logging.getLogger(__name__)
+
+
+def delay_on_commit(task: Task, *args) -> None:
+    """
+    Queues the task once the current transaction is committed.
+    A broker failure is only logged: the data is already committed,
+    the periodic tasks pick it up, and the request must not fail
+    after its changes were saved.
+    """
+
+    def publish() -> None:
+        try:
+            task.delay(*args)
+        except Exception:
+            logger.exception("Could not queue %s", task.name)
+
+    transaction.on_commit(publish)
 
 
 @shared_task
 def check_overdue_borrowings() -> None:
     """
-    Sends a message about overdue borrowings to admin
+    Sends a digest of overdue borrowings to admin.
+    Borrowings are read with one query in chunks.
     """
-    overdue_borrowings = Borrowing.objects.filter(
-        actual_return_date__isnull=True,
-        expected_return_date__lte=date.today() + timedelta(days=1),
+    overdue_borrowings = (
+        Borrowing.objects.filter(
+            actual_return_date__isnull=True,
+            expected_return_date__lte=date.today() + timedelta(days=1),
+        )
+        .order_by("expected_return_date", "id")
+        .values_list("user__email", "book__title", "expected_return_date")
+        .iterator(chunk_size=2000)
     )
-    if overdue_borrowings:
-        for borrowing in overdue_borrowings:
-            message = (
-                f"User {borrowing.user.email} haven't returned the "
-                f"{borrowing.book.title} book yet."
-                f"Expected return date for this borrowing is "
-                f"{borrowing.expected_return_date}."
-            )
+    with transaction.atomic():
+        for message in build_overdue_digest(overdue_borrowings):
             send_notification(message)
-    else:
-        message = "There are no overdue borrowings."
-        send_notification(message)
 
 
 @shared_task
-def check_expired_payment_sessions() -> None:
+def check_expired_payment_sessions(reconcile_batch_size: int = 100) -> None:
     """
-    For pending payments checks if the session is expired
-    and marks payment as expired
+    Marks pending payments with expired sessions as expired
+    in one UPDATE. Stripe is only asked about payments created before
+    the expiry time was stored, a batch per run.
     """
+    Payment.objects.filter(status="PENDING", expires_at__lt=timezone.now()).update(
+        status="EXPIRED"
+    )
+
     if STRIPE_PUBLIC_KEY:
-        now = time.time()
-        pending_payments = Payment.objects.filter(status="PENDING")
-        for payment in pending_payments:
-            expires_at = stripe.checkout.Session.retrieve(payment.session_id)[
-                "expires_at"
-            ]
-            if now > expires_at:
+        legacy_payments = Payment.objects.filter(
+            status="PENDING", expires_at__isnull=True, session_id__isnull=False
+        )[:reconcile_batch_size]
+        for payment in legacy_payments:
+            session = stripe.checkout.Session.retrieve(payment.session_id)
+            payment.expires_at = session_expires_at(session)
+            if payment.expires_at < timezone.now():
                 payment.status = "EXPIRED"
-                payment.save()
+            payment.save(update_fields=["expires_at", "status"])
+
+
+@shared_task(
+    autoretry_for=(stripe.error.StripeError,),
+    retry_backoff=True,
+    retry_backoff_max=CHECKOUT_SESSION_BACKOFF_MAX,
+    retry_jitter=True,
+    max_retries=CHECKOUT_SESSION_RETRIES,
+)
+def create_checkout_session(payment_ids: list[int], abs_url: str) -> None:
+    """
+    Creates one Stripe checkout session for the pending payments
+    that don't have one yet. Runs after the payments are committed,
+    so no database rows are locked during the call to Stripe.
+    Failed calls to Stripe are retried with exponential backoff,
+    Stripe answers a retried call with the session it has already made.
+    A session is never stored over another one, so the session
+    a user could have paid is kept.
+    """
+    payments = list(
+        Payment.objects.filter(
+            id__in=payment_ids, status="PENDING", session_id__isnull=True
+        )
+        .select_related("borrowing__book", "borrowing__user")
+        .order_by("id")
+    )
+    if not payments:
+        return
+
+    session = create_payments_session(payments, abs_url)
+    Payment.objects.filter(
+        id__in=[payment.id for payment in payments], session_id__isnull=True
+    ).update(
+        session_id=session["id"],
+        session_url=session["url"],
+        expires_at=session_expires_at(session),
+    )
+
+
+@shared_task
+def queue_missing_payment_sessions(batch_size: int = 500) -> None:
+    """
+    Queues checkout sessions again for pending payments that still
+    don't have one an hour after their task was queued,
+    ex. when the task was lost or ran out of retries.
+    Payments are grouped per user, like at checkout.
+    """
+    if not (STRIPE_PUBLIC_KEY and SITE_URL):
+        return
+
+    now = timezone.now()
+    with transaction.atomic():
+        payments = list(
+            Payment.objects.filter(
+                status="PENDING",
+                session_id__isnull=True,
+                session_queued_at__lt=now - MISSING_SESSION_AFTER,
+            )
+            .select_for_update(of=("self",), skip_locked=True)
+            .order_by("session_queued_at")
+            .values_list("id", "borrowing__user_id")[:batch_size]
+        )
+        Payment.objects.filter(
+            id__in=[payment_id for payment_id, _ in payments]
+        ).update(session_queued_at=now)
+
+    payments_by_user = {}
+    for payment_id, user_id in payments:
+        payments_by_user.setdefault(user_id, []).append(payment_id)
+
+    abs_url = SITE_URL.rstrip("/") + reverse("borrowings:borrowing-list")
+    for payment_ids in payments_by_user.values():
+        create_checkout_session.delay(payment_ids, abs_url)
+
+
+@shared_task(
+    bind=True,
+    autoretry_for=(requests.RequestException,),
+    retry_backoff=True,
+    retry_backoff_max=10 * 60,
+    retry_jitter=True,
+    max_retries=10,
+)
+def deliver_notifications(self) -> None:
+    """
+    Drains the outbox of admin messages. Waits as long as Telegram asks
+    when rate limited and backs off exponentially on other failures.
+    """
+    try:
+        has_more = deliver_notification_batch()
+    except TelegramRateLimited as error:
+        raise self.retry(exc=error, countdown=error.retry_after)
+    if has_more:
+        deliver_notifications.delay()
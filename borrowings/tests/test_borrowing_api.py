@@ -1,21 +1,48 @@
 import os
-from datetime import datetime
-from unittest.mock import patch
+from importlib import import_module
+from datetime import date, datetime, timedelta
+from decimal import Decimal
+from unittest.mock import Mock, call, patch
 
+import stripe
+from celery.exceptions import Retry
+from kombu.exceptions import OperationalError
+
+from django.conf import settings
 from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.db import connection
 from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
 from django.urls import reverse
+from django.utils import timezone
 from rest_framework import status
 from rest_framework.test import APIClient
 
 from books.models import Book
-from borrowings.models import Borrowing, Payment
+from borrowings.messenger import (
+    NOTIFICATION_CLAIM_LEASE,
+    TELEGRAM_MESSAGE_LENGTH,
+    TelegramRateLimited,
+    build_overdue_digest,
+    deliver_notification_batch,
+)
+from borrowings.models import Borrowing, Notification, Payment, UserBalance
 from borrowings.serializers import BorrowingSerializer
-from borrowings.stripe import FINE_MULTIPLIER
-from borrowings.tasks import check_overdue_borrowings
+from borrowings.stripe import FINE_MULTIPLIER, mark_session_paid
+from borrowings.tasks import (
+    CHECKOUT_SESSION_BACKOFF_MAX,
+    CHECKOUT_SESSION_RETRIES,
+    MISSING_SESSION_AFTER,
+    check_overdue_borrowings,
+    create_checkout_session,
+    queue_missing_payment_sessions,
+)
 from library_service_api.settings import STRIPE_PUBLIC_KEY
 
 BORROWING_URL = reverse("borrowings:borrowing-list")
+CHECKOUT_URL = reverse("borrowings:borrowing-checkout")
+BULK_RETURN_URL = reverse("borrowings:borrowing-bulk-return")
 
 
 def detail_url(borrowing_id):
@@ -80,10 +107,12 @@ class AuthenticatedBorrowingApiTests(TestCase):
 
     def test_list_borrowings_display_this_user_borrowings(self):
         response = self.client.get(BORROWING_URL)
-        borrowings = Borrowing.objects.filter(user=self.user)
+        borrowings = Borrowing.objects.filter(user=self.user).order_by(
+            "-borrow_date", "-id"
+        )
         serializer = BorrowingSerializer(borrowings, many=True)
         self.assertEqual(response.status_code, status.HTTP_200_OK)
-        self.assertEqual(response.data, serializer.data)
+        self.assertEqual(response.data["results"], serializer.data)
 
     def test_retrieve_borrowings_allowed(self):
         response = self.client.get(detail_url(self.user.borrowings.first().id))
@@ -114,6 +143,49 @@ class AuthenticatedBorrowingApiTests(TestCase):
         response = self.client.post(BORROWING_URL, payload)
         self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
 
+    def test_create_borrowing_of_last_taken_copy_creates_nothing(self):
+        book = sample_book(title="Harry Potter 3", inventory=0)
+        payload = {
+            "borrow_date": "2023-01-01",
+            "expected_return_date": "2023-01-04",
+            "book": book.id,
+        }
+        response = self.client.post(BORROWING_URL, payload)
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertIn("book", response.data)
+        self.assertFalse(Borrowing.objects.filter(book=book).exists())
+        self.assertEqual(Book.objects.get(pk=book.id).inventory, 0)
+
+    def test_create_borrowing_with_unpaid_payment_should_fail(self):
+        payload = {
+            "borrow_date": "2023-01-01",
+            "expected_return_date": "2023-01-04",
+            "book": self.book.id,
+        }
+        response = self.client.post(BORROWING_URL, payload)
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+
+        balance = UserBalance.objects.get(user=self.user)
+        self.assertEqual(balance.unpaid_payments, 1)
+        self.assertEqual(balance.outstanding, 3 * self.book.daily_fee)
+        response = self.client.get(reverse("user:manage"))
+        self.assertEqual(response.data["unpaid_payments"], 1)
+        self.assertEqual(response.data["outstanding_balance"], "1.50")
+
+        response = self.client.post(BORROWING_URL, payload)
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+        payment = Payment.objects.get(borrowing__user=self.user)
+        payment.session_id = "cs_test"
+        payment.save()
+        mark_session_paid("cs_test")
+        balance.refresh_from_db()
+        self.assertEqual(balance.unpaid_payments, 0)
+        self.assertEqual(balance.outstanding, 0)
+
+        response = self.client.post(BORROWING_URL, payload)
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+
     def test_create_success_borrowing_and_decrease_inventory_by_1(self):
         start_inventory = self.book.inventory
         payload = {
@@ -127,6 +199,42 @@ class AuthenticatedBorrowingApiTests(TestCase):
             Book.objects.get(pk=self.book.id).inventory, start_inventory - 1
         )
 
+    def test_create_borrowing_refreshes_cached_book(self):
+        cache.clear()
+        book_url = reverse("books:book-detail", args=[self.book.id])
+        self.client.get(book_url)
+
+        self.client.post(
+            BORROWING_URL,
+            {
+                "borrow_date": "2023-01-01",
+                "expected_return_date": "2023-01-04",
+                "book": self.book.id,
+            },
+        )
+
+        response = self.client.get(book_url)
+        self.assertEqual(response.data["inventory"], self.book.inventory - 1)
+
+    def test_list_borrowings_with_selected_fields(self):
+        with self.assertNumQueries(1):
+            response = self.client.get(BORROWING_URL, {"fields": "id,borrow_date"})
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(
+            response.data["results"],
+            [{"id": self.borrowing.id, "borrow_date": self.borrowing.borrow_date}],
+        )
+
+    def test_list_borrowings_with_omitted_fields(self):
+        response = self.client.get(BORROWING_URL, {"omit": "book,payments"})
+
+        self.assertEqual(
+            set(response.data["results"][0]),
+            {"id", "borrow_date", "expected_return_date", "actual_return_date", "user"},
+        )
+        self.assertEqual(response.data["results"][0]["user"], self.user.email)
+
     def test_filtering_by_is_active(self):
         active_borrowing = sample_borrowing(
             actual_return_date=None, user=self.user, book=self.book
@@ -139,9 +247,74 @@ class AuthenticatedBorrowingApiTests(TestCase):
         response = self.client.get(BORROWING_URL, {"is_active": "True"})
 
         self.assertEqual(response.status_code, status.HTTP_200_OK)
-        self.assertIn(serializer_active.data, response.data)
-        self.assertNotIn(serializer_closed_user.data, response.data)
-        self.assertNotIn(serializer_closed_another.data, response.data)
+        self.assertIn(serializer_active.data, response.data["results"])
+        self.assertNotIn(serializer_closed_user.data, response.data["results"])
+        self.assertNotIn(serializer_closed_another.data, response.data["results"])
+
+    def test_filtering_with_invalid_is_active_should_fail(self):
+        response = self.client.get(BORROWING_URL, {"is_active": "__import__('os')"})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_filtering_by_borrow_date_range(self):
+        later = sample_borrowing(
+            borrow_date="2023-02-01",
+            expected_return_date="2023-02-04",
+            actual_return_date=None,
+            user=self.user,
+            book=self.book,
+        )
+
+        response = self.client.get(BORROWING_URL, {"borrowed_after": "2023-01-15"})
+
+        self.assertEqual(
+            [borrowing["id"] for borrowing in response.data["results"]], [later.id]
+        )
+
+    def test_list_borrowings_is_paginated_latest_first(self):
+        later = sample_borrowing(
+            borrow_date="2023-02-01",
+            expected_return_date="2023-02-04",
+            actual_return_date=None,
+            user=self.user,
+            book=self.book,
+        )
+
+        response = self.client.get(BORROWING_URL, {"page_size": 1})
+        self.assertEqual(response.data["results"][0]["id"], later.id)
+
+        response = self.client.get(response.data["next"])
+        self.assertEqual(response.data["results"][0]["id"], self.borrowing.id)
+        self.assertIsNone(response.data["next"])
+
+    def test_list_borrowings_pages_through_one_borrow_date(self):
+        # More rows on one date than the offset cutoff of DRF cursors
+        Borrowing.objects.bulk_create(
+            Borrowing(
+                borrow_date="2023-01-01",
+                expected_return_date="2023-01-04",
+                user=self.user,
+                book=self.book,
+            )
+            for _ in range(1100)
+        )
+        expected_ids = list(
+            Borrowing.objects.filter(user=self.user)
+            .order_by("-borrow_date", "-id")
+            .values_list("id", flat=True)
+        )
+
+        ids, url, params = [], BORROWING_URL, {"page_size": 200, "fields": "id"}
+        while url:
+            response = self.client.get(url, params)
+            ids += [borrowing["id"] for borrowing in response.data["results"]]
+            url, params = response.data["next"], None
+        self.assertEqual(ids, expected_ids)
+
+        response = self.client.get(response.data["previous"])
+        self.assertEqual(
+            [borrowing["id"] for borrowing in response.data["results"]],
+            expected_ids[-200 - len(expected_ids) % 200 : -(len(expected_ids) % 200)],
+        )
 
     def test_borrowing_return_book(self):
         start_inventory = self.book.inventory
@@ -192,9 +365,119 @@ class AuthenticatedBorrowingApiTests(TestCase):
             )
 
     def test_task_borrowings_overdue(self):
-        with patch("requests.get") as mock_send_notification:
+        with patch("borrowings.messenger.CHAT_ID", "1"):
             check_overdue_borrowings()
-            mock_send_notification.assert_called()
+
+        self.assertTrue(Notification.objects.filter(sent_at__isnull=True).exists())
+
+    def test_overdue_digest_is_built_with_one_query(self):
+        for number in range(20):
+            sample_borrowing(
+                book=self.book,
+                user=get_user_model().objects.create_user(
+                    f"overdue_{number}@library.com", "password"
+                ),
+                actual_return_date=None,
+            )
+
+        with patch("borrowings.tasks.send_notification") as mock_send_notification:
+            with CaptureQueriesContext(connection) as queries:
+                check_overdue_borrowings()
+
+        # The iterator may read through a server-side cursor (DECLARE ... FOR SELECT)
+        reads = [
+            query["sql"]
+            for query in queries
+            if not query["sql"].startswith(("SAVEPOINT", "RELEASE SAVEPOINT"))
+        ]
+        self.assertEqual(len(reads), 1, reads)
+        self.assertIn('"borrowings_borrowing"', reads[0])
+        mock_send_notification.assert_called_once()
+        digest = mock_send_notification.call_args.args[0]
+        self.assertIn("overdue_19@library.com", digest)
+        self.assertIn(self.book.title, digest)
+
+    def test_overdue_digest_is_split_into_limited_messages(self):
+        rows = [
+            (f"user_{number}@library.com", "A" * 100, date(2023, 1, 4))
+            for number in range(500)
+        ]
+
+        messages = build_overdue_digest(rows, max_messages=3)
+
+        self.assertEqual(len(messages), 4)
+        for message in messages:
+            self.assertLessEqual(len(message), TELEGRAM_MESSAGE_LENGTH)
+        listed = sum(message.count("\n- ") for message in messages[:3])
+        self.assertEqual(messages[3], f"And {500 - listed} more overdue borrowings.")
+
+    @patch("borrowings.messenger.telegram_session.post")
+    def test_queued_notifications_are_sent_in_one_message(self, mock_post):
+        mock_post.return_value.status_code = 200
+        first = Notification.objects.create(message="First")
+        second = Notification.objects.create(message="Second")
+
+        with patch("borrowings.messenger.CHAT_ID", "1"):
+            has_more = deliver_notification_batch()
+
+        self.assertFalse(has_more)
+        mock_post.assert_called_once()
+        self.assertEqual(mock_post.call_args.kwargs["data"]["text"], "First\n\nSecond")
+        self.assertIsNotNone(mock_post.call_args.kwargs["timeout"])
+        first.refresh_from_db()
+        second.refresh_from_db()
+        self.assertIsNotNone(first.sent_at)
+        self.assertIsNotNone(second.sent_at)
+
+    @patch("borrowings.messenger.telegram_session.post")
+    def test_rate_limited_notifications_stay_queued(self, mock_post):
+        mock_post.return_value.status_code = 429
+        mock_post.return_value.json.return_value = {"parameters": {"retry_after": 7}}
+        notification = Notification.objects.create(message="Message")
+
+        with self.assertRaises(TelegramRateLimited) as context:
+            deliver_notification_batch()
+
+        self.assertEqual(context.exception.retry_after, 7)
+        notification.refresh_from_db()
+        self.assertIsNone(notification.sent_at)
+        self.assertIsNone(notification.claimed_at)
+
+    @patch("borrowings.messenger.telegram_session.post")
+    def test_telegram_is_called_outside_of_transaction(self, mock_post):
+        Notification.objects.create(message="Message")
+        # TestCase wraps every test in its own atomic blocks
+        test_atomic_blocks = len(connection.atomic_blocks)
+        atomic_blocks = []
+
+        def post(*args, **kwargs):
+            atomic_blocks.append(len(connection.atomic_blocks))
+            return Mock(status_code=200)
+
+        mock_post.side_effect = post
+        deliver_notification_batch()
+
+        self.assertEqual(atomic_blocks, [test_atomic_blocks])
+
+    @patch("borrowings.messenger.telegram_session.post")
+    def test_claimed_notifications_are_sent_once_the_lease_lapses(self, mock_post):
+        mock_post.return_value.status_code = 200
+        claimed = Notification.objects.create(
+            message="Claimed", claimed_at=timezone.now()
+        )
+        lapsed = Notification.objects.create(
+            message="Lapsed",
+            claimed_at=timezone.now() - NOTIFICATION_CLAIM_LEASE - timedelta(seconds=1),
+        )
+
+        deliver_notification_batch()
+
+        mock_post.assert_called_once()
+        self.assertEqual(mock_post.call_args.kwargs["data"]["text"], "Lapsed")
+        claimed.refresh_from_db()
+        lapsed.refresh_from_db()
+        self.assertIsNone(claimed.sent_at)
+        self.assertIsNotNone(lapsed.sent_at)
 
     def test_crate_payment_and_stripe_session_when_creating_a_borrowing(self):
         payload = {
@@ -219,6 +502,287 @@ class AuthenticatedBorrowingApiTests(TestCase):
             self.assertIsNone(payment.session_id)
             self.assertIsNone(payment.session_url)
 
+    def test_bulk_return_not_allowed(self):
+        response = self.client.post(
+            BULK_RETURN_URL,
+            {"borrowings": [self.borrowing.id], "actual_return_date": "2023-01-10"},
+            format="json",
+        )
+        self.assertEqual(response.status_code, status.HTTP_403_FORBIDDEN)
+
+    def test_stripe_session_is_created_after_borrowing_is_committed(self):
+        payload = {
+            "borrow_date": "2023-01-01",
+            "expected_return_date": "2023-01-04",
+            "book": self.book.id,
+        }
+
+        with patch("borrowings.serializers.STRIPE_PUBLIC_KEY", "pk_test"), patch(
+            "borrowings.serializers.create_checkout_session.delay"
+        ) as mock_delay, self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post(BORROWING_URL, payload)
+            self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+            mock_delay.assert_not_called()
+
+        payment = Payment.objects.get(borrowing_id=response.data["id"])
+        self.assertEqual(response.data["payments"], [payment.id])
+        self.assertEqual(payment.to_pay, 3 * self.book.daily_fee)
+        self.assertIsNone(payment.session_id)
+        mock_delay.assert_called_once_with(
+            [payment.id], "http://testserver" + BORROWING_URL
+        )
+
+    def test_broker_failure_after_commit_keeps_the_borrowing(self):
+        payload = {
+            "borrow_date": "2023-01-01",
+            "expected_return_date": "2023-01-04",
+            "book": self.book.id,
+        }
+
+        with patch("borrowings.serializers.STRIPE_PUBLIC_KEY", "pk_test"), patch(
+            "borrowings.messenger.CHAT_ID", "1"
+        ), patch(
+            "borrowings.serializers.create_checkout_session.delay",
+            side_effect=OperationalError("Broker is down"),
+        ) as mock_checkout, patch(
+            "borrowings.tasks.deliver_notifications.delay",
+            side_effect=OperationalError("Broker is down"),
+        ) as mock_deliver, self.assertLogs(
+            "borrowings.tasks", "ERROR"
+        ), self.captureOnCommitCallbacks(
+            execute=True
+        ):
+            response = self.client.post(BORROWING_URL, payload)
+
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        mock_checkout.assert_called_once()
+        mock_deliver.assert_called_once()
+        self.assertTrue(Notification.objects.filter(sent_at__isnull=True).exists())
+
+    @patch("stripe.checkout.Session.create")
+    def test_task_creates_stripe_sessions_for_pending_payments(self, session_mock):
+        session_mock.return_value = {
+            "id": "cs_test",
+            "url": "https://stripe/cs_test",
+            "expires_at": 1681400000,
+        }
+        payment = Payment.objects.create(
+            status="PENDING", type="FINE", borrowing=self.borrowing, to_pay=1
+        )
+
+        create_checkout_session([payment.id], "http://testserver" + BORROWING_URL)
+        create_checkout_session([payment.id], "http://testserver" + BORROWING_URL)
+
+        payment.refresh_from_db()
+        self.assertEqual(payment.session_id, "cs_test")
+        self.assertEqual(payment.session_url, "https://stripe/cs_test")
+        self.assertEqual(payment.expires_at.timestamp(), 1681400000)
+        session_mock.assert_called_once()
+        self.assertEqual(
+            session_mock.call_args.kwargs["success_url"],
+            f"http://testserver/api/borrowings/borrowings/{self.borrowing.id}"
+            "/success?session_id={CHECKOUT_SESSION_ID}",
+        )
+
+    def test_checkout_borrows_several_books_with_one_session(self):
+        books = [self.book] + [
+            sample_book(title=f"Harry Potter {number}") for number in (3, 4)
+        ]
+        payload = {
+            "borrow_date": "2023-01-01",
+            "expected_return_date": "2023-01-04",
+            "books": [book.id for book in books],
+        }
+
+        with patch("borrowings.serializers.STRIPE_PUBLIC_KEY", "pk_test"), patch(
+            "borrowings.serializers.create_checkout_session.delay"
+        ) as mock_delay, patch(
+            "borrowings.serializers.send_checkout_message"
+        ) as mock_send_message, self.captureOnCommitCallbacks(
+            execute=True
+        ):
+            response = self.client.post(CHECKOUT_URL, payload)
+
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(len(response.data["borrowings"]), 3)
+        self.assertEqual(len(response.data["payments"]), 3)
+        for book in books:
+            self.assertEqual(Book.objects.get(pk=book.id).inventory, book.inventory - 1)
+        mock_delay.assert_called_once_with(
+            response.data["payments"], "http://testserver" + BORROWING_URL
+        )
+        mock_send_message.assert_called_once()
+        self.assertEqual(UserBalance.objects.get(user=self.user).unpaid_payments, 3)
+
+    def test_checkout_with_unavailable_book_creates_nothing(self):
+        book = sample_book(title="Harry Potter 3", inventory=0)
+        payload = {
+            "borrow_date": "2023-01-01",
+            "expected_return_date": "2023-01-04",
+            "books": [self.book.id, book.id],
+        }
+        borrowings_count = Borrowing.objects.count()
+
+        response = self.client.post(CHECKOUT_URL, payload)
+
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(Borrowing.objects.count(), borrowings_count)
+        self.assertEqual(Book.objects.get(pk=self.book.id).inventory, 5)
+        self.assertFalse(Payment.objects.filter(borrowing__user=self.user).exists())
+
+    def test_checkout_with_the_same_book_twice_should_fail(self):
+        payload = {
+            "borrow_date": "2023-01-01",
+            "expected_return_date": "2023-01-04",
+            "books": [self.book.id, self.book.id],
+        }
+
+        response = self.client.post(CHECKOUT_URL, payload)
+
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertIn("books", response.data)
+
+    @patch("stripe.checkout.Session.create")
+    def test_task_creates_one_session_for_all_payments(self, session_mock):
+        session_mock.return_value = {
+            "id": "cs_cart",
+            "url": "https://stripe/cs_cart",
+            "expires_at": 1681400000,
+        }
+        payments = [
+            Payment.objects.create(
+                status="PENDING", type="PAYMENT", borrowing=borrowing, to_pay=1
+            )
+            for borrowing in (self.borrowing, self.borrowing_another_user)
+        ]
+
+        create_checkout_session(
+            [payment.id for payment in payments], "http://testserver" + BORROWING_URL
+        )
+
+        session_mock.assert_called_once()
+        self.assertEqual(len(session_mock.call_args.kwargs["line_items"]), 2)
+        for payment in payments:
+            payment.refresh_from_db()
+            self.assertEqual(payment.session_id, "cs_cart")
+
+    @patch("stripe.checkout.Session.create")
+    def test_task_retries_failed_stripe_calls(self, session_mock):
+        session_mock.side_effect = stripe.error.APIConnectionError("Network error")
+        payment = Payment.objects.create(
+            status="PENDING", type="PAYMENT", borrowing=self.borrowing, to_pay=1
+        )
+
+        with patch.object(
+            create_checkout_session, "retry", side_effect=Retry
+        ) as mock_retry, self.assertRaises(Retry):
+            create_checkout_session([payment.id], "http://testserver" + BORROWING_URL)
+
+        self.assertIsInstance(
+            mock_retry.call_args.kwargs["exc"], stripe.error.APIConnectionError
+        )
+
+    def test_sweep_queues_sessions_of_old_payments_without_one(self):
+        old = timezone.now() - MISSING_SESSION_AFTER - timedelta(minutes=1)
+        payments = [
+            Payment.objects.create(
+                status="PENDING",
+                type="PAYMENT",
+                borrowing=borrowing,
+                to_pay=1,
+                session_queued_at=old,
+            )
+            for borrowing in (self.borrowing, self.borrowing_another_user)
+        ]
+        Payment.objects.create(
+            status="PENDING", type="PAYMENT", borrowing=self.borrowing, to_pay=1
+        )
+        Payment.objects.create(
+            status="PENDING",
+            type="PAYMENT",
+            borrowing=self.borrowing,
+            to_pay=1,
+            session_id="cs_test",
+            session_queued_at=old,
+        )
+
+        with patch("borrowings.tasks.STRIPE_PUBLIC_KEY", "pk_test"), patch(
+            "borrowings.tasks.SITE_URL", "http://testserver/"
+        ), patch("borrowings.tasks.create_checkout_session.delay") as mock_delay:
+            queue_missing_payment_sessions()
+            # Queued payments wait for their task again
+            queue_missing_payment_sessions()
+
+        self.assertCountEqual(
+            mock_delay.call_args_list,
+            [
+                call([payment.id], "http://testserver" + BORROWING_URL)
+                for payment in payments
+            ],
+        )
+
+    def test_sweep_is_scheduled(self):
+        tasks = {entry["task"] for entry in settings.CELERY_BEAT_SCHEDULE.values()}
+
+        self.assertIn("borrowings.tasks.queue_missing_payment_sessions", tasks)
+        self.assertIn("borrowings.tasks.deliver_notifications", tasks)
+        for task in tasks:
+            module, name = task.rsplit(".", 1)
+            self.assertTrue(hasattr(import_module(module), name), task)
+
+    def test_sweep_waits_for_all_retries_of_the_task(self):
+        backoff = sum(
+            min(2**retry, CHECKOUT_SESSION_BACKOFF_MAX)
+            for retry in range(CHECKOUT_SESSION_RETRIES)
+        )
+        self.assertGreater(MISSING_SESSION_AFTER, timedelta(seconds=backoff))
+
+    @patch("stripe.checkout.Session.create")
+    def test_task_never_overwrites_a_stored_session(self, session_mock):
+        payment = Payment.objects.create(
+            status="PENDING", type="PAYMENT", borrowing=self.borrowing, to_pay=1
+        )
+
+        def create_session(**kwargs):
+            # Another task stores its session during the call to Stripe
+            Payment.objects.filter(id=payment.id).update(
+                session_id="cs_first", session_url="https://stripe/cs_first"
+            )
+            return {
+                "id": "cs_second",
+                "url": "https://stripe/cs_second",
+                "expires_at": 1681400000,
+            }
+
+        session_mock.side_effect = create_session
+        create_checkout_session([payment.id], "http://testserver" + BORROWING_URL)
+
+        payment.refresh_from_db()
+        self.assertEqual(payment.session_id, "cs_first")
+        self.assertEqual(payment.session_url, "https://stripe/cs_first")
+
+    @patch("stripe.checkout.Session.create")
+    def test_retried_task_asks_stripe_for_the_same_session(self, session_mock):
+        session_mock.side_effect = stripe.error.APIConnectionError("Network error")
+        payment = Payment.objects.create(
+            status="PENDING", type="PAYMENT", borrowing=self.borrowing, to_pay=1
+        )
+
+        for _ in range(2):
+            with patch.object(create_checkout_session, "retry", side_effect=Retry):
+                with self.assertRaises(Retry):
+                    create_checkout_session(
+                        [payment.id], "http://testserver" + BORROWING_URL
+                    )
+
+        keys = [
+            stripe_call.kwargs["idempotency_key"]
+            for stripe_call in session_mock.call_args_list
+        ]
+        self.assertEqual(len(keys), 2)
+        self.assertEqual(keys[0], keys[1])
+        self.assertIsNotNone(keys[0])
+
     def test_create_fine_payment_if_borrowing_was_returned_after_expected_date(self):
         payload = {
             "borrow_date": "2023-01-01",
@@ -267,10 +831,64 @@ class AdminBorrowingApiTests(TestCase):
         sample_setup(self)
 
     def test_filtering_by_user_id(self):
-        another_borrowings = Borrowing.objects.filter(user__id=self.another_user.id)
+        another_borrowings = Borrowing.objects.filter(
+            user__id=self.another_user.id
+        ).order_by("-borrow_date", "-id")
         serializer_another = BorrowingSerializer(another_borrowings, many=True)
 
         response = self.client.get(BORROWING_URL, {"user_id": self.another_user.id})
 
         self.assertEqual(response.status_code, status.HTTP_200_OK)
-        self.assertEqual(serializer_another.data, response.data)
+        self.assertEqual(serializer_another.data, response.data["results"])
+
+    def test_bulk_return_closes_borrowings_and_creates_fines(self):
+        on_time = sample_borrowing(
+            book=self.book,
+            user=self.user,
+            expected_return_date="2023-01-15",
+            actual_return_date=None,
+        )
+        late = sample_borrowing(
+            book=self.book, user=self.another_user, actual_return_date=None
+        )
+        start_inventory = self.book.inventory
+
+        response = self.client.post(
+            BULK_RETURN_URL,
+            {"borrowings": [on_time.id, late.id], "actual_return_date": "2023-01-10"},
+            format="json",
+        )
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(
+            Book.objects.get(pk=self.book.id).inventory, start_inventory + 2
+        )
+        for borrowing in (on_time, late):
+            borrowing.refresh_from_db()
+            self.assertEqual(str(borrowing.actual_return_date), "2023-01-10")
+        fine = Payment.objects.get(borrowing=late)
+        self.assertEqual(response.data["fines"], [fine.id])
+        self.assertEqual(fine.type, "FINE")
+        self.assertEqual(fine.to_pay, 6 * FINE_MULTIPLIER * self.book.daily_fee)
+        self.assertEqual(
+            UserBalance.objects.get(user=self.another_user).unpaid_payments, 1
+        )
+
+    def test_bulk_return_with_returned_borrowing_changes_nothing(self):
+        active = sample_borrowing(
+            book=self.book, user=self.user, actual_return_date=None
+        )
+
+        response = self.client.post(
+            BULK_RETURN_URL,
+            {
+                "borrowings": [active.id, self.borrowing.id],
+                "actual_return_date": "2023-01-10",
+            },
+            format="json",
+        )
+
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        active.refresh_from_db()
+        self.assertIsNone(active.actual_return_date)
+        self.assertEqual(Book.objects.get(pk=self.book.id).inventory, 5)
@@ -0,0 +1,177 @@
+import json
+from decimal import Decimal
+
+from django.contrib.auth import get_user_model
+from django.test import TestCase
+from django.urls import reverse
+from rest_framework.renderers import JSONRenderer
+from rest_framework.request import Request
+from rest_framework.test import APIClient, APIRequestFactory
+
+from books.models import Book
+from borrowings.fast_lists import (
+    borrowing_values,
+    payment_values,
+    render_borrowings,
+    render_payments,
+)
+from borrowings.models import Borrowing, Payment
+from borrowings.serializers import BorrowingSerializer, PaymentSerializer
+from borrowings.views import BorrowingViewSet, PaymentViewSet
+from library_service_api.sparse_fieldsets import requested_fields
+
+BORROWING_URL = reverse("borrowings:borrowing-list")
+PAYMENT_URL = reverse("borrowings:payment-list")
+
+
+def fast_json(values, render, queryset, request, available):
+    fields = requested_fields(request, available)
+    return JSONRenderer().render(render(values(queryset, fields), fields))
+
+
+def serializer_json(serializer_class, queryset, request):
+    serializer = serializer_class(queryset, many=True, context={"request": request})
+    return JSONRenderer().render(serializer.data)
+
+
+class FastListParityTests(TestCase):
+    """The list fast path renders the same bytes as the serializers"""
+
+    def setUp(self):
+        self.factory = APIRequestFactory()
+        users = [
+            get_user_model().objects.create_user(
+                f"reader{number}@library.com", "password"
+            )
+            for number in range(2)
+        ]
+        books = [
+            Book.objects.create(
+                title="Dune",
+                author="Frank Herbert",
+                cover=Book.Cover.HARD,
+                inventory=3,
+                daily_fee=Decimal("0.25"),
+            ),
+            Book.objects.create(
+                title="Solaris",
+                author="Stanislaw Lem",
+                cover=Book.Cover.SOFT,
+                inventory=0,
+                daily_fee=Decimal("1.50"),
+            ),
+        ]
+        returned = Borrowing.objects.create(
+            borrow_date="2023-01-01",
+            expected_return_date="2023-01-04",
+            actual_return_date="2023-01-09",
+            book=books[0],
+            user=users[0],
+        )
+        active = Borrowing.objects.create(
+            borrow_date="2023-01-01",
+            expected_return_date="2023-01-11",
+            book=books[1],
+            user=users[1],
+        )
+        Borrowing.objects.create(
+            borrow_date="2023-02-01",
+            expected_return_date="2023-02-03",
+            book=books[1],
+            user=users[0],
+        )
+        Payment.objects.create(
+            status=Payment.Status.PAID,
+            type=Payment.Type.PAYMENT,
+            borrowing=returned,
+            session_url="https://checkout.stripe.com/pay/cs_test_1",
+            session_id="cs_test_1",
+            to_pay=Decimal("0.75"),
+        )
+        Payment.objects.create(
+            status=Payment.Status.PENDING,
+            type=Payment.Type.FINE,
+            borrowing=returned,
+            to_pay=Decimal("5.00"),
+        )
+        Payment.objects.create(
+            status=Payment.Status.EXPIRED,
+            type=Payment.Type.PAYMENT,
+            borrowing=active,
+            to_pay=Decimal("15.00"),
+        )
+
+    def assert_borrowings_match(self, query=""):
+        request = Request(self.factory.get(f"{BORROWING_URL}?{query}"))
+        queryset = BorrowingViewSet.queryset.order_by("-borrow_date", "-id")
+
+        self.assertEqual(
+            fast_json(
+                borrowing_values,
+                render_borrowings,
+                queryset,
+                request,
+                BorrowingSerializer.Meta.fields,
+            ),
+            serializer_json(BorrowingSerializer, queryset, request),
+        )
+
+    def assert_payments_match(self, query=""):
+        request = Request(self.factory.get(f"{PAYMENT_URL}?{query}"))
+        queryset = PaymentViewSet.queryset.order_by("-id")
+
+        self.assertEqual(
+            fast_json(
+                payment_values,
+                render_payments,
+                queryset,
+                request,
+                PaymentSerializer.Meta.fields,
+            ),
+            serializer_json(PaymentSerializer, queryset, request),
+        )
+
+    def test_borrowings_match_serializer(self):
+        self.assert_borrowings_match()
+
+    def test_borrowings_with_selected_fields_match_serializer(self):
+        self.assert_borrowings_match("fields=payments,id,actual_return_date")
+        self.assert_borrowings_match("fields=book,user")
+        self.assert_borrowings_match("omit=book,payments")
+
+    def test_payments_match_serializer(self):
+        self.assert_payments_match()
+
+    def test_payments_with_selected_fields_match_serializer(self):
+        self.assert_payments_match("fields=to_pay,status,session_url")
+        self.assert_payments_match("omit=borrowing")
+
+    def test_list_endpoints_match_serializer(self):
+        client = APIClient()
+        client.force_authenticate(
+            get_user_model().objects.create_superuser("admin@library.com", "pass")
+        )
+        request = Request(self.factory.get(BORROWING_URL))
+
+        response = client.get(BORROWING_URL)
+        queryset = BorrowingViewSet.queryset.order_by("-borrow_date", "-id")
+        self.assertEqual(
+            response.json()["results"],
+            json.loads(serializer_json(BorrowingSerializer, queryset, request)),
+        )
+
+        response = client.get(PAYMENT_URL)
+        queryset = PaymentViewSet.queryset.order_by("-id")
+        self.assertEqual(
+            response.json()["results"],
+            json.loads(serializer_json(PaymentSerializer, queryset, request)),
+        )
+
+    def test_payments_are_loaded_in_one_query(self):
+        fields = set(BorrowingSerializer.Meta.fields)
+        with self.assertNumQueries(2):
+            render_borrowings(borrowing_values(Borrowing.objects.all(), fields), fields)
+
+        fields = set(PaymentSerializer.Meta.fields)
+        with self.assertNumQueries(2):
+            render_payments(payment_values(Payment.objects.all(), fields), fields)
@@ -1,15 +1,25 @@
 import os
+import time
+from datetime import datetime, timedelta
+from decimal import Decimal
 from unittest.mock import patch
 
 import stripe
 from django.contrib.auth import get_user_model
-from django.test import TestCase
+from django.db import connection
+from django.forms.models import model_to_dict
+from django.test import Client, SimpleTestCase, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
 from django.urls import reverse
+from django.utils import timezone
 from rest_framework import status
 from rest_framework.test import APIClient
 
-from borrowings.models import Borrowing, Payment
+from borrowings.checks import check_stripe_webhook_secret
+from borrowings.models import Borrowing, Payment, UserBalance
 from borrowings.serializers import PaymentSerializer
+from borrowings.tasks import check_expired_payment_sessions
+from borrowings.fake_stripe import checkout_session_event, sign
 from borrowings.tests.test_borrowing_api import (
     sample_book,
     detail_url,
@@ -18,6 +28,8 @@ from borrowings.tests.test_borrowing_api import (
 from library_service_api.settings import STRIPE_PUBLIC_KEY
 
 PAYMENT_URL = reverse("borrowings:payment-list")
+WEBHOOK_URL = reverse("borrowings:stripe-webhook")
+WEBHOOK_SECRET = "whsec_test"
 BORROWING_URL = reverse("borrowings:borrowing-list")
 
 
@@ -48,41 +60,118 @@ class AuthenticatedBorrowingApiTests(TestCase):
 
     def test_list_payments_display_this_user_payments(self):
         response = self.client.get(PAYMENT_URL)
-        payments = Payment.objects.filter(borrowing__user=self.user)
+        payments = Payment.objects.filter(borrowing__user=self.user).order_by("-id")
         serializer = PaymentSerializer(payments, many=True)
         self.assertEqual(response.status_code, status.HTTP_200_OK)
-        self.assertEqual(response.data, serializer.data)
+        self.assertEqual(response.data["results"], serializer.data)
 
-    @patch("stripe.checkout.Session.retrieve")
-    def test_change_payment_status_when_session_is_paid_successfully(
-        self, session_mock
-    ):
-        if STRIPE_PUBLIC_KEY:
-            payload = {
-                "borrow_date": "2023-01-01",
-                "expected_return_date": "2023-01-04",
-                "book": self.book.id,
-            }
+    def test_list_payments_without_borrowing_skips_joins(self):
+        Payment.objects.create(
+            status="PENDING", type="PAYMENT", borrowing=self.borrowing, to_pay=1
+        )
+
+        with self.assertNumQueries(1):
+            response = self.client.get(PAYMENT_URL, {"omit": "borrowing"})
 
-            response_post_borrowing = self.client.post(BORROWING_URL, payload)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertNotIn("borrowing", response.data["results"][0])
+        self.assertEqual(response.data["results"][0]["status"], "PENDING")
+
+    def test_borrowing_payments_are_structured(self):
+        fine = Payment.objects.create(
+            status="PENDING", type="FINE", borrowing=self.borrowing, to_pay=2
+        )
+
+        for response in (
+            self.client.get(detail_url(self.borrowing.id)),
+            self.client.get(BORROWING_URL),
+        ):
+            borrowing = response.data
+            if "results" in borrowing:
+                borrowing = borrowing["results"][0]
             self.assertEqual(
-                response_post_borrowing.status_code, status.HTTP_201_CREATED
+                borrowing["payments"],
+                [
+                    {
+                        "id": fine.id,
+                        "status": "PENDING",
+                        "type": "FINE",
+                        "to_pay": "2.00",
+                    }
+                ],
             )
-            borrowing = Borrowing.objects.last()
-            payment = Payment.objects.last()
 
-            self.assertEqual(payment.status, "PENDING")
-            session_mock.return_value = {"payment_status": "paid"}
+    def test_query_count_does_not_grow_with_payments(self):
+        urls = (
+            BORROWING_URL,
+            detail_url(self.borrowing.id),
+            PAYMENT_URL,
+        )
 
-            res = self.client.get(
-                os.path.join(
-                    detail_url(borrowing.id),
-                    f"success/?session_id={payment.session_id}",
-                )
-            )
-            self.assertEqual(res.status_code, status.HTTP_200_OK)
-            payment.refresh_from_db()
-            self.assertEqual(payment.status, "PAID")
+        def count_queries():
+            payment = Payment.objects.filter(borrowing=self.borrowing).first()
+            counts = []
+            for url in (*urls, reverse("borrowings:payment-detail", args=[payment.id])):
+                with CaptureQueriesContext(connection) as queries:
+                    response = self.client.get(url)
+                self.assertEqual(response.status_code, status.HTTP_200_OK)
+                counts.append(len(queries))
+            return counts
+
+        Payment.objects.create(
+            status="PAID", type="PAYMENT", borrowing=self.borrowing, to_pay=1
+        )
+        counts = count_queries()
+
+        Payment.objects.bulk_create(
+            Payment(status="PENDING", type="FINE", borrowing=self.borrowing, to_pay=1)
+            for _ in range(20)
+        )
+        self.assertEqual(count_queries(), counts)
+
+    def test_filtering_payments_by_status_and_type(self):
+        fine = Payment.objects.create(
+            status="PENDING", type="FINE", borrowing=self.borrowing, to_pay=1
+        )
+        Payment.objects.create(
+            status="PAID", type="FINE", borrowing=self.borrowing, to_pay=1
+        )
+        Payment.objects.create(
+            status="PENDING", type="PAYMENT", borrowing=self.borrowing, to_pay=1
+        )
+
+        response = self.client.get(PAYMENT_URL, {"status": "PENDING", "type": "FINE"})
+
+        self.assertEqual(
+            [payment["id"] for payment in response.data["results"]], [fine.id]
+        )
+
+    def test_filtering_payments_by_unknown_status_should_fail(self):
+        response = self.client.get(PAYMENT_URL, {"status": "REFUNDED"})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    @patch("stripe.checkout.Session.retrieve")
+    def test_success_endpoint_reads_local_payment_status(self, session_mock):
+        payment = Payment.objects.create(
+            status="PENDING",
+            type="PAYMENT",
+            borrowing=self.borrowing,
+            to_pay=1,
+            session_id="cs_test",
+        )
+        success_url = os.path.join(
+            detail_url(self.borrowing.id), "success/?session_id=cs_test"
+        )
+
+        response = self.client.get(success_url)
+        self.assertEqual(response.status_code, status.HTTP_202_ACCEPTED)
+
+        payment.status = "PAID"
+        payment.save()
+        response = self.client.get(success_url)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data["id"], self.borrowing.id)
+        session_mock.assert_not_called()
 
     def test_renew_payment_if_stripe_connected(self):
         if STRIPE_PUBLIC_KEY:
@@ -113,6 +202,63 @@ class AuthenticatedBorrowingApiTests(TestCase):
             self.assertEqual(new_session["status"], "open")
             self.assertEqual(payment.status, "PENDING")
 
+    def test_expired_payments_are_marked_without_stripe(self):
+        now = timezone.now()
+        expired = Payment.objects.create(
+            status="PENDING",
+            type="PAYMENT",
+            borrowing=self.borrowing,
+            to_pay=1,
+            expires_at=now - timedelta(minutes=1),
+        )
+        open_payment = Payment.objects.create(
+            status="PENDING",
+            type="PAYMENT",
+            borrowing=self.borrowing,
+            to_pay=1,
+            expires_at=now + timedelta(hours=1),
+        )
+        paid = Payment.objects.create(
+            status="PAID",
+            type="PAYMENT",
+            borrowing=self.borrowing,
+            to_pay=1,
+            expires_at=now - timedelta(minutes=1),
+        )
+
+        with patch("stripe.checkout.Session.retrieve") as session_mock:
+            check_expired_payment_sessions()
+            session_mock.assert_not_called()
+
+        for payment, payment_status in (
+            (expired, "EXPIRED"),
+            (open_payment, "PENDING"),
+            (paid, "PAID"),
+        ):
+            payment.refresh_from_db()
+            self.assertEqual(payment.status, payment_status)
+
+    @patch("stripe.checkout.Session.retrieve")
+    def test_payments_without_expiry_time_are_reconciled_with_stripe(
+        self, session_mock
+    ):
+        session_mock.return_value = {"expires_at": int(time.time()) - 60}
+        payment = Payment.objects.create(
+            status="PENDING",
+            type="PAYMENT",
+            borrowing=self.borrowing,
+            to_pay=1,
+            session_id="cs_legacy",
+        )
+
+        with patch("borrowings.tasks.STRIPE_PUBLIC_KEY", "pk_test"):
+            check_expired_payment_sessions()
+
+        session_mock.assert_called_once_with("cs_legacy")
+        payment.refresh_from_db()
+        self.assertEqual(payment.status, "EXPIRED")
+        self.assertIsNotNone(payment.expires_at)
+
 
 class AdminBorrowingApiTests(TestCase):
     def setUp(self):
@@ -130,3 +276,169 @@ class AdminBorrowingApiTests(TestCase):
         self.borrowing_another_user = sample_borrowing(
             book=self.book, user=self.another_user
         )
+
+
+@patch("borrowings.views.STRIPE_WEBHOOK_SECRET", WEBHOOK_SECRET)
+class StripeWebhookTests(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        user = get_user_model().objects.create_user(
+            "authenticated@library.com", "password"
+        )
+        self.payment = Payment.objects.create(
+            status="PENDING",
+            type="PAYMENT",
+            borrowing=sample_borrowing(book=sample_book(), user=user),
+            to_pay=1,
+            session_id="cs_test",
+        )
+
+    def post_event(self, payload, signature=None):
+        return self.client.post(
+            WEBHOOK_URL,
+            payload,
+            content_type="application/json",
+            HTTP_STRIPE_SIGNATURE=signature or sign(payload, WEBHOOK_SECRET),
+        )
+
+    def test_completed_session_marks_payment_paid_once(self):
+        payload = checkout_session_event("checkout.session.completed", "cs_test")
+
+        with patch("borrowings.stripe.send_notification") as mock_send_notification:
+            first_response = self.post_event(payload)
+            second_response = self.post_event(payload)
+
+        self.assertEqual(first_response.status_code, status.HTTP_200_OK)
+        self.assertEqual(second_response.status_code, status.HTTP_200_OK)
+        self.payment.refresh_from_db()
+        self.assertEqual(self.payment.status, "PAID")
+        mock_send_notification.assert_called_once()
+
+    def test_webhook_without_secret_is_unavailable(self):
+        payload = checkout_session_event("checkout.session.completed", "cs_test")
+
+        with patch("borrowings.views.STRIPE_WEBHOOK_SECRET", None):
+            response = self.post_event(payload)
+
+        self.assertEqual(response.status_code, status.HTTP_503_SERVICE_UNAVAILABLE)
+        self.payment.refresh_from_db()
+        self.assertEqual(self.payment.status, "PENDING")
+
+    def test_unpaid_completed_session_changes_nothing(self):
+        payload = checkout_session_event(
+            "checkout.session.completed", "cs_test", payment_status="unpaid"
+        )
+
+        response = self.post_event(payload)
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.payment.refresh_from_db()
+        self.assertEqual(self.payment.status, "PENDING")
+
+    def test_expired_session_does_not_expire_paid_payment(self):
+        payload = checkout_session_event("checkout.session.expired", "cs_test")
+
+        self.post_event(payload)
+        self.payment.refresh_from_db()
+        self.assertEqual(self.payment.status, "EXPIRED")
+
+        self.payment.status = "PAID"
+        self.payment.save()
+        self.post_event(payload)
+        self.payment.refresh_from_db()
+        self.assertEqual(self.payment.status, "PAID")
+
+    def test_event_with_invalid_signature_is_rejected(self):
+        payload = checkout_session_event("checkout.session.completed", "cs_test")
+
+        response = self.post_event(payload, signature=sign(payload, "whsec_wrong"))
+
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.payment.refresh_from_db()
+        self.assertEqual(self.payment.status, "PENDING")
+
+
+class StripeSettingsCheckTests(SimpleTestCase):
+    @override_settings(STRIPE_SECRET_KEY="sk_test", STRIPE_WEBHOOK_SECRET=None)
+    def test_stripe_without_webhook_secret_is_an_error(self):
+        errors = check_stripe_webhook_secret(None)
+        self.assertEqual([error.id for error in errors], ["borrowings.E001"])
+
+    @override_settings(STRIPE_SECRET_KEY="sk_test", STRIPE_WEBHOOK_SECRET="whsec")
+    def test_stripe_with_webhook_secret_passes(self):
+        self.assertEqual(check_stripe_webhook_secret(None), [])
+
+    @override_settings(STRIPE_SECRET_KEY=None, STRIPE_WEBHOOK_SECRET=None)
+    def test_disabled_stripe_passes(self):
+        self.assertEqual(check_stripe_webhook_secret(None), [])
+
+
+class PaymentBalanceTests(TestCase):
+    def setUp(self):
+        self.client = Client()
+        self.admin = get_user_model().objects.create_superuser(
+            "admin@library.com", "password"
+        )
+        self.client.force_login(self.admin)
+        self.user = get_user_model().objects.create_user(
+            "authenticated@library.com", "password"
+        )
+        self.payment = Payment.objects.create(
+            status="PENDING",
+            type="PAYMENT",
+            borrowing=sample_borrowing(book=sample_book(), user=self.user),
+            to_pay=Decimal("1.50"),
+        )
+
+    def assertBalance(self, unpaid_payments, outstanding):
+        balance = UserBalance.objects.get(user=self.user)
+        self.assertEqual(balance.unpaid_payments, unpaid_payments)
+        self.assertEqual(balance.outstanding, outstanding)
+
+    def test_created_payment_is_charged(self):
+        self.assertBalance(1, Decimal("1.50"))
+
+    def test_admin_marking_payment_paid_settles_balance(self):
+        data = {}
+        for name, value in model_to_dict(self.payment).items():
+            if isinstance(value, datetime):
+                value = timezone.localtime(value)
+                data[f"{name}_0"], data[f"{name}_1"] = value.date(), value.time()
+            elif value is not None:
+                data[name] = value
+        data["status"] = "PAID"
+
+        response = self.client.post(
+            reverse("admin:borrowings_payment_change", args=[self.payment.id]), data
+        )
+
+        self.assertEqual(response.status_code, status.HTTP_302_FOUND)
+        self.assertBalance(0, 0)
+
+    def test_admin_deleting_unpaid_payment_settles_balance(self):
+        response = self.client.post(
+            reverse("admin:borrowings_payment_delete", args=[self.payment.id]),
+            {"post": "yes"},
+        )
+
+        self.assertEqual(response.status_code, status.HTTP_302_FOUND)
+        self.assertBalance(0, 0)
+
+    def test_paid_payment_set_back_to_pending_is_charged_again(self):
+        self.payment.status = "PAID"
+        self.payment.save()
+        self.assertBalance(0, 0)
+
+        self.payment.status = "PENDING"
+        self.payment.to_pay = Decimal("2.00")
+        self.payment.save()
+
+        self.assertBalance(1, Decimal("2.00"))
+
+    def test_saving_other_fields_keeps_balance(self):
+        self.payment.session_id = "cs_test"
+        self.payment.save()
+        self.payment.status = "EXPIRED"
+        self.payment.save(update_fields=["status"])
+
+        self.assertBalance(1, Decimal("1.50"))
@@ -0,0 +1,111 @@
+from datetime import date, timedelta
+from unittest import skipUnless
+
+from django.contrib.auth import get_user_model
+from django.db import connection
+from django.test import TestCase
+from rest_framework.request import Request
+from rest_framework.test import APIRequestFactory
+
+from books.models import Book
+from borrowings.balance import unpaid_balance
+from borrowings.models import Borrowing, Payment, UserBalance
+from borrowings.views import BorrowingViewSet, PaymentViewSet
+
+USERS = 2000
+BORROWINGS_PER_USER = 10
+
+
+def list_queryset(viewset_class, user, **params):
+    """Queryset the list endpoint of the viewset runs for the user"""
+    view = viewset_class(action="list", format_kwarg=None, kwargs={})
+    view.request = Request(APIRequestFactory().get("/", params))
+    view.request.user = user
+    return view.filter_queryset(view.get_queryset())
+
+
+@skipUnless(connection.vendor == "postgresql", "Query plans require PostgreSQL")
+class BorrowingQueryPlanTests(TestCase):
+    """Main queries of the borrowing endpoints and tasks use indexes"""
+
+    @classmethod
+    def setUpTestData(cls):
+        book = Book.objects.create(
+            title="Query plan book",
+            author="Author",
+            cover="HARD",
+            inventory=1,
+            daily_fee=0.5,
+        )
+        cls.users = get_user_model().objects.bulk_create(
+            get_user_model()(email=f"plan_{number}@library.com")
+            for number in range(USERS)
+        )
+        borrow_date = date(2023, 1, 1)
+        borrowings = Borrowing.objects.bulk_create(
+            (
+                Borrowing(
+                    borrow_date=borrow_date,
+                    expected_return_date=borrow_date + timedelta(days=7),
+                    # Only a few borrowings are still active, like in production
+                    actual_return_date=(
+                        None if number % 50 == 0 else borrow_date + timedelta(days=7)
+                    ),
+                    book=book,
+                    user=cls.users[number % USERS],
+                )
+                for number in range(USERS * BORROWINGS_PER_USER)
+            ),
+            batch_size=5000,
+        )
+        Payment.objects.bulk_create(
+            (
+                Payment(
+                    status="PAID",
+                    type="PAYMENT",
+                    borrowing=borrowing,
+                    session_id=f"cs_plan_{borrowing.id}",
+                    to_pay=1,
+                )
+                for borrowing in borrowings
+            ),
+            batch_size=5000,
+        )
+        UserBalance.objects.bulk_create(
+            UserBalance(user=user, unpaid_payments=number % 2)
+            for number, user in enumerate(cls.users)
+        )
+        with connection.cursor() as cursor:
+            cursor.execute("ANALYZE borrowings_borrowing")
+            cursor.execute("ANALYZE borrowings_payment")
+            cursor.execute("ANALYZE borrowings_userbalance")
+
+    def assertUsesIndex(self, queryset, index_name):
+        plan = queryset.explain()
+        self.assertIn(index_name, plan)
+        self.assertNotIn(f"Seq Scan on {queryset.model._meta.db_table}", plan)
+
+    def test_borrowing_list_filters_use_user_index(self):
+        queryset = list_queryset(BorrowingViewSet, self.users[0], is_active="true")
+        self.assertUsesIndex(queryset, "borrowing_user_returned_idx")
+
+    def test_overdue_borrowings_use_partial_index(self):
+        queryset = Borrowing.objects.filter(
+            actual_return_date__isnull=True,
+            expected_return_date__lte=date(2022, 12, 31),
+        ).values_list("user__email", "book__title", "expected_return_date")
+        self.assertUsesIndex(queryset, "borrowing_active_expected_idx")
+
+    def test_payment_lookup_by_session_uses_index(self):
+        queryset = Payment.objects.filter(session_id="cs_plan_1")
+        self.assertUsesIndex(queryset, "payment_session_id_idx")
+
+    def test_payment_list_uses_indexes(self):
+        # Either the composite or the foreign key index may serve the join
+        plan = list_queryset(PaymentViewSet, self.users[0]).explain()
+        self.assertNotIn("Seq Scan on borrowings_borrowing", plan)
+        self.assertNotIn("Seq Scan on borrowings_payment", plan)
+
+    def test_unpaid_payments_check_uses_balance_key(self):
+        queryset = unpaid_balance(self.users[1].id)
+        self.assertUsesIndex(queryset, "borrowings_userbalance_pkey")
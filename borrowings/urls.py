@@ -1,14 +1,18 @@
+from django.urls import path
 from rest_framework import routers
 
 from borrowings.views import (
     BorrowingViewSet,
     PaymentViewSet,
+    StripeWebhookView,
 )
 
 router = routers.DefaultRouter()
 router.register("borrowings", BorrowingViewSet)
 router.register("payments", PaymentViewSet)
 
-urlpatterns = router.urls
+urlpatterns = router.urls + [
+    path("stripe-webhook/", StripeWebhookView.as_view(), name="stripe-webhook"),
+]
 
 app_name = "borrowings"
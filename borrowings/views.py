@@ -1,22 +1,52 @@
 from typing import Any
 
 import stripe
+from django.db.models import Prefetch
+from django.shortcuts import get_object_or_404
+from drf_spectacular.types import OpenApiTypes
 from drf_spectacular.utils import OpenApiParameter, extend_schema, extend_schema_view
 from rest_framework import mixins, viewsets, status
 from rest_framework.decorators import action
-from rest_framework.permissions import IsAuthenticated
+from rest_framework.permissions import AllowAny, IsAdminUser, IsAuthenticated
 from rest_framework.request import Request
 from rest_framework.response import Response
+from rest_framework.views import APIView
 
-from borrowings.messenger import send_notification
+from borrowings.fast_lists import (
+    borrowing_values,
+    payment_values,
+    render_borrowings,
+    render_payments,
+)
 from borrowings.models import Borrowing, Payment
+from borrowings.pagination import BorrowingCursorPagination, PaymentCursorPagination
 from borrowings.serializers import (
     BorrowingSerializer,
+    BorrowingPaymentSerializer,
     BorrowingCreateSerializer,
+    BorrowingCheckoutSerializer,
+    BorrowingBulkReturnSerializer,
+    BorrowingFilterSerializer,
     BorrowingReturnSerializer,
+    PaymentFilterSerializer,
     PaymentSerializer,
     PaymentRenewSerializer,
 )
+from borrowings.stripe import mark_session_expired, mark_session_paid
+from library_service_api.settings import STRIPE_WEBHOOK_SECRET
+from library_service_api.sparse_fieldsets import (
+    SPARSE_FIELDSET_PARAMETERS,
+    requested_fields,
+)
+
+PAID_SESSION_EVENTS = (
+    "checkout.session.completed",
+    "checkout.session.async_payment_succeeded",
+)
+# Columns of the nested payments, in the order the list fast path renders them
+BORROWING_PAYMENTS = Payment.objects.only(
+    "borrowing", *BorrowingPaymentSerializer.Meta.fields
+).order_by("id")
 
 
 @extend_schema_view(
@@ -27,7 +57,10 @@ from borrowings.serializers import (
             "admin will see all of them)."
         )
     ),
-    retrieve=extend_schema(description="Endpoint for getting a specific borrowing."),
+    retrieve=extend_schema(
+        description="Endpoint for getting a specific borrowing.",
+        parameters=SPARSE_FIELDSET_PARAMETERS,
+    ),
     create=extend_schema(description="Endpoint for creating a new borrowing."),
 )
 class BorrowingViewSet(
@@ -37,51 +70,164 @@ class BorrowingViewSet(
     viewsets.GenericViewSet,
 ):
     queryset = Borrowing.objects.select_related("book", "user").prefetch_related(
-        "payments"
+        Prefetch("payments", queryset=BORROWING_PAYMENTS)
     )
     permission_classes = (IsAuthenticated,)
+    pagination_class = BorrowingCursorPagination
 
     def get_serializer_class(self):
         if self.action == "create":
             return BorrowingCreateSerializer
+        if self.action == "checkout":
+            return BorrowingCheckoutSerializer
+        if self.action == "bulk_return":
+            return BorrowingBulkReturnSerializer
 
         return BorrowingSerializer
 
     def get_queryset(self):
         queryset = super().get_queryset()
-        user_id = self.request.query_params.get("user_id")
-        is_active = self.request.query_params.get("is_active")
-
-        if self.request.user.is_superuser:
-            if user_id:
-                queryset = queryset.filter(user__id=user_id)
+        if self.action == "retrieve":
+            queryset = self._select_requested_fields(queryset)
 
         if not self.request.user.is_superuser:
             queryset = queryset.filter(user=self.request.user)
 
-        if is_active:
-            queryset = queryset.filter(actual_return_date__isnull=eval(is_active))
+        if self.action != "list":
+            return queryset
+
+        filters = BorrowingFilterSerializer(data=self.request.query_params.dict())
+        filters.is_valid(raise_exception=True)
+        filters = filters.validated_data
+
+        # Every filter is served by an index on the same columns
+        if "user_id" in filters and self.request.user.is_superuser:
+            queryset = queryset.filter(user_id=filters["user_id"])
+        if "is_active" in filters:
+            queryset = queryset.filter(actual_return_date__isnull=filters["is_active"])
+        if "borrowed_after" in filters:
+            queryset = queryset.filter(borrow_date__gte=filters["borrowed_after"])
+        if "borrowed_before" in filters:
+            queryset = queryset.filter(borrow_date__lte=filters["borrowed_before"])
+        if "returned_after" in filters:
+            queryset = queryset.filter(
+                actual_return_date__gte=filters["returned_after"]
+            )
+        if "returned_before" in filters:
+            queryset = queryset.filter(
+                actual_return_date__lte=filters["returned_before"]
+            )
 
         return queryset
 
+    def _select_requested_fields(self, queryset):
+        """Joins and loads only what the fields asked with ?fields= need."""
+        fields = requested_fields(self.request, BorrowingSerializer.Meta.fields)
+        queryset = queryset.select_related(None).prefetch_related(None)
+        related = [name for name in ("book", "user") if name in fields]
+        if related:
+            queryset = queryset.select_related(*related)
+        if "payments" in fields:
+            queryset = queryset.prefetch_related(
+                Prefetch("payments", queryset=BORROWING_PAYMENTS)
+            )
+
+        columns = fields - {"user", "payments"}
+        if "user" in fields:
+            columns.add("user__email")
+        # Cursor pagination needs the ordering columns
+        return queryset.only("id", "borrow_date", *columns)
+
     @extend_schema(
         parameters=[
             OpenApiParameter(
                 name="user_id",
-                description=("For admins - filter by user_id " "(ex. '?user_id=1)."),
+                description="For admins - filter by user_id (ex. ?user_id=1).",
                 required=False,
                 type=int,
             ),
             OpenApiParameter(
                 name="is_active",
-                description=("Filter by active borrowings " "(ex. ?is_active=True)."),
+                description="Filter by active borrowings (ex. ?is_active=true).",
                 required=False,
-                type=str,
+                type=bool,
+            ),
+            OpenApiParameter(
+                name="borrowed_after",
+                description=(
+                    "Filter by borrow date from (ex. ?borrowed_after=2023-01-01)."
+                ),
+                required=False,
+                type=OpenApiTypes.DATE,
             ),
+            OpenApiParameter(
+                name="borrowed_before",
+                description=(
+                    "Filter by borrow date up to (ex. ?borrowed_before=2023-01-31)."
+                ),
+                required=False,
+                type=OpenApiTypes.DATE,
+            ),
+            OpenApiParameter(
+                name="returned_after",
+                description=(
+                    "Filter by return date from (ex. ?returned_after=2023-01-01)."
+                ),
+                required=False,
+                type=OpenApiTypes.DATE,
+            ),
+            OpenApiParameter(
+                name="returned_before",
+                description=(
+                    "Filter by return date up to (ex. ?returned_before=2023-01-31)."
+                ),
+                required=False,
+                type=OpenApiTypes.DATE,
+            ),
+            *SPARSE_FIELDSET_PARAMETERS,
         ],
     )
     def list(self, request: Request, *args: Any, **kwargs: Any) -> Response:
-        return super().list(self, request, *args, **kwargs)
+        """
+        Renders the page from plain rows instead of BorrowingSerializer,
+        the output is the same.
+        """
+        fields = requested_fields(request, BorrowingSerializer.Meta.fields)
+        rows = borrowing_values(self.filter_queryset(self.get_queryset()), fields)
+        page = self.paginate_queryset(rows)
+        if page is None:
+            return Response(render_borrowings(rows, fields))
+        return self.get_paginated_response(render_borrowings(page, fields))
+
+    @action(methods=["POST"], detail=False, url_path="checkout")
+    def checkout(self, request):
+        """
+        Endpoint for borrowing several books at once.
+        All the borrowings are paid in one Stripe session.
+        """
+        serializer = self.get_serializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        serializer.save()
+
+        return Response(serializer.data, status=status.HTTP_201_CREATED)
+
+    @action(
+        methods=["POST"],
+        detail=False,
+        url_path="bulk-return",
+        permission_classes=(IsAdminUser,),
+    )
+    def bulk_return(self, request):
+        """
+        Endpoint for returning many borrowings at once (for admins).
+        Nothing is returned if any of the borrowings can't be,
+        fines for late returns are created in one go.
+        """
+        serializer = self.get_serializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        serializer.save()
+
+        return Response(serializer.data, status=status.HTTP_200_OK)
 
     @action(
         methods=["POST"],
@@ -106,17 +252,23 @@ class BorrowingViewSet(
         url_path="success",
     )
     def borrowing_is_successfully_paid(self, request, pk=None):
-        """Success endpoint after paying for the borrowing."""
+        """
+        Success endpoint after paying for the borrowing.
+        Payment status is set by the Stripe webhook, Stripe may notify
+        a bit later than the user is redirected here.
+        """
         borrowing = self.get_object()
-        session_id = request.query_params.get("session_id")
-        payment = Payment.objects.get(session_id=session_id)
-        session = stripe.checkout.Session.retrieve(session_id)
-        if session["payment_status"] == "paid":
-            payment.status = "PAID"
-            payment.save()
-            send_notification(f"{payment} was paid.")
+        payment = get_object_or_404(
+            borrowing.payments, session_id=request.query_params.get("session_id")
+        )
+        if payment.status == "PAID":
             serializer = self.get_serializer(borrowing)
             return Response(serializer.data, status=status.HTTP_200_OK)
+        if payment.status == "PENDING":
+            return Response(
+                {"Pending": "Payment is being processed, check it a bit later."},
+                status=status.HTTP_202_ACCEPTED,
+            )
         return Response(
             {"Fail": "Payment wasn't successful."}, status=status.HTTP_400_BAD_REQUEST
         )
@@ -129,27 +281,87 @@ class BorrowingViewSet(
     def borrowing_payment_is_cancelled(self, request, pk=None):
         """Cancel endpoint for borrowing payment."""
         borrowing = self.get_object()
-        session_id = request.query_params.get("session_id")
-        session = stripe.checkout.Session.retrieve(session_id)
+        payment = get_object_or_404(
+            borrowing.payments, session_id=request.query_params.get("session_id")
+        )
         return Response(
             {
                 "Cancel": f"The payment for the {borrowing} is cancelled. "
                 f"Make sure to pay during 24 hours. Payment url: "
-                f"{session.url}. Thanks!"
+                f"{payment.session_url}. Thanks!"
             },
             status=status.HTTP_200_OK,
         )
 
 
+class StripeWebhookView(APIView):
+    """
+    Endpoint for Stripe events about checkout sessions.
+    Events are accepted only with a valid Stripe signature.
+    """
+
+    authentication_classes = ()
+    permission_classes = (AllowAny,)
+
+    @extend_schema(exclude=True)
+    def post(self, request):
+        if not STRIPE_WEBHOOK_SECRET:
+            # Stripe keeps retrying, the events are not lost
+            return Response(
+                {"detail": "Stripe webhook is not configured."},
+                status=status.HTTP_503_SERVICE_UNAVAILABLE,
+            )
+
+        try:
+            event = stripe.Webhook.construct_event(
+                request.body,
+                request.headers.get("Stripe-Signature", ""),
+                STRIPE_WEBHOOK_SECRET,
+            )
+        except (ValueError, stripe.error.SignatureVerificationError):
+            return Response(
+                {"detail": "Invalid Stripe event."},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+
+        session = event["data"]["object"]
+        if event["type"] in PAID_SESSION_EVENTS and session["payment_status"] == "paid":
+            mark_session_paid(session["id"])
+        elif event["type"] == "checkout.session.expired":
+            mark_session_expired(session["id"])
+
+        return Response(status=status.HTTP_200_OK)
+
+
 @extend_schema_view(
     list=extend_schema(
         description=(
             "Endpoint for getting all the payments "
             "(ordinary user will see only his payments, "
             "admin will see all of them)."
-        )
+        ),
+        parameters=[
+            OpenApiParameter(
+                name="status",
+                description="Filter by status (ex. ?status=PENDING).",
+                required=False,
+                type=str,
+                enum=Payment.Status.values,
+            ),
+            OpenApiParameter(
+                name="type",
+                description="Filter by type (ex. ?type=FINE).",
+                required=False,
+                type=str,
+                enum=Payment.Type.values,
+            ),
+            *SPARSE_FIELDSET_PARAMETERS,
+        ],
+    ),
+    retrieve=extend_schema(
+        description="Endpoint for getting a specific payment.",
+        parameters=SPARSE_FIELDSET_PARAMETERS,
     ),
-    retrieve=extend_schema(description="Endpoint for getting a specific payment."),
 )
 class PaymentViewSet(
     mixins.ListModelMixin,
@@ -158,8 +370,9 @@ class PaymentViewSet(
 ):
     queryset = Payment.objects.select_related(
         "borrowing__book", "borrowing__user"
-    ).prefetch_related("borrowing__payments")
+    ).prefetch_related(Prefetch("borrowing__payments", queryset=BORROWING_PAYMENTS))
     permission_classes = (IsAuthenticated,)
+    pagination_class = PaymentCursorPagination
 
     def get_serializer_class(self):
         if self.action == "renew":
@@ -170,11 +383,38 @@ class PaymentViewSet(
     def get_queryset(self):
         queryset = super().get_queryset()
 
+        if self.action == "retrieve":
+            fields = requested_fields(self.request, PaymentSerializer.Meta.fields)
+            if "borrowing" not in fields:
+                queryset = (
+                    queryset.select_related(None)
+                    .prefetch_related(None)
+                    .only("id", *fields)
+                )
+
         if not self.request.user.is_superuser:
             queryset = queryset.filter(borrowing__user=self.request.user)
 
+        if self.action == "list":
+            filters = PaymentFilterSerializer(data=self.request.query_params.dict())
+            filters.is_valid(raise_exception=True)
+            for name, value in filters.validated_data.items():
+                queryset = queryset.filter(**{name: value})
+
         return queryset
 
+    def list(self, request: Request, *args: Any, **kwargs: Any) -> Response:
+        """
+        Renders the page from plain rows instead of PaymentSerializer,
+        the output is the same.
+        """
+        fields = requested_fields(request, PaymentSerializer.Meta.fields)
+        rows = payment_values(self.filter_queryset(self.get_queryset()), fields)
+        page = self.paginate_queryset(rows)
+        if page is None:
+            return Response(render_payments(rows, fields))
+        return self.get_paginated_response(render_payments(page, fields))
+
     @action(
         methods=["POST"],
         detail=True,
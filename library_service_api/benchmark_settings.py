@@ -0,0 +1,15 @@
+# Settings of the load benchmark, ex.
+# DJANGO_SETTINGS_MODULE=library_service_api.benchmark_settings
+# python manage.py run_load_benchmark
+# The benchmarks app is only installed here, and it writes
+# to a database of its own instead of the real one.
+from library_service_api.settings import *  # noqa: F401,F403
+
+INSTALLED_APPS = INSTALLED_APPS + ["benchmarks"]  # noqa: F405
+
+DATABASES = {
+    "default": {
+        **DATABASES["default"],  # noqa: F405
+        "NAME": f"{DATABASES['default']['NAME']}_benchmark",  # noqa: F405
+    }
+}
@@ -46,6 +46,7 @@ INSTALLED_APPS = [
     "django.contrib.sessions",
     "django.contrib.messages",
     "django.contrib.staticfiles",
+    "django.contrib.postgres",
     "rest_framework",
     "rest_framework_simplejwt",
     "debug_toolbar",
@@ -170,9 +171,46 @@ CELERY_RESULT_BACKEND = os.environ["CELERY_RESULT_BACKEND"]
 CELERY_TIMEZONE = "Europe/Kyiv"
 CELERY_TASK_TRACK_STARTED = True
 CELERY_TASK_TIME_LIMIT = 30 * 60
+# Beat copies these into the django_celery_beat tables when it starts
+CELERY_BEAT_SCHEDULE = {
+    "Queue missing payment sessions": {
+        "task": "borrowings.tasks.queue_missing_payment_sessions",
+        "schedule": 10 * 60,
+    },
+    "Deliver notifications": {
+        "task": "borrowings.tasks.deliver_notifications",
+        "schedule": 60,
+    },
+}
+
+REDIS_CACHE_URL = env_custom_value_or_none("REDIS_CACHE_URL")
+
+if REDIS_CACHE_URL:
+    CACHES = {
+        "default": {
+            "BACKEND": "django.core.cache.backends.redis.RedisCache",
+            "LOCATION": REDIS_CACHE_URL,
+        }
+    }
+else:
+    CACHES = {
+        "default": {
+            "BACKEND": "django.core.cache.backends.locmem.LocMemCache",
+        }
+    }
+
+# The local memory cache lives in one process, writes served by another
+# process would never invalidate it, so book payloads are cached only in Redis
+BOOK_CACHE_ENABLED = bool(REDIS_CACHE_URL)
+BOOK_CACHE_TIMEOUT = 15 * 60
 
 STRIPE_PUBLIC_KEY = env_custom_value_or_none("STRIPE_PUBLIC_KEY")
 STRIPE_SECRET_KEY = env_custom_value_or_none("STRIPE_SECRET_KEY")
+STRIPE_WEBHOOK_SECRET = env_custom_value_or_none("STRIPE_WEBHOOK_SECRET")
+
+# Where the API is served (ex. https://library.com),
+# periodic tasks build Stripe redirect urls from it
+SITE_URL = env_custom_value_or_none("SITE_URL")
 
 SPECTACULAR_SETTINGS = {
     "TITLE": "Library Service API",
@@ -0,0 +1,56 @@
+from typing import Iterable, Optional
+
+from drf_spectacular.utils import OpenApiParameter
+from rest_framework.permissions import SAFE_METHODS
+from rest_framework.request import Request
+
+SPARSE_FIELDSET_PARAMETERS = [
+    OpenApiParameter(
+        name="fields",
+        description="Comma separated fields to return (ex. ?fields=id,title).",
+        required=False,
+        type=str,
+    ),
+    OpenApiParameter(
+        name="omit",
+        description="Comma separated fields to leave out (ex. ?omit=payments).",
+        required=False,
+        type=str,
+    ),
+]
+
+
+def requested_fields(request: Optional[Request], available: Iterable[str]) -> set:
+    """
+    Returns top-level fields the client selected with ?fields= and ?omit=
+    (ex. ?fields=id,borrow_date or ?omit=payments).
+    All the fields are returned when nothing is selected.
+    """
+    fields = set(available)
+    if request is None or request.method not in SAFE_METHODS:
+        return fields
+
+    selected = request.query_params.get("fields")
+    if selected:
+        fields &= {name.strip() for name in selected.split(",")}
+
+    omitted = request.query_params.get("omit")
+    if omitted:
+        fields -= {name.strip() for name in omitted.split(",")}
+
+    return fields
+
+
+class SparseFieldsetMixin:
+    """
+    Drops the fields the client did not ask for with ?fields= and ?omit=.
+    Only the serializer the view renders is pruned,
+    nested serializers keep all their fields.
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+
+        keep = requested_fields(self.context.get("request"), self.fields)
+        for field_name in set(self.fields) - keep:
+            self.fields.pop(field_name)
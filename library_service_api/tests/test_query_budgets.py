@@ -0,0 +1,529 @@
+"""
+Query budget of every API endpoint.
+
+Every route of books.urls, borrowings.urls and users.urls is called against
+a small and a large dataset, the number of SQL queries must be the same for
+both. Set API_TIMINGS_FILE to write the timings of the run to a JSON file,
+set API_TIMINGS_BASELINE to a file of an earlier run to print the difference.
+"""
+import json
+import os
+import time
+from datetime import date, timedelta
+from decimal import Decimal
+from importlib import import_module
+from types import SimpleNamespace
+from unittest.mock import patch
+
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.db import connection, transaction
+from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from rest_framework import status
+from rest_framework.test import APIClient
+from rest_framework_simplejwt.tokens import RefreshToken
+
+from books.models import Book
+from borrowings.models import Borrowing, Payment
+from borrowings.fake_stripe import checkout_session_event, sign
+
+URL_MODULES = {
+    "books.urls": "books",
+    "borrowings.urls": "borrowings",
+    "users.urls": "users",
+}
+SMALL_SCALE = 1
+LARGE_SCALE = 25
+PASSWORD = "budget-password"
+WEBHOOK_SECRET = "whsec_budget"
+TODAY = date(2023, 3, 1)
+
+
+def registered_routes() -> set[tuple[str, str]]:
+    """(method, namespaced route name) of every route of the URL modules"""
+    routes = set()
+    for module, namespace in URL_MODULES.items():
+        for pattern in import_module(module).urlpatterns:
+            # Format suffix routes serve the same views
+            if "(?P<format>" in str(pattern.pattern):
+                continue
+            callback = pattern.callback
+            if hasattr(callback, "actions"):
+                # HEAD is added to the actions of GET routes once they are called
+                methods = set(callback.actions) - {"head"}
+            else:
+                methods = [
+                    method
+                    for method in ("get", "post", "put", "patch", "delete")
+                    if hasattr(callback.view_class, method)
+                ]
+            routes |= {
+                (method.upper(), f"{namespace}:{pattern.name}") for method in methods
+            }
+    return routes
+
+
+def seed(scale: int) -> SimpleNamespace:
+    """
+    Creates a dataset growing with the scale: books, other readers
+    and borrowings with payments of every reader.
+    """
+    data = SimpleNamespace()
+    data.admin = get_user_model().objects.create_superuser(
+        "budget_admin@library.com", PASSWORD
+    )
+    data.reader = get_user_model().objects.create_user(
+        "budget_reader@library.com", PASSWORD
+    )
+    others = get_user_model().objects.bulk_create(
+        get_user_model()(email=f"budget_other_{number}@library.com")
+        # Bulk return takes borrowings of two of them
+        for number in range(scale + 1)
+    )
+    books = Book.objects.bulk_create(
+        Book(
+            title=f"Budget book {number}",
+            author="Budget author",
+            cover=Book.Cover.SOFT,
+            inventory=5,
+            daily_fee=Decimal("0.50"),
+        )
+        for number in range(scale + 2)
+    )
+    data.book, data.another_book = books[:2]
+    data.spare_book = Book.objects.create(
+        title="Budget spare book",
+        author="Budget author",
+        cover=Book.Cover.HARD,
+        inventory=1,
+        daily_fee=Decimal("1.00"),
+    )
+
+    borrowings = Borrowing.objects.bulk_create(
+        Borrowing(
+            borrow_date=TODAY - timedelta(days=20),
+            expected_return_date=TODAY - timedelta(days=10),
+            actual_return_date=TODAY - timedelta(days=10) if returned else None,
+            book=books[number % len(books)],
+            user=user,
+        )
+        for user in (data.reader, *others)
+        for number in range(scale)
+        for returned in (True, False)
+    )
+    Payment.objects.bulk_create(
+        Payment(
+            status=Payment.Status.PAID,
+            type=payment_type,
+            borrowing=borrowing,
+            to_pay=Decimal("5.00"),
+        )
+        for borrowing in borrowings
+        for payment_type in (Payment.Type.PAYMENT, Payment.Type.FINE)
+    )
+
+    data.active_borrowing = Borrowing.objects.filter(
+        user=data.reader, actual_return_date__isnull=True
+    ).first()
+    data.others_active_borrowings = [
+        Borrowing.objects.filter(user=user, actual_return_date__isnull=True)
+        .values_list("id", flat=True)
+        .first()
+        for user in others[:2]
+    ]
+    data.paid_payment = Payment.objects.create(
+        status=Payment.Status.PAID,
+        type=Payment.Type.PAYMENT,
+        borrowing=data.active_borrowing,
+        to_pay=Decimal("5.00"),
+        session_id="cs_budget_paid",
+    )
+    # Unpaid payments would keep the reader from borrowing
+    payer_borrowing = Borrowing.objects.create(
+        borrow_date=TODAY - timedelta(days=20),
+        expected_return_date=TODAY - timedelta(days=10),
+        book=data.book,
+        user=get_user_model().objects.create_user("budget_payer@library.com"),
+    )
+    data.pending_payment = Payment.objects.create(
+        status=Payment.Status.PENDING,
+        type=Payment.Type.PAYMENT,
+        borrowing=payer_borrowing,
+        to_pay=Decimal("5.00"),
+        session_id="cs_budget_pending",
+    )
+    data.expired_payment = Payment.objects.create(
+        status=Payment.Status.EXPIRED,
+        type=Payment.Type.PAYMENT,
+        borrowing=payer_borrowing,
+        to_pay=Decimal("5.00"),
+        session_id="cs_budget_expired",
+    )
+    return data
+
+
+def borrowing_url(name, data, suffix=""):
+    return reverse(name, args=[data.active_borrowing.id]) + suffix
+
+
+def webhook_request(data):
+    payload = checkout_session_event("checkout.session.completed", "cs_budget_pending")
+    return {
+        "path": reverse("borrowings:stripe-webhook"),
+        "data": payload,
+        "content_type": "application/json",
+        "HTTP_STRIPE_SIGNATURE": sign(payload, WEBHOOK_SECRET),
+    }
+
+
+# (method, route) -> (user, expected status, request kwargs built from the data)
+ENDPOINTS = {
+    ("GET", "books:api-root"): (
+        None,
+        status.HTTP_200_OK,
+        lambda data: {"path": reverse("books:api-root")},
+    ),
+    ("GET", "books:book-list"): (
+        None,
+        status.HTTP_200_OK,
+        lambda data: {"path": reverse("books:book-list")},
+    ),
+    ("POST", "books:book-list"): (
+        "admin",
+        status.HTTP_201_CREATED,
+        lambda data: {
+            "path": reverse("books:book-list"),
+            "data": {
+                "title": "Budget new book",
+                "author": "Budget author",
+                "cover": "HARD",
+                "inventory": 3,
+                "daily_fee": "0.75",
+            },
+        },
+    ),
+    ("GET", "books:book-detail"): (
+        None,
+        status.HTTP_200_OK,
+        lambda data: {"path": reverse("books:book-detail", args=[data.book.id])},
+    ),
+    ("PUT", "books:book-detail"): (
+        "admin",
+        status.HTTP_200_OK,
+        lambda data: {
+            "path": reverse("books:book-detail", args=[data.book.id]),
+            "data": {
+                "title": "Budget renamed book",
+                "author": "Budget author",
+                "cover": "SOFT",
+                "inventory": 7,
+                "daily_fee": "0.50",
+            },
+        },
+    ),
+    ("PATCH", "books:book-detail"): (
+        "admin",
+        status.HTTP_200_OK,
+        lambda data: {
+            "path": reverse("books:book-detail", args=[data.book.id]),
+            "data": {"inventory": 8},
+        },
+    ),
+    ("DELETE", "books:book-detail"): (
+        "admin",
+        status.HTTP_204_NO_CONTENT,
+        lambda data: {"path": reverse("books:book-detail", args=[data.spare_book.id])},
+    ),
+    ("GET", "books:book-cache-stats"): (
+        "admin",
+        status.HTTP_200_OK,
+        lambda data: {"path": reverse("books:book-cache-stats")},
+    ),
+    ("GET", "books:book-sync"): (
+        None,
+        status.HTTP_200_OK,
+        lambda data: {
+            "path": reverse("books:book-sync"),
+            "data": {"updated_since": "2000-01-01T00:00:00Z"},
+        },
+    ),
+    ("GET", "books:book-export"): (
+        "admin",
+        status.HTTP_200_OK,
+        lambda data: {"path": reverse("books:book-export")},
+    ),
+    ("POST", "books:book-import-books"): (
+        "admin",
+        status.HTTP_200_OK,
+        lambda data: {
+            "path": reverse("books:book-import-books"),
+            "data": (
+                "title,author,cover,inventory,daily_fee\n"
+                "Budget imported book,Budget author,HARD,2,0.50\n"
+                f"{data.book.title},Budget author,SOFT,9,0.50\n"
+            ),
+            "content_type": "text/csv",
+        },
+    ),
+    ("POST", "books:book-adjust-inventory"): (
+        "admin",
+        status.HTTP_200_OK,
+        lambda data: {
+            "path": reverse("books:book-adjust-inventory"),
+            "data": [
+                {"id": data.book.id, "delta": 1},
+                {"id": data.another_book.id, "inventory": 4},
+            ],
+        },
+    ),
+    ("GET", "borrowings:api-root"): (
+        "reader",
+        status.HTTP_200_OK,
+        lambda data: {"path": reverse("borrowings:api-root")},
+    ),
+    ("GET", "borrowings:borrowing-list"): (
+        "reader",
+        status.HTTP_200_OK,
+        lambda data: {"path": reverse("borrowings:borrowing-list")},
+    ),
+    ("POST", "borrowings:borrowing-list"): (
+        "reader",
+        status.HTTP_201_CREATED,
+        lambda data: {
+            "path": reverse("borrowings:borrowing-list"),
+            "data": {
+                "borrow_date": TODAY,
+                "expected_return_date": TODAY + timedelta(days=7),
+                "book": data.book.id,
+            },
+        },
+    ),
+    ("POST", "borrowings:borrowing-checkout"): (
+        "reader",
+        status.HTTP_201_CREATED,
+        lambda data: {
+            "path": reverse("borrowings:borrowing-checkout"),
+            "data": {
+                "borrow_date": TODAY,
+                "expected_return_date": TODAY + timedelta(days=7),
+                "books": [data.book.id, data.another_book.id],
+            },
+        },
+    ),
+    ("POST", "borrowings:borrowing-bulk-return"): (
+        "admin",
+        status.HTTP_200_OK,
+        lambda data: {
+            "path": reverse("borrowings:borrowing-bulk-return"),
+            "data": {
+                "borrowings": data.others_active_borrowings,
+                "actual_return_date": TODAY,
+            },
+        },
+    ),
+    ("GET", "borrowings:borrowing-detail"): (
+        "reader",
+        status.HTTP_200_OK,
+        lambda data: {"path": borrowing_url("borrowings:borrowing-detail", data)},
+    ),
+    ("POST", "borrowings:borrowing-return-book"): (
+        "reader",
+        status.HTTP_200_OK,
+        lambda data: {
+            "path": borrowing_url("borrowings:borrowing-return-book", data),
+            "data": {"actual_return_date": TODAY},
+        },
+    ),
+    ("GET", "borrowings:borrowing-borrowing-is-successfully-paid"): (
+        "reader",
+        status.HTTP_200_OK,
+        lambda data: {
+            "path": borrowing_url(
+                "borrowings:borrowing-borrowing-is-successfully-paid",
+                data,
+                "?session_id=cs_budget_paid",
+            )
+        },
+    ),
+    ("GET", "borrowings:borrowing-borrowing-payment-is-cancelled"): (
+        "reader",
+        status.HTTP_200_OK,
+        lambda data: {
+            "path": borrowing_url(
+                "borrowings:borrowing-borrowing-payment-is-cancelled",
+                data,
+                "?session_id=cs_budget_paid",
+            )
+        },
+    ),
+    ("GET", "borrowings:payment-list"): (
+        "reader",
+        status.HTTP_200_OK,
+        lambda data: {"path": reverse("borrowings:payment-list")},
+    ),
+    ("GET", "borrowings:payment-detail"): (
+        "reader",
+        status.HTTP_200_OK,
+        lambda data: {
+            "path": reverse("borrowings:payment-detail", args=[data.paid_payment.id])
+        },
+    ),
+    ("POST", "borrowings:payment-renew"): (
+        "admin",
+        status.HTTP_200_OK,
+        lambda data: {
+            "path": reverse("borrowings:payment-renew", args=[data.expired_payment.id])
+        },
+    ),
+    ("POST", "borrowings:stripe-webhook"): (None, status.HTTP_200_OK, webhook_request),
+    ("POST", "users:register"): (
+        None,
+        status.HTTP_201_CREATED,
+        lambda data: {
+            "path": reverse("users:register"),
+            "data": {"email": "budget_new@library.com", "password": PASSWORD},
+        },
+    ),
+    ("GET", "users:manage"): (
+        "reader",
+        status.HTTP_200_OK,
+        lambda data: {"path": reverse("users:manage")},
+    ),
+    ("PUT", "users:manage"): (
+        "reader",
+        status.HTTP_200_OK,
+        lambda data: {
+            "path": reverse("users:manage"),
+            "data": {"email": "budget_reader@library.com", "password": PASSWORD},
+        },
+    ),
+    ("PATCH", "users:manage"): (
+        "reader",
+        status.HTTP_200_OK,
+        lambda data: {"path": reverse("users:manage"), "data": {"first_name": "Ann"}},
+    ),
+    ("POST", "users:token_obtain_pair"): (
+        None,
+        status.HTTP_200_OK,
+        lambda data: {
+            "path": reverse("users:token_obtain_pair"),
+            "data": {"email": "budget_reader@library.com", "password": PASSWORD},
+        },
+    ),
+    ("POST", "users:token_refresh"): (
+        None,
+        status.HTTP_200_OK,
+        lambda data: {
+            "path": reverse("users:token_refresh"),
+            "data": {"refresh": str(RefreshToken.for_user(data.reader))},
+        },
+    ),
+}
+
+
+def fake_stripe_session(**kwargs):
+    return {
+        "id": "cs_budget_renewed",
+        "url": "https://checkout.stripe.com/pay/cs_budget_renewed",
+        "expires_at": int(time.time()) + 24 * 60 * 60,
+    }
+
+
+@patch("borrowings.views.STRIPE_WEBHOOK_SECRET", WEBHOOK_SECRET)
+@patch("stripe.checkout.Session.create", side_effect=fake_stripe_session)
+class QueryBudgetTests(TestCase):
+    def test_every_route_has_a_budget(self, _):
+        self.assertEqual(registered_routes(), set(ENDPOINTS))
+
+    def test_query_counts_do_not_grow_with_data(self, _):
+        small = self.measure(SMALL_SCALE)
+        large = self.measure(LARGE_SCALE)
+
+        for endpoint in ENDPOINTS:
+            with self.subTest(endpoint=" ".join(endpoint)):
+                self.assertEqual(large[endpoint]["queries"], small[endpoint]["queries"])
+
+        self.write_timings(small, large)
+
+    def measure(self, scale: int) -> dict:
+        """
+        Calls every endpoint once against a dataset of the scale.
+        Every call is rolled back, so they all see the same data.
+        """
+        results = {}
+        with transaction.atomic():
+            data = seed(scale)
+            for endpoint, (user, expected_status, build) in ENDPOINTS.items():
+                with transaction.atomic():
+                    results[endpoint] = self.call(
+                        endpoint[0], user and getattr(data, user), build(data)
+                    )
+                    transaction.set_rollback(True)
+                self.assertEqual(
+                    results[endpoint]["status"],
+                    expected_status,
+                    f"{' '.join(endpoint)} at scale {scale}",
+                )
+            transaction.set_rollback(True)
+        return results
+
+    @staticmethod
+    def call(method: str, user, kwargs: dict) -> dict:
+        client = APIClient()
+        if user:
+            client.force_authenticate(user)
+        if "content_type" not in kwargs and method != "GET":
+            kwargs["format"] = "json"
+        cache.clear()
+
+        with CaptureQueriesContext(connection) as queries:
+            start = time.perf_counter()
+            response = getattr(client, method.lower())(**kwargs)
+            # Streamed responses run their queries while being read
+            if response.streaming:
+                b"".join(response.streaming_content)
+            elapsed = time.perf_counter() - start
+
+        return {
+            "status": response.status_code,
+            "queries": len(queries),
+            "ms": round(elapsed * 1000, 2),
+        }
+
+    @staticmethod
+    def write_timings(small: dict, large: dict) -> None:
+        timings = {
+            " ".join(endpoint): {
+                "queries": large[endpoint]["queries"],
+                "small_ms": small[endpoint]["ms"],
+                "large_ms": large[endpoint]["ms"],
+            }
+            for endpoint in sorted(ENDPOINTS)
+        }
+
+        baseline_file = os.environ.get("API_TIMINGS_BASELINE")
+        if baseline_file:
+            with open(baseline_file) as file:
+                baseline = json.load(file)["endpoints"]
+            for endpoint, timing in timings.items():
+                if endpoint in baseline:
+                    before = baseline[endpoint]["large_ms"]
+                    print(
+                        f"{endpoint}: {before:.1f} ms -> {timing['large_ms']:.1f} ms, "
+                        f"{baseline[endpoint]['queries']} -> "
+                        f"{timing['queries']} queries"
+                    )
+
+        timings_file = os.environ.get("API_TIMINGS_FILE")
+        if timings_file:
+            with open(timings_file, "w") as file:
+                json.dump(
+                    {
+                        "scales": {"small": SMALL_SCALE, "large": LARGE_SCALE},
+                        "endpoints": timings,
+                    },
+                    file,
+                    indent=2,
+                )
@@ -1,11 +1,25 @@
+from decimal import Decimal
+
 from django.contrib.auth import get_user_model
 from rest_framework import serializers
 
 
 class UserSerializer(serializers.ModelSerializer):
+    unpaid_payments = serializers.SerializerMethodField()
+    outstanding_balance = serializers.SerializerMethodField()
+
     class Meta:
         model = get_user_model()
-        fields = ("id", "email", "first_name", "last_name", "password", "is_staff")
+        fields = (
+            "id",
+            "email",
+            "first_name",
+            "last_name",
+            "password",
+            "is_staff",
+            "unpaid_payments",
+            "outstanding_balance",
+        )
         read_only_fields = ("is_staff",)
         extra_kwargs = {
             "password": {"write_only": True, "min_length": 5},
@@ -26,3 +40,13 @@ class UserSerializer(serializers.ModelSerializer):
             user.save()
 
         return user
+
+    @staticmethod
+    def get_unpaid_payments(user) -> int:
+        balance = getattr(user, "balance", None)
+        return balance.unpaid_payments if balance else 0
+
+    @staticmethod
+    def get_outstanding_balance(user) -> str:
+        balance = getattr(user, "balance", None)
+        return str(balance.outstanding if balance else Decimal("0.00"))
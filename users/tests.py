@@ -1,3 +1,39 @@
+from decimal import Decimal
+
+from django.contrib.auth import get_user_model
 from django.test import TestCase
+from django.urls import reverse
+from rest_framework import status
+from rest_framework.test import APIClient
+
+from borrowings.models import UserBalance
+
+MANAGE_URL = reverse("user:manage")
+
+
+class ManageUserApiTests(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.user = get_user_model().objects.create_user(
+            "authenticated@library.com", "password"
+        )
+        self.client.force_authenticate(self.user)
+
+    def test_user_is_loaded_with_balance_in_one_query(self):
+        UserBalance.objects.create(
+            user=self.user, unpaid_payments=2, outstanding=Decimal("3.50")
+        )
+
+        with self.assertNumQueries(1):
+            response = self.client.get(MANAGE_URL)
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data["unpaid_payments"], 2)
+        self.assertEqual(response.data["outstanding_balance"], "3.50")
+
+    def test_user_without_balance_is_loaded_in_one_query(self):
+        with self.assertNumQueries(1):
+            response = self.client.get(MANAGE_URL)
 
-# Create your tests here.
+        self.assertEqual(response.data["unpaid_payments"], 0)
+        self.assertEqual(response.data["outstanding_balance"], "0.00")
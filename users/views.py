@@ -1,3 +1,4 @@
+from django.contrib.auth import get_user_model
 from drf_spectacular.utils import extend_schema_view, extend_schema
 from rest_framework import generics
 
@@ -24,4 +25,9 @@ class ManageUserView(generics.RetrieveUpdateAPIView):
     serializer_class = UserSerializer
 
     def get_object(self):
-        return self.request.user
+        # Balance of the user is shown too, missing balance is loaded as None
+        return (
+            get_user_model()
+            .objects.select_related("balance")
+            .get(pk=self.request.user.pk)
+        )